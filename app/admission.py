@@ -0,0 +1,232 @@
+"""
+Admission control in front of the model routes.
+
+Every /chat, /stream and /suggestions request first takes a token from its
+client's buckets (429 when empty) and then one of a fixed number of request
+slots per worker. A /suggestions/batch request is charged one more token per
+further unique item once its body is read (see `rate_limited`). When all slots are taken it waits in a bounded queue; a full
+queue or a wait longer than ADMISSION_QUEUE_TIMEOUT is answered with 503. Both
+rejections carry Retry-After and happen before any model call is made, so an
+overloaded pod fails fast instead of queueing into Bedrock throttling.
+"""
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Sequence, Tuple
+
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+
+from app import metrics
+from app.clients.bedrock import BedrockBusyError
+from app.config import settings
+from app.logger.config import update_log_context
+
+ADMITTED_PATHS = ("/chat", "/stream", "/suggestions", "/suggestions/batch")
+# Bedrock error codes that mean "try again later" rather than "bad request"
+OVERLOAD_ERROR_CODES = {"ThrottlingException", "ServiceUnavailableException", "ModelNotReadyException"}
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limit with a bounded FIFO wait queue; a released slot goes to the oldest waiter."""
+
+    def __init__(self, *, max_active: int, max_queue: int, queue_timeout: float):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        if self.active < self.max_active and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise AdmissionRejected("queue_full", settings.admission_retry_after)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(fut)
+            raise AdmissionRejected("queue_timeout", settings.admission_retry_after) from None
+        except asyncio.CancelledError:
+            # the slot may have been handed over just as the client went away
+            if fut.done() and not fut.cancelled():
+                self.release()
+            self._discard(fut)
+            raise
+
+    def _discard(self, fut: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def release(self) -> None:
+        # hand the slot straight to the next waiter, so `active` stays the same
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.active -= 1
+
+
+class RateLimiter:
+    """Token bucket per client key: `rate` tokens per second, up to `burst`. Least recently seen keys are evicted."""
+
+    def __init__(self, *, rate: float, burst: int, max_keys: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, keys: Sequence[str], cost: float = 1.0) -> float:
+        """
+        Take `cost` tokens from the bucket of each of `keys`, or none when any is
+        empty. A cost above one token only needs one token to be allowed and
+        leaves the buckets in debt, so a large batch is paid for by the wait
+        before the next request. Returns 0 when allowed, otherwise seconds until
+        a token is available in every bucket.
+        """
+        now = time.monotonic()
+        levels = {}
+        for key in keys:
+            tokens, updated = self._buckets.pop(key, (float(self.burst), now))
+            levels[key] = min(float(self.burst), tokens + (now - updated) * self.rate)
+        lowest = min(levels.values())
+        if lowest >= 1:
+            levels = {key: tokens - cost for key, tokens in levels.items()}
+            wait = 0.0
+        else:
+            wait = (1 - lowest) / self.rate
+        for key, tokens in levels.items():
+            self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+controller = AdmissionController(
+    max_active=settings.admission_max_concurrent,
+    max_queue=settings.admission_max_queue,
+    queue_timeout=settings.admission_queue_timeout,
+)
+limiter: Optional[RateLimiter] = (
+    RateLimiter(rate=settings.rate_limit_per_minute / 60, burst=settings.rate_limit_burst)
+    if settings.rate_limit_per_minute > 0 else None
+)
+
+
+def client_keys(scope) -> List[str]:
+    """
+    Rate limit keys: the client IP, plus the configured API key header when
+    present. Both buckets must have a token, so rotating header values doesn't
+    get around the limit of the IP sending them.
+    """
+    # set by the logging middleware
+    ip = (scope.get("state") or {}).get("client_ip")
+    if ip is None:
+        ip = scope["client"][0] if scope.get("client") else "unknown"
+    keys = ["ip:" + ip]
+    if settings.rate_limit_key_header:
+        name = settings.rate_limit_key_header.lower().encode()
+        for header, value in scope.get("headers", []):
+            if header == name and value:
+                keys.append("key:" + hashlib.sha256(value).hexdigest()[:16])
+                break
+    return keys
+
+
+def _retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+def _reject(status_code: int, reason: str, retry_after: float) -> ORJSONResponse:
+    metrics.admission_rejections.labels(reason).inc()
+    update_log_context({"admission.rejected": reason})
+    message = "Too many requests" if status_code == 429 else "Server is busy, try again shortly"
+    return ORJSONResponse(
+        {"detail": message, "reason": reason},
+        status_code=status_code,
+        headers={"Retry-After": _retry_after(retry_after)},
+    )
+
+
+class AdmissionMiddleware:
+    """ASGI middleware, so a streamed response keeps its slot until the body is fully sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].rstrip("/") not in ADMITTED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if limiter is not None:
+            wait = limiter.take(client_keys(scope))
+            if wait:
+                await _reject(429, "rate_limited", wait)(scope, receive, send)
+                return
+
+        start = time.perf_counter()
+        try:
+            await controller.acquire()
+        except AdmissionRejected as e:
+            await _reject(503, e.reason, e.retry_after)(scope, receive, send)
+            return
+        update_log_context({"admission.wait_ms": round((time.perf_counter() - start) * 1000, 2)})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release()
+
+
+def rate_limited(scope, cost: float) -> Optional[ORJSONResponse]:
+    """
+    429 for a request that turns out to cost `cost` more tokens than the one it
+    was admitted with (e.g. the further unique items of a batch), else None.
+    """
+    if limiter is None or cost <= 0:
+        return None
+    wait = limiter.take(client_keys(scope), cost)
+    return _reject(429, "rate_limited", wait) if wait else None
+
+
+def overload_retry_after(e: BaseException) -> Optional[float]:
+    """Seconds to suggest in Retry-After when `e` means Bedrock is overloaded, else None."""
+    if isinstance(e, BedrockBusyError):
+        return settings.admission_retry_after
+    if isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") in OVERLOAD_ERROR_CODES:
+        return settings.admission_retry_after
+    return None
+
+
+def overloaded(e: BaseException) -> Optional[HTTPException]:
+    """503 with Retry-After for Bedrock overload errors raised inside a route, else None."""
+    retry_after = overload_retry_after(e)
+    if retry_after is None:
+        return None
+    metrics.admission_rejections.labels("bedrock_overloaded").inc()
+    return HTTPException(
+        status_code=503,
+        detail="The model is busy, try again shortly",
+        headers={"Retry-After": _retry_after(retry_after)},
+    )
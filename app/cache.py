@@ -0,0 +1,146 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import orjson
+
+from app import metrics
+
+
+class AsyncTTLCache:
+    """
+    Bounded in-process cache with per-entry TTL and LRU eviction.
+
+    get_or_load coalesces concurrent misses for the same key: the first caller
+    starts the loader, later callers await the same task, so N identical
+    lookups cost one upstream request. Failed loads are not cached.
+    """
+
+    def __init__(self, name: str, *, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            metrics.cache_lookup(self.name, "hit")
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            metrics.cache_lookup(self.name, "coalesced")
+        else:
+            self.misses += 1
+            metrics.cache_lookup(self.name, "miss")
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._settle(key, t))
+        # shield: one caller going away must not cancel the load for the others
+        return await asyncio.shield(task)
+
+    def _settle(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.set(key, task.result())
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            f"{self.name}.hits": self.hits,
+            f"{self.name}.misses": self.misses,
+            f"{self.name}.coalesced": self.coalesced,
+            f"{self.name}.evictions": self.evictions,
+            f"{self.name}.size": len(self._entries),
+            f"{self.name}.hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+
+
+# ---------- Pluggable key/value backends ----------
+class MemoryBackend:
+    """In-process LRU with TTL. Entries are per worker."""
+
+    def __init__(self, *, maxsize: int, ttl: float):
+        self._cache = AsyncTTLCache("memory", maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Any) -> None:
+        self._cache.set(key, value)
+
+
+class RedisBackend:
+    """
+    Redis-compatible backend shared by all workers. `client` is anything with the
+    redis.asyncio get/set API. A `fakeredis://` URL uses an in-process fakeredis
+    server, for local runs without Redis.
+    """
+
+    def __init__(self, client, *, ttl: float, prefix: str = "swcb:"):
+        self._client = client
+        self._ttl = max(int(ttl), 1)
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, *, ttl: float, prefix: str = "swcb:") -> "RedisBackend":
+        if url.startswith("fakeredis://"):
+            try:
+                import fakeredis
+            except ImportError as e:
+                raise RuntimeError("fakeredis:// URLs need the 'fakeredis' package (pip install fakeredis)") from e
+            return cls(fakeredis.FakeAsyncRedis(), ttl=ttl, prefix=prefix)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("The redis cache backend needs the 'redis' package (pip install redis)") from e
+        return cls(redis.from_url(url), ttl=ttl, prefix=prefix)
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._client.get(self._prefix + key)
+        return orjson.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any) -> None:
+        await self._client.set(self._prefix + key, orjson.dumps(value), ex=self._ttl)
+
+
+def create_backend(kind: str, *, url: str, maxsize: int, ttl: float, prefix: str):
+    """Build a backend from settings: "memory", "redis", or "none" (returns None)."""
+    if kind == "none":
+        return None
+    if kind == "memory":
+        return MemoryBackend(maxsize=maxsize, ttl=ttl)
+    if kind == "redis":
+        return RedisBackend.from_url(url, ttl=ttl, prefix=prefix)
+    raise ValueError(f"Unknown cache backend: {kind}")
@@ -1,8 +1,506 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
 from boto3.session import Session
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from app import metrics, serialization
+from app.clients.resilience import CircuitBreaker, RetryBudget, backoff, classify
 from app.config import settings
+from app.logger.config import increment_log_context
+from app.tracing import current_span
+from app.usage import log_late_usage, record_usage
+
+logger = logging.getLogger(__name__)
+
+
+class BedrockBusyError(Exception):
+    """Raised when no Bedrock slot frees up within the configured queue timeout."""
+
+
+class BedrockUnavailableError(BedrockBusyError):
+    """Raised when every endpoint for a call has an open circuit."""
+
 
-def get_bedrock_client():
-    session = Session()
+def _session() -> Session:
+    # a specific AWS profile allows for local testing in the development environment
     if settings.env == "development":
-        session = Session(profile_name=settings.bedrock_aws_profile)
-    return session.client("bedrock-runtime", region_name=settings.bedrock_aws_region)
+        return Session(profile_name=settings.bedrock_aws_profile)
+    return Session()
+
+
+def get_bedrock_client(region: Optional[str] = None):
+    return _session().client(
+        "bedrock-runtime",
+        region_name=region or settings.bedrock_aws_region,
+        endpoint_url=settings.bedrock_endpoint_url or None,
+        config=Config(
+            # headroom over the call slots (warm() runs outside them), so connections
+            # coming back to a full pool are kept instead of discarded
+            max_pool_connections=settings.bedrock_max_concurrency * 2,
+            connect_timeout=settings.bedrock_connect_timeout,
+            read_timeout=settings.bedrock_read_timeout,
+            # retries, backoff and failover are handled by AsyncBedrockClient
+            retries={"max_attempts": 1, "mode": "standard"},
+        ),
+    )
+
+
+_control_client = None
+
+
+def get_bedrock_control_client():
+    """Shared control-plane ("bedrock") client, for model listing and readiness checks."""
+    global _control_client
+    if _control_client is None:
+        _control_client = _session().client("bedrock", region_name=settings.bedrock_aws_region)
+    return _control_client
+
+
+def _unique(values: Sequence[str]) -> List[str]:
+    return list(dict.fromkeys(v for v in values if v))
+
+
+@dataclass
+class Endpoint:
+    region: str
+    model_id: str
+    breaker: CircuitBreaker
+
+    @property
+    def name(self) -> str:
+        return f"{self.region}/{self.model_id}"
+
+
+@dataclass
+class _OpenStream:
+    """A stream whose first event has arrived; holds a concurrency slot until closed."""
+    endpoint: Endpoint
+    body: Any
+    events: Iterator
+    first: Dict[str, Any]
+    usage: Dict[str, Any] = field(default_factory=dict)
+
+
+class AsyncBedrockClient:
+    """
+    Async facade over the blocking boto3 bedrock-runtime client.
+
+    Calls run on a bounded thread pool so the event loop keeps serving other
+    requests. A semaphore caps in-flight calls (a stream holds its slot until
+    it is fully consumed or closed); callers wait at most `queue_timeout`
+    seconds for a slot before BedrockBusyError is raised.
+
+    Each call walks an endpoint chain: the requested model in the primary and
+    failover regions, then each fallback model the same way. Throttling,
+    unavailability and connection errors move on to the next endpoint at once;
+    once the chain is exhausted the next round starts after a jittered backoff.
+    Extra attempts draw from a shared retry budget, and every endpoint has a
+    circuit breaker so a failing region is skipped instead of retried. A stream
+    whose first event is slower than `bedrock_hedge_after` gets a hedged request
+    on the next endpoint; whichever answers first is used.
+    """
+
+    def __init__(self, client=None, *, max_concurrency: int, queue_timeout: float,
+                 client_factory: Optional[Callable[[str], Any]] = None):
+        # a given client (fakes, benchmarks) serves every region
+        self._client_factory = client_factory or ((lambda region: client) if client is not None else get_bedrock_client)
+        self._clients: Dict[str, Any] = {}
+        self._clients_lock = threading.Lock()
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="bedrock")
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._queue_timeout = queue_timeout
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.waiting = 0
+        self.budget = RetryBudget(
+            ratio=settings.bedrock_retry_budget_ratio,
+            min_per_second=settings.bedrock_retry_budget_min_per_second,
+        )
+        self.regions = _unique([settings.bedrock_aws_region, *settings.bedrock_failover_regions])
+        self._client_for(self.regions[0])
+
+    def _client_for(self, region: str):
+        """boto3 client per region, built on first use (blocking; called from the pool or at startup)."""
+        client = self._clients.get(region)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(region)
+                if client is None:
+                    client = self._clients[region] = self._client_factory(region)
+        return client
+
+    def endpoints(self, model_id: Optional[str] = None, fallback_model_ids: Optional[Sequence[str]] = None) -> List[Endpoint]:
+        model_id = model_id or settings.bedrock_model_id
+        if fallback_model_ids is None:
+            fallback_model_ids = settings.bedrock_failover_model_ids
+        chain = []
+        for model in _unique([model_id, *fallback_model_ids]):
+            for region in self.regions:
+                breaker = self._breakers.get((region, model))
+                if breaker is None:
+                    breaker = self._breakers[(region, model)] = CircuitBreaker(
+                        failure_threshold=settings.bedrock_breaker_failures,
+                        reset_timeout=settings.bedrock_breaker_reset,
+                    )
+                chain.append(Endpoint(region, model, breaker))
+        return chain
+
+    def open_circuits(self) -> List[str]:
+        return [f"{region}/{model}" for (region, model), breaker in self._breakers.items() if breaker.state != "closed"]
+
+    async def _acquire(self) -> None:
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self._queue_timeout)
+        except asyncio.TimeoutError:
+            raise BedrockBusyError(
+                f"No Bedrock slot available within {self._queue_timeout}s "
+                f"({self.max_concurrency} calls in flight)"
+            ) from None
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        metrics.bedrock_in_flight.inc()
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        metrics.bedrock_in_flight.dec()
+        self._slots.release()
+
+    @staticmethod
+    def _observe(operation: str, outcome: str, start: float) -> None:
+        metrics.bedrock_call_duration.labels(operation, outcome).observe(time.perf_counter() - start)
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def _attempt(self, endpoint: Endpoint, fn, *args):
+        """One call on one endpoint; feeds its outcome to the endpoint's circuit breaker."""
+        try:
+            result = await fn(endpoint, *args)
+        except Exception as e:
+            kind = classify(e)
+            if kind is not None:
+                endpoint.breaker.record_failure()
+            elif isinstance(e, ClientError):
+                # the endpoint answered; the request itself was wrong
+                endpoint.breaker.record_success()
+            else:
+                endpoint.breaker.release_trial()
+            outcome = kind or ("busy" if isinstance(e, BedrockBusyError) else "error")
+            metrics.bedrock_attempts.labels(endpoint.region, endpoint.model_id, outcome).inc()
+            raise
+        endpoint.breaker.record_success()
+        metrics.bedrock_attempts.labels(endpoint.region, endpoint.model_id, "ok").inc()
+        return result
+
+    @staticmethod
+    def _pick(endpoints: List[Endpoint], start: int) -> Optional[int]:
+        for i in range(start, len(endpoints)):
+            if endpoints[i].breaker.allow():
+                return i
+        return None
+
+    async def _with_failover(self, endpoints: List[Endpoint], call: Callable[[Endpoint], Awaitable[Any]]):
+        """Run `call` along the endpoint chain until it succeeds or attempts/budget run out."""
+        self.budget.deposit()
+        attempts = 0
+        rounds = 0
+        index = 0
+        last_error: Optional[BaseException] = None
+        while True:
+            picked = self._pick(endpoints, index)
+            if picked is None:
+                if index == 0:
+                    if last_error is not None:
+                        raise last_error
+                    raise BedrockUnavailableError(
+                        "Every Bedrock endpoint has an open circuit: " + ", ".join(e.name for e in endpoints))
+                # end of the chain: start over from the preferred endpoint after a pause
+                await asyncio.sleep(backoff(rounds, base=settings.bedrock_retry_base, cap=settings.bedrock_retry_cap))
+                rounds += 1
+                index = 0
+                continue
+            endpoint = endpoints[picked]
+            if attempts and not self.budget.withdraw():
+                endpoint.breaker.release_trial()
+                raise last_error
+            attempts += 1
+            try:
+                result = await call(endpoint)
+            except Exception as e:
+                kind = classify(e)
+                if kind is None or attempts >= settings.bedrock_max_attempts:
+                    raise
+                last_error = e
+                increment_log_context("bedrock.retries")
+                logger.warning("Bedrock call failed, trying next endpoint", extra={
+                    "bedrock.endpoint": endpoint.name,
+                    "bedrock.error": kind,
+                    "bedrock.attempt": attempts,
+                })
+                index = picked + 1
+                continue
+            if picked:
+                increment_log_context("bedrock.failovers")
+            span = current_span.get()
+            if span is not None:
+                span.attributes.update({"bedrock.endpoint": endpoint.name, "bedrock.attempts": attempts})
+            return result
+
+    async def _invoke_once(self, endpoint: Endpoint, body: bytes) -> Dict[str, Any]:
+        await self._acquire()
+        try:
+            def call() -> Dict[str, Any]:
+                resp = self._client_for(endpoint.region).invoke_model(
+                    modelId=endpoint.model_id,
+                    body=body,
+                    accept="application/json",
+                    contentType="application/json",
+                )
+                return serialization.loads(resp["body"].read())
+
+            future = asyncio.ensure_future(self._run(call))
+            result = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # the pool thread can't be stopped: the call keeps its slot and is
+            # accounted for when it ends
+            future.add_done_callback(lambda f: self._finish_cancelled_invoke(endpoint, f))
+            raise
+        except BaseException:
+            self._release()
+            raise
+        self._release()
+        record_usage(endpoint.model_id, result.get("usage"))
+        return result
+
+    def _finish_cancelled_invoke(self, endpoint: Endpoint, future: asyncio.Future) -> None:
+        """Done-callback for an invoke whose caller was cancelled while the pool thread ran it."""
+        self._release()
+        if future.cancelled() or future.exception() is not None:
+            endpoint.breaker.release_trial()
+            return
+        endpoint.breaker.record_success()
+        log_late_usage(endpoint.model_id, future.result().get("usage"))
+
+    async def invoke(self, payload: Dict[str, Any], *, model_id: Optional[str] = None,
+                     fallback_model_ids: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        endpoints = self.endpoints(model_id, fallback_model_ids)
+        body = serialization.dumps(payload)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await self._with_failover(endpoints, lambda ep: self._attempt(ep, self._invoke_once, body))
+            outcome = "ok"
+        except BedrockBusyError:
+            outcome = "busy"
+            raise
+        finally:
+            self._observe("invoke", outcome, start)
+        return result
+
+    async def _open_stream(self, endpoint: Endpoint, body: bytes) -> _OpenStream:
+        """Start a stream and wait for its first event; the slot stays held on success."""
+        await self._acquire()
+        resp_body = None
+        try:
+            resp = await self._run(
+                self._client_for(endpoint.region).invoke_model_with_response_stream,
+                modelId=endpoint.model_id,
+                body=body,
+                accept="application/json",
+                contentType="application/json",
+            )
+            resp_body = resp.get("body")
+            events = iter(resp_body)
+            while True:
+                event = await self._run(next, events, None)
+                if event is None:
+                    raise RuntimeError("Bedrock stream ended before its first event")
+                if "chunk" in event:
+                    break
+        except BaseException:
+            if resp_body is not None:
+                resp_body.close()
+            self._release()
+            raise
+        opened = _OpenStream(endpoint, resp_body, events, serialization.loads(event["chunk"]["bytes"]))
+        self._track_usage(opened, opened.first)
+        return opened
+
+    @staticmethod
+    def _track_usage(opened: _OpenStream, data: Dict[str, Any]) -> None:
+        if data.get("type") == "message_start":
+            opened.usage.update(data.get("message", {}).get("usage") or {})
+        elif data.get("type") == "message_delta":
+            opened.usage.update(data.get("usage") or {})
+
+    def _close_stream(self, opened: _OpenStream) -> None:
+        opened.body.close()
+        record_usage(opened.endpoint.model_id, opened.usage)
+        self._release()
+
+    def _discard_stream(self, task: asyncio.Future) -> None:
+        """Done-callback for a stream attempt nobody waits for any more (hedge loser, cancelled caller)."""
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._close_stream(task.result())
+
+    async def _open_stream_hedged(self, endpoint: Endpoint, endpoints: List[Endpoint], body: bytes) -> _OpenStream:
+        # attempts run as tasks and are never cancelled: a cancelled await would lose
+        # a stream the pool thread is still opening, and with it the slot it holds
+        primary = asyncio.ensure_future(self._attempt(endpoint, self._open_stream, body))
+        tasks = [primary]
+        try:
+            if settings.bedrock_hedge_after > 0:
+                await asyncio.wait(tasks, timeout=settings.bedrock_hedge_after)
+                if not primary.done():
+                    hedge = self._hedge_endpoint(endpoints, endpoint)
+                    if hedge is not None and self.budget.withdraw():
+                        increment_log_context("bedrock.hedges")
+                        tasks.append(asyncio.ensure_future(self._attempt(hedge, self._open_stream, body)))
+                    elif hedge is not None and hedge is not endpoint:
+                        # picking the hedge may have taken its half-open trial
+                        hedge.breaker.release_trial()
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in tasks if t in done and t.exception() is None), None)
+                if winner is not None:
+                    for task in tasks:
+                        if task is not winner:
+                            task.add_done_callback(self._discard_stream)
+                    if len(tasks) > 1:
+                        metrics.bedrock_hedges.labels("won" if winner is not primary else "lost").inc()
+                    return winner.result()
+            if len(tasks) > 1:
+                metrics.bedrock_hedges.labels("lost").inc()
+                # retrieve the hedge's error so it isn't reported as unhandled
+                tasks[1].exception()
+            raise primary.exception()
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.add_done_callback(self._discard_stream)
+            raise
+
+    def _hedge_endpoint(self, endpoints: List[Endpoint], endpoint: Endpoint) -> Optional[Endpoint]:
+        """The next available endpoint in the chain, or the same one when it is the only one."""
+        start = endpoints.index(endpoint) + 1
+        picked = self._pick(endpoints, start)
+        if picked is not None:
+            return endpoints[picked]
+        return endpoint if len(endpoints) == 1 else None
+
+    async def stream(self, payload: Dict[str, Any], *, model_id: Optional[str] = None,
+                     fallback_model_ids: Optional[Sequence[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield decoded Anthropic stream events (message_start, content_block_delta, ...).
+        Usage from message_start (input/cache tokens) and message_delta (output
+        tokens) is recorded when the stream ends, even if it is closed early.
+        Retries, failover and hedging only happen before the first event; once
+        events have been yielded an error is raised to the caller.
+        """
+        endpoints = self.endpoints(model_id, fallback_model_ids)
+        body = serialization.dumps(payload)
+        start = time.perf_counter()
+        try:
+            opened = await self._with_failover(endpoints, lambda ep: self._open_stream_hedged(ep, endpoints, body))
+        except BedrockBusyError:
+            self._observe("stream", "busy", start)
+            raise
+        except Exception:
+            self._observe("stream", "error", start)
+            raise
+        # "closed": the consumer stopped reading before the end of the stream
+        outcome = "closed"
+        try:
+            data = opened.first
+            while True:
+                if data.get("type") == "message_stop":
+                    outcome = "ok"
+                yield data
+                if outcome == "ok":
+                    break
+                event = await self._run(next, opened.events, None)
+                if event is None:
+                    break
+                if "chunk" not in event:
+                    continue
+                data = serialization.loads(event["chunk"]["bytes"])
+                self._track_usage(opened, data)
+            outcome = "ok"
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self._close_stream(opened)
+            self._observe("stream", outcome, start)
+
+    async def warm(self) -> None:
+        """
+        Open the bedrock-runtime connection (DNS, TLS, request signing) ahead of the
+        first real call. Bedrock rejects an empty body with a ValidationException
+        without invoking the model, so this costs nothing.
+        """
+        try:
+            await self._run(
+                self._client_for(self.regions[0]).invoke_model,
+                modelId=settings.bedrock_model_id,
+                body=b"{}",
+                accept="application/json",
+                contentType="application/json",
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "ValidationException":
+                raise
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_async_client: Optional[AsyncBedrockClient] = None
+
+
+def _new_client() -> AsyncBedrockClient:
+    return AsyncBedrockClient(
+        max_concurrency=settings.bedrock_max_concurrency,
+        queue_timeout=settings.bedrock_queue_timeout,
+    )
+
+
+async def open_async_bedrock() -> AsyncBedrockClient:
+    """
+    Create the application-scoped client. Called from the FastAPI lifespan; building
+    the boto3 client (credentials, endpoint data) blocks, so it runs in a thread.
+    Clients for failover regions are built on first use.
+    """
+    global _async_client
+    if _async_client is None:
+        client = await asyncio.to_thread(_new_client)
+        if _async_client is None:
+            _async_client = client
+    return _async_client
+
+
+def close_async_bedrock() -> None:
+    global _async_client
+    if _async_client is not None:
+        _async_client.shutdown()
+        _async_client = None
+
+
+def get_async_bedrock() -> AsyncBedrockClient:
+    """Shared client; created lazily outside the app lifespan (scripts, benchmarks)."""
+    global _async_client
+    if _async_client is None:
+        _async_client = _new_client()
+    return _async_client
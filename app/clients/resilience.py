@@ -0,0 +1,113 @@
+"""
+Building blocks for the Bedrock invocation policy: error classification, a
+retry budget, jittered backoff and a per-endpoint circuit breaker.
+"""
+import random
+import time
+from typing import Optional
+
+from botocore.exceptions import ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError
+
+# Bedrock error codes worth another attempt, possibly on another endpoint
+THROTTLE_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+UNAVAILABLE_CODES = {"ServiceUnavailableException", "ModelNotReadyException", "InternalServerException",
+                     "ModelTimeoutException", "ModelStreamErrorException"}
+CONNECTION_ERRORS = (EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError, ConnectionClosedError)
+
+
+def classify(e: BaseException) -> Optional[str]:
+    """"throttled", "unavailable" or "connection" for retryable errors, None otherwise."""
+    if isinstance(e, ClientError):
+        code = e.response.get("Error", {}).get("Code")
+        if code in THROTTLE_CODES:
+            return "throttled"
+        if code in UNAVAILABLE_CODES:
+            return "unavailable"
+        return None
+    if isinstance(e, CONNECTION_ERRORS):
+        return "connection"
+    return None
+
+
+def backoff(attempt: int, *, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RetryBudget:
+    """
+    Caps retries and hedges to a share of first attempts, so a Bedrock brown-out
+    doesn't multiply our own traffic. Every first attempt deposits `ratio`
+    tokens; every extra attempt withdraws one. `min_per_second` keeps a trickle
+    of retries available at low traffic.
+    """
+
+    def __init__(self, *, ratio: float, min_per_second: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """
+    Closed until `failure_threshold` consecutive retryable failures, then open for
+    `reset_timeout` seconds (calls skip the endpoint), then half-open: one trial
+    call closes it again on success or re-opens it on failure.
+    """
+
+    def __init__(self, *, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """The trial call ended without a verdict (e.g. a non-retryable error)."""
+        self._trial_in_flight = False
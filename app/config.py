@@ -1,4 +1,5 @@
 import os
+from typing import Dict, List
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -7,6 +8,106 @@ class Settings(BaseSettings):
     bedrock_aws_region: str = "us-east-1"
     bedrock_model_id: str = "anthropic.claude-3-5-sonnet-20240620-v1:0"
     sw_api_base: str = "https://swapi.dev/api/"
+    swapi_http2: bool = True
+    swapi_timeout: float = 10.0
+    swapi_connect_timeout: float = 3.0
+    swapi_max_connections: int = 50
+    swapi_max_keepalive_connections: int = 20
+    swapi_keepalive_expiry: float = 30.0
+    swapi_retries: int = 2
+    swapi_retry_backoff: float = 0.2
+    tool_result_max_results: int = 5
+    tool_result_token_budget: int = 800
+    tool_resolve_max_refs: int = 30  # referenced records fetched per resolveReferences call
+    tool_resolve_token_budget: int = 2000
+    swapi_cache_size: int = 1024
+    swapi_cache_ttl: float = 3600.0
+    swapi_snapshot_path: str = "data/swapi_snapshot.json"
+    swapi_snapshot_refresh_seconds: float = 0  # 0 disables background refresh
     max_tokens: int = 1000
+    # Anthropic prompt caching on Bedrock; only enable for models that support it
+    bedrock_prompt_caching: bool = False
+    # per-model USD prices per 1K tokens, overriding app.usage.DEFAULT_PRICING, e.g.
+    # {"my-model-id": {"input": 0.003, "output": 0.015, "cache_read": 0.0003, "cache_write": 0.00375}}
+    bedrock_pricing: Dict[str, Dict[str, float]] = {}
+    response_cache_backend: str = "memory"  # memory | redis | none
+    response_cache_url: str = "redis://localhost:6379/0"
+    response_cache_size: int = 1024
+    response_cache_ttl: float = 86400.0
+    # conversation transcripts: memory | redis | none (sessions off)
+    session_store_backend: str = "memory"
+    session_store_url: str = "redis://localhost:6379/0"
+    session_max_sessions: int = 10000  # memory backend, per worker
+    session_ttl: float = 3600.0  # seconds since the last turn
+    session_history_max_tokens: int = 6000  # earlier turns sent with each new question
+    session_tool_result_chars: int = 300  # tool results of compacted turns are cut to this
+    # bounds on one /chat or /stream turn: tool rounds before the model must answer,
+    # and seconds until in-flight model calls and tool fetches are cancelled (0 disables)
+    turn_max_tool_rounds: int = 5
+    turn_deadline: float = 90.0
+    # /stream framing: text deltas after the first are merged until this many bytes are
+    # buffered or the oldest has waited the window in seconds (0 sends every delta at once)
+    sse_coalesce_bytes: int = 1024
+    sse_coalesce_window: float = 0.05
+    sse_heartbeat_interval: float = 15.0  # seconds without a write before a ": ping" comment; 0 disables
+    sse_buffer_events: int = 64  # events read ahead of a slow client before Bedrock reads pause
+    # finished streams kept for Last-Event-ID resume: memory | redis | none
+    sse_resume_backend: str = "memory"
+    sse_resume_url: str = "redis://localhost:6379/0"
+    sse_resume_max_streams: int = 1000  # memory backend, per worker
+    sse_resume_ttl: float = 300.0
+    suggestions_category_timeout: float = 3.0
+    suggestions_cache_ttl: float = 86400.0
+    suggestions_batch_concurrency: int = 8  # model calls in flight per /suggestions/batch request
+    # precomputed suggestions (python -m app.suggestions_warm) loaded into the cache at startup
+    suggestions_warm_path: str = "data/suggestions_warm.json"
+    # prompts/completions in logs: off | sampled | truncated | hashed
+    log_payloads: str = "off"
+    log_payload_sample_rate: float = 0.01  # share of calls logged in full when sampled
+    log_payload_max_chars: int = 1000  # per payload when truncated
+    # format and write logs on a background thread instead of the request path
+    log_queue: bool = True
+    log_queue_size: int = 10000
+    # finished request traces: none | file (OTLP/JSON lines) | otlp (OTLP/HTTP collector)
+    trace_export: str = "none"
+    trace_export_path: str = "traces.jsonl"
+    trace_otlp_endpoint: str = "http://localhost:4318"
+    bedrock_max_concurrency: int = 16
+    bedrock_queue_timeout: float = 10.0
+    bedrock_endpoint_url: str = ""  # e.g. a local fake Bedrock; empty uses AWS
+    bedrock_connect_timeout: float = 5.0
+    bedrock_read_timeout: float = 60.0
+    # failover order: the model in every region, then the next model in every region
+    bedrock_failover_regions: List[str] = []
+    bedrock_failover_model_ids: List[str] = []
+    suggestions_model_id: str = ""  # empty uses bedrock_model_id
+    suggestions_failover_model_ids: List[str] = []
+    bedrock_max_attempts: int = 3  # per model call, across endpoints
+    bedrock_retry_base: float = 0.25  # full-jitter exponential backoff between rounds
+    bedrock_retry_cap: float = 4.0
+    bedrock_retry_budget_ratio: float = 0.2  # extra attempts (retries, hedges) per first attempt
+    bedrock_retry_budget_min_per_second: float = 1.0
+    bedrock_hedge_after: float = 0  # seconds to wait for a stream's first event before hedging; 0 disables
+    bedrock_breaker_failures: int = 5  # consecutive failures that open an endpoint's circuit
+    bedrock_breaker_reset: float = 30.0  # seconds an open circuit waits before a trial call
+    # admission control for /chat, /stream and /suggestions, per worker
+    admission_max_concurrent: int = 32
+    admission_max_queue: int = 64
+    admission_queue_timeout: float = 5.0
+    admission_retry_after: float = 1.0  # Retry-After on 503s
+    # per client IP; 0 disables. Behind a proxy, the IP is the proxy's unless uvicorn
+    # trusts its X-Forwarded-For (FORWARDED_ALLOW_IPS), so enable only once that is set
+    rate_limit_per_minute: float = 0
+    rate_limit_burst: int = 20
+    rate_limit_key_header: str = ""  # e.g. "X-API-Key", limited in addition to the client IP
+    # readiness: dependency checks run at startup and then every interval seconds;
+    # they gate readiness until they first pass, later failures are only reported
+    readiness_check_interval: float = 30.0
+    readiness_check_timeout: float = 5.0
+    # also check the model with bedrock:GetFoundationModel (an extra IAM permission)
+    readiness_bedrock_check: bool = False
+    # not ready while more callers than this wait for a Bedrock slot / SWAPI connection
+    readiness_max_bedrock_waiting: int = 16
+    readiness_max_swapi_queued: int = 50
 
 settings = Settings()
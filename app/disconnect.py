@@ -0,0 +1,46 @@
+"""
+Stop work for clients that have gone away.
+
+/stream needs nothing extra: Starlette cancels a StreamingResponse's body
+iterator as soon as the server reports the disconnect, which closes the
+Bedrock stream and cancels tool fetches (see app.llm.core.run_turn). A plain
+response is only sent when its handler returns, so /chat awaits its turn
+through `cancel_on_disconnect` instead of paying for an answer nobody reads.
+"""
+import asyncio
+from typing import Awaitable, TypeVar
+
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+
+class ClientDisconnected(Exception):
+    """The client disconnected before the response was ready."""
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # the body has been read by now, so the next message is the disconnect
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """
+    Await `work`; if the client disconnects first, cancel it, wait for its
+    cleanup and raise ClientDisconnected.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if task in done:
+        return task.result()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    raise ClientDisconnected()
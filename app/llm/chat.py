@@ -1,30 +1,55 @@
-TOOLS = [
-    {
-        "name": "getPeople",
-        "description": "Gets information about People in the Star Wars world",
+import hashlib
+import json
+
+def _search_tool(name: str, resource: str, label: str, field: str) -> dict:
+    return {
+        "name": name,
+        "description": f"Gets information about {label} in the Star Wars world",
         "input_schema": {
             "type": "object",
             "properties": {
-                "people": {
+                resource: {
                     "type": "string",
-                    "description": "The people name"
+                    "description": f"The {field}"
                 }
             },
-            "required": ["people"]
+            "required": [resource]
         }
-    },
+    }
+
+TOOLS = [
+    _search_tool("getPeople", "people", "People", "people name"),
+    _search_tool("getPlanets", "planets", "Planets", "planet name"),
+    _search_tool("getFilms", "films", "Films", "film title"),
+    _search_tool("getSpecies", "species", "Species", "species name"),
+    _search_tool("getVehicles", "vehicles", "Vehicles", "vehicle name or model"),
+    _search_tool("getStarships", "starships", "Starships", "starship name or model"),
     {
-        "name": "getStarships",
-        "description": "Gets information about Starships in the Star Wars world",
+        "name": "resolveReferences",
+        "description": (
+            "Gets one record of the Star Wars world together with the records it refers to, in a single call: "
+            "e.g. a person's homeworld, species, films, vehicles and starships, or a film's characters and planets. "
+            "Use it instead of several lookups when the answer needs related records."
+        ),
         "input_schema": {
             "type": "object",
             "properties": {
-                "starships": {
+                "resource": {
                     "type": "string",
-                    "description": "The starship name"
+                    "enum": ["people", "planets", "films", "species", "vehicles", "starships"],
+                    "description": "The kind of record to look up"
+                },
+                "name": {
+                    "type": "string",
+                    "description": "The record's name (the title, for films)"
+                },
+                "fields": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Which references to expand, e.g. [\"homeworld\", \"starships\"]; all of them when omitted"
                 }
             },
-            "required": ["starships"]
+            "required": ["resource", "name"]
         }
     }
 ]
@@ -38,4 +63,8 @@ SYSTEM_PROMPT = (
     "If the information isn't detailed enough to answer confidently, say so casually (e.g., 'Hard to say for sure' or 'Doesn't look like that I know'). "
     "If something can't be answered — even with tools — guide the user to the correct section, like the people profile tab, to find it themselves. Always refer to it as 'inside the app'. "
     "Keep responses brief (no longer than 200 words), focused, and human. You are not a chatbot or assistant. Just a well-informed fan enjoying the conversation."
-)
\ No newline at end of file
+)
+
+# Changes whenever the prompt or tool definitions change, so cached answers
+# produced under an older prompt are never served.
+PROMPT_VERSION = hashlib.sha256(json.dumps([SYSTEM_PROMPT, TOOLS], sort_keys=True).encode()).hexdigest()[:12]
@@ -1,16 +1,23 @@
 from __future__ import annotations
-import json
 import asyncio
-from typing import Dict, Any, List, Tuple
+import logging
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Any, List, Tuple
 
 import httpx
 
-from app.clients.bedrock import get_bedrock_client
+from app import metrics, serialization
+from app.clients.bedrock import get_async_bedrock
 from app.config import settings
 from app.llm.chat import SYSTEM_PROMPT, TOOLS
+from app.logger.config import log_payload, update_log_context
 from app.tools import swapi
+from app.tracing import span
+from app.usage import log_request_usage
+from app.utils import estimate_tokens
 
-bedrock = get_bedrock_client()
+logger = logging.getLogger(__name__)
 MODEL_ID = settings.bedrock_model_id
 
 # ---------- Message helpers (content blocks) ----------
@@ -27,22 +34,94 @@ def find_tool_uses(resp_json: Dict[str, Any]) -> List[Dict[str, Any]]:
     return [b for b in resp_json.get("content", []) if b.get("type") == "tool_use"]
 
 # ---------- Bedrock wrappers ----------
-def bedrock_invoke(payload: Dict[str, Any]) -> Dict[str, Any]:
-    resp = bedrock.invoke_model(
-        modelId=MODEL_ID,
-        body=json.dumps(payload),
-        accept="application/json",
-        contentType="application/json",
-    )
-    return json.loads(resp["body"].read().decode("utf-8"))
+async def bedrock_invoke(payload: Dict[str, Any]) -> Dict[str, Any]:
+    with span("bedrock.invoke", model_id=MODEL_ID):
+        return await get_async_bedrock().invoke(payload, model_id=MODEL_ID)
+
+async def bedrock_stream_message(payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream one model call. Yields {"type": "text", "text": ...} for each text delta,
+    {"type": "tool_use_block", "block": ...} as soon as a tool_use block's input JSON
+    is complete, and finally {"type": "message", "message": ...} with the assembled
+    assistant message (same shape as a non-stream invoke_model result).
+    """
+    message: Dict[str, Any] = {"content": []}
+    blocks: Dict[int, Dict[str, Any]] = {}
+    partial_json: Dict[int, List[str]] = {}
+
+    with span("bedrock.stream", model_id=MODEL_ID) as stream_span:
+        # aclosing: breaking out early must still release the Bedrock slot right away
+        async with aclosing(get_async_bedrock().stream(payload, model_id=MODEL_ID)) as events:
+            async for data in events:
+                kind = data.get("type")
+                if kind == "message_start":
+                    message = {**data.get("message", {}), "content": []}
+                elif kind == "content_block_start":
+                    if stream_span is not None and not blocks:
+                        stream_span.attributes["ttft_ms"] = round(stream_span.duration_ms, 2)
+                    blocks[data["index"]] = dict(data.get("content_block", {}))
+                elif kind == "content_block_delta":
+                    delta = data.get("delta", {})
+                    block = blocks.setdefault(data["index"], {"type": "text", "text": ""})
+                    if delta.get("type") == "text_delta":
+                        text = delta.get("text", "")
+                        block["text"] = block.get("text", "") + text
+                        yield {"type": "text", "text": text}
+                    elif delta.get("type") == "input_json_delta":
+                        partial_json.setdefault(data["index"], []).append(delta.get("partial_json", ""))
+                elif kind == "content_block_stop":
+                    block = blocks.get(data["index"], {})
+                    if block.get("type") == "tool_use":
+                        raw = "".join(partial_json.pop(data["index"], []))
+                        block["input"] = serialization.loads(raw) if raw else {}
+                        yield {"type": "tool_use_block", "block": block}
+                elif kind == "message_delta":
+                    message.update(data.get("delta", {}))
+                    message.setdefault("usage", {}).update(data.get("usage", {}))
+                elif kind == "message_stop":
+                    break
+
+    # empty text blocks are rejected when the message is sent back as transcript
+    message["content"] = [
+        blocks[i] for i in sorted(blocks)
+        if not (blocks[i].get("type") == "text" and not blocks[i].get("text"))
+    ]
+    yield {"type": "message", "message": message}
 
 def build_messages_from_user(user_input: str) -> List[Dict[str, Any]]:
     return [user_text(user_input)]
 
+CACHE_POINT = {"type": "ephemeral"}
+
+def system_prompt(text: str) -> str | List[Dict[str, Any]]:
+    """
+    System prompt, as a cache breakpoint when prompt caching is enabled. Tools come
+    before the system prompt in the cached prefix, so this one breakpoint covers both.
+    """
+    if not settings.bedrock_prompt_caching:
+        return text
+    return [{"type": "text", "text": text, "cache_control": CACHE_POINT}]
+
+def _with_transcript_cache_point(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Copy of messages with a cache breakpoint on the last block, so the next tool
+    round reads the transcript so far from the prompt cache. The caller's
+    messages are not modified.
+    """
+    last = messages[-1]
+    content = last.get("content")
+    if not isinstance(content, list) or not content:
+        return messages
+    marked = {**last, "content": [*content[:-1], {**content[-1], "cache_control": CACHE_POINT}]}
+    return [*messages[:-1], marked]
+
 def build_payload(messages: List[Dict[str, Any]], *, max_tokens: int | None = None) -> Dict[str, Any]:
+    # a lone user question is not worth a cache write; transcripts with tool rounds are
+    if settings.bedrock_prompt_caching and len(messages) > 1:
+        messages = _with_transcript_cache_point(messages)
     return {
         "anthropic_version": "bedrock-2023-05-31",
-        "system": SYSTEM_PROMPT,
+        "system": system_prompt(SYSTEM_PROMPT),
         "tools": TOOLS,
         "messages": messages,
         "max_tokens": max_tokens or settings.max_tokens,
@@ -50,52 +129,249 @@ def build_payload(messages: List[Dict[str, Any]], *, max_tokens: int | None = No
     }
 
 # ---------- Tool resolution (async) ----------
-async def _run_tools_once(tool_uses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Run one batch of tool_uses concurrently and return tool_result blocks."""
+async def _run_tool(
+    tu: Dict[str, Any],
+    client: httpx.AsyncClient,
+    sizes: List[Tuple[int, int]] | None = None,
+) -> Dict[str, Any]:
+    """
+    Run a single tool_use block and return its tool_result block with compacted
+    content. Appends (raw tokens, compacted tokens) to `sizes` when given.
+    """
+    res_obj = await swapi.run_tool(tu.get("name"), tu.get("input", {}), base_url=settings.sw_api_base, client=client)
+    content = swapi.compact_tool_result(res_obj)
+    if sizes is not None:
+        raw = res_obj if isinstance(res_obj, str) else serialization.dumps_str(res_obj)
+        sizes.append((estimate_tokens(raw), estimate_tokens(content)))
+    block = {
+        "type": "tool_result",
+        "tool_use_id": tu["id"],
+        "content": content,
+    }
+    # unknown tools, bad input and SWAPI outages come back as {"error": ...}
+    if isinstance(res_obj, dict) and "error" in res_obj:
+        block["is_error"] = True
+    return block
+
+async def _run_tools_once(
+    tool_uses: List[Dict[str, Any]],
+    client: httpx.AsyncClient,
+    started: Dict[str, asyncio.Task] | None = None,
+    sizes: List[Tuple[int, int]] | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Run one batch of tool_uses concurrently and return tool_result blocks.
+    Fetches already started while the model was streaming (`started`, keyed by
+    tool_use id) are awaited instead of being run again.
+    """
     if not tool_uses:
         return []
-    results: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        async def one(tu: Dict[str, Any]) -> Dict[str, Any]:
-            name = tu.get("name")
-            args = tu.get("input", {})
-            res_obj = await swapi.run_tool(name, args, base_url=settings.sw_api_base, client=client)
-            return {
-                "type": "tool_result",
-                "tool_use_id": tu["id"],
-                "content": json.dumps(res_obj) if not isinstance(res_obj, str) else res_obj,
-            }
-        results = await asyncio.gather(*(one(tu) for tu in tool_uses))
-    return results
-
-def resolve_tools_sync(messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, Any]]:
+    started = started if started is not None else {}
+    with span("tools.round", tools=len(tool_uses), prefetched=sum(tu["id"] in started for tu in tool_uses)):
+        return list(await asyncio.gather(*(
+            started.pop(tu["id"], None) or _run_tool(tu, client, sizes) for tu in tool_uses
+        )))
+
+# ---------- Conversation turn (orchestration engine) ----------
+NO_ANSWER = "Unable to give an answer"
+
+class TurnDeadlineExceeded(Exception):
+    """Raised when a turn runs past its deadline; its model call and tool fetches are cancelled."""
+
+# tool_result for tool_uses past the round limit, so the model answers with what it has
+TOOL_ROUNDS_EXHAUSTED = (
+    "Not run: the limit of tool lookups for this question is reached. "
+    "Answer with the information gathered so far."
+)
+
+def turn_deadline() -> float | None:
+    """Event loop time by which a turn starting now must finish (None when TURN_DEADLINE is 0)."""
+    if settings.turn_deadline <= 0:
+        return None
+    return asyncio.get_running_loop().time() + settings.turn_deadline
+
+@dataclass
+class TurnResult:
+    messages: List[Dict[str, Any]]
+    tools_used: List[str] = field(default_factory=list)
+    result: Dict[str, Any] = field(default_factory=dict)
+    model_calls: int = 0
+    # per tool round: (raw result tokens, compacted tokens actually sent)
+    tool_result_tokens: List[Tuple[int, int]] = field(default_factory=list)
+    # "answered", or "max_rounds" when the model was made to answer without more tools
+    stop_reason: str = "answered"
+    tool_errors: int = 0  # tool_results sent back with is_error
+
+    @property
+    def text(self) -> str | None:
+        texts = [c.get("text", "") for c in self.result.get("content", []) if c.get("type") == "text"]
+        return "".join(texts) or None
+
+    @property
+    def cacheable(self) -> bool:
+        """A complete answer: not cut off by the round limit and built without failed tool calls."""
+        return self.stop_reason == "answered" and not self.tool_errors and bool(self.text)
+
+    @property
+    def input_tokens_saved(self) -> int:
+        """
+        Estimated input tokens saved by compaction: round i's results are re-sent
+        with each of the (model_calls - 1 - i) later calls of the turn.
+        """
+        return sum(
+            (raw - sent) * (self.model_calls - 1 - i)
+            for i, (raw, sent) in enumerate(self.tool_result_tokens)
+        )
+
+def _record_stop(turn: TurnResult, reason: str, cancelled: Dict[str, int]) -> None:
+    """Count a turn cut short and the model calls / tool fetches that were not (or no longer) run."""
+    metrics.turn_stops.labels(reason).inc()
+    fields: Dict[str, Any] = {"turn.stop_reason": reason}
+    for kind, count in cancelled.items():
+        if count:
+            metrics.turn_cancelled_work.labels(kind, reason).inc(count)
+            fields[f"turn.cancelled_{kind}s"] = count
+    update_log_context(fields)
+    logger.warning("Conversation turn stopped early", extra={
+        **fields,
+        "bedrock.model_calls": turn.model_calls,
+        "tools.names": turn.tools_used,
+    })
+
+async def run_turn(
+    messages: List[Dict[str, Any]],
+    *,
+    stream: bool = False,
+    deadline: float | None = None,
+    max_tool_rounds: int | None = None,
+) -> AsyncIterator[Dict[str, Any]]:
     """
-    Resolve all tool calls (possibly multiple rounds) synchronously (for /chat or before streaming).
-    Returns: (updated_messages, tools_used, last_nonstream_result)
+    Drive one conversation turn: call the model, run any requested tools, feed the
+    results back, and stop at the first response without tool_use. That response is
+    the answer, so each turn costs (tool rounds + 1) model calls.
+
+    The turn is bounded. After `max_tool_rounds` (TURN_MAX_TOOL_ROUNDS) rounds,
+    further tool_uses are answered with a "not run" result and the model gets one
+    last call to answer; if it still asks for tools, its text so far is the answer.
+    Each model call and tool round is awaited under `deadline` (event loop time,
+    TURN_DEADLINE from now by default): past it the in-flight call or fetches are
+    cancelled and TurnDeadlineExceeded is raised. Cancelling the consumer (client
+    disconnect) or closing the generator likewise cancels whatever is in flight.
+
+    Yields events:
+      {"type": "text", "text": ...}            text deltas (stream=True only)
+      {"type": "tool_use", "names": [...]}     after each tool round, cumulative names
+      {"type": "done", "turn": TurnResult}     always last
     """
-    tools_used: List[str] = []
-    # initial non-stream request
-    payload = build_payload(messages)
-    result = bedrock_invoke(payload)
-
-    while True:
-        tool_uses = find_tool_uses(result)
-        if not tool_uses:
-            # no more tools; return
-            return messages, tools_used, result
-
-        # record names for telemetry/UX
-        tools_used.extend([tu.get("name") for tu in tool_uses if tu.get("name")])
-
-        # run tools (async) inside sync flow
-        tool_result_blocks = asyncio.run(_run_tools_once(tool_uses))
-
-        # extend transcript: assistant (with tool_use blocks) + user (tool_result blocks)
-        messages.extend([
-            assistant_blocks(result.get("content", [])),
-            user_tool_results(tool_result_blocks),
-        ])
-
-        # ask again
-        payload = build_payload(messages)
-        result = bedrock_invoke(payload)
\ No newline at end of file
+    turn = TurnResult(messages=messages)
+    if max_tool_rounds is None:
+        max_tool_rounds = settings.turn_max_tool_rounds
+    if deadline is None:
+        deadline = turn_deadline()
+
+    client = swapi.get_client()
+    # what is running right now, counted as cancelled work if the turn is cut short
+    in_flight: Dict[str, int] = {}
+    try:
+        while True:
+            payload = build_payload(turn.messages)
+            turn.model_calls += 1
+            # tool fetches started while the model is still streaming, keyed by tool_use id
+            started: Dict[str, asyncio.Task] = {}
+            sizes: List[Tuple[int, int]] = []
+            try:
+                # a cancelled stream stops generating; a cancelled invoke_model runs to the
+                # end on its pool thread, so it is not counted as work avoided
+                in_flight = {"model_call": 1} if stream else {}
+                if stream:
+                    async with aclosing(bedrock_stream_message(payload)) as events:
+                        while True:
+                            # the deadline covers each wait for the model, not the consumer's time
+                            async with asyncio.timeout_at(deadline):
+                                event = await anext(events, None)
+                            if event is None:
+                                break
+                            if event["type"] == "message":
+                                turn.result = event["message"]
+                            elif event["type"] == "tool_use_block":
+                                # start the fetch now; the model may still be writing later blocks
+                                block = event["block"]
+                                started[block["id"]] = asyncio.create_task(_run_tool(block, client, sizes))
+                            else:
+                                yield event
+                else:
+                    async with asyncio.timeout_at(deadline):
+                        turn.result = await bedrock_invoke(payload)
+                in_flight = {}
+
+                tool_uses = find_tool_uses(turn.result)
+                if not tool_uses or turn.stop_reason == "max_rounds":
+                    break
+
+                if turn.model_calls > max_tool_rounds:
+                    turn.stop_reason = "max_rounds"
+                    _record_stop(turn, "max_rounds", {"tool_call": len(tool_uses)})
+                    tool_result_blocks = [
+                        {"type": "tool_result", "tool_use_id": tu["id"], "content": TOOL_ROUNDS_EXHAUSTED, "is_error": True}
+                        for tu in tool_uses
+                    ]
+                else:
+                    # record names for telemetry/UX
+                    turn.tools_used.extend([tu.get("name") for tu in tool_uses if tu.get("name")])
+                    in_flight = {"tool_call": len(tool_uses)}
+                    async with asyncio.timeout_at(deadline):
+                        tool_result_blocks = await _run_tools_once(tool_uses, client, started, sizes)
+                    in_flight = {}
+            finally:
+                for task in started.values():
+                    if not task.done():
+                        task.cancel()
+                        in_flight["tool_call"] = in_flight.get("tool_call", 0) + 1
+
+            turn.tool_result_tokens.append((sum(r for r, _ in sizes), sum(c for _, c in sizes)))
+            turn.tool_errors += sum(1 for b in tool_result_blocks if b.get("is_error"))
+
+            # extend transcript: assistant (with tool_use blocks) + user (tool_result blocks)
+            turn.messages.extend([
+                assistant_blocks(turn.result.get("content", [])),
+                user_tool_results(tool_result_blocks),
+            ])
+            yield {"type": "tool_use", "names": list(turn.tools_used)}
+    except TimeoutError:
+        if deadline is None or asyncio.get_running_loop().time() < deadline:
+            raise
+        _record_stop(turn, "deadline", in_flight)
+        log_request_usage("stream" if stream else "chat")
+        raise TurnDeadlineExceeded(
+            f"The answer took longer than {settings.turn_deadline:g}s and was stopped"
+        ) from None
+    except (asyncio.CancelledError, GeneratorExit):
+        _record_stop(turn, "cancelled", in_flight)
+        log_request_usage("stream" if stream else "chat")
+        raise
+
+    update_log_context({
+        "bedrock.model_calls": turn.model_calls,
+        "bedrock.input_tokens_saved": turn.input_tokens_saved,
+        "turn.stop_reason": turn.stop_reason,
+    })
+    logger.info("Conversation turn completed", extra={
+        "bedrock.model_calls": turn.model_calls,
+        "bedrock.tool_rounds": turn.model_calls - 1,
+        "tools.names": turn.tools_used,
+        "tools.result_tokens_raw": sum(r for r, _ in turn.tool_result_tokens),
+        "tools.result_tokens_sent": sum(c for _, c in turn.tool_result_tokens),
+        "bedrock.input_tokens_saved": turn.input_tokens_saved,
+        "turn.stop_reason": turn.stop_reason,
+        "tools.errors": turn.tool_errors,
+    })
+    log_request_usage("stream" if stream else "chat")
+    log_payload("stream" if stream else "chat", turn.messages, turn.text)
+    yield {"type": "done", "turn": turn}
+
+async def complete_turn(messages: List[Dict[str, Any]]) -> TurnResult:
+    """Non-streaming variant of run_turn for callers that only need the final answer."""
+    async for event in run_turn(messages):
+        if event["type"] == "done":
+            return event["turn"]
+    raise RuntimeError("conversation turn ended without a result")
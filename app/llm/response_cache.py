@@ -0,0 +1,127 @@
+"""
+Full-answer cache in front of /chat and /stream.
+
+Fan traffic is dominated by a handful of repeated questions, so finished turns
+are cached by normalized user input, model id and prompt version. A hit costs
+zero Bedrock calls; the cost of producing the answer is recorded when it is
+cached and logged as saved on every hit.
+"""
+import hashlib
+import logging
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+from app import metrics, serialization
+from app.cache import create_backend
+from app.config import settings
+from app.llm.chat import PROMPT_VERSION
+from app.usage import request_usage
+from app.utils import get_bedrock_usage
+
+logger = logging.getLogger(__name__)
+
+_SPACES = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s?!.]+$")
+REPLAY_CHUNK_CHARS = 64
+USAGE_FIELDS = (
+    "bedrock.tokens_input",
+    "bedrock.tokens_output",
+    "bedrock.total_tokens",
+    "bedrock.estimated_cost",
+    "bedrock.estimated_input_cost",
+    "bedrock.estimated_output_cost",
+)
+
+
+def normalize(user_input: str) -> str:
+    return _TRAILING_PUNCT.sub("", _SPACES.sub(" ", user_input.strip().lower()))
+
+
+def cache_key(user_input: str, model_id: str) -> str:
+    raw = f"{model_id}|{PROMPT_VERSION}|{normalize(user_input)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def replay_chunks(text: str) -> Iterator[str]:
+    """Split a cached answer into a few stream-sized deltas."""
+    for i in range(0, len(text), REPLAY_CHUNK_CHARS):
+        yield text[i:i + REPLAY_CHUNK_CHARS]
+
+
+class ResponseCache:
+    def __init__(self, backend, *, model_id: str):
+        self.backend = backend
+        self.model_id = model_id
+        self.hits = 0
+        self.misses = 0
+        self.saved_cost = 0.0
+
+    async def get(self, user_input: str) -> Optional[Dict[str, Any]]:
+        if self.backend is None:
+            return None
+        try:
+            entry = await self.backend.get(cache_key(user_input, self.model_id))
+        except Exception:
+            logger.exception("Response cache lookup failed")
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            metrics.cache_lookup("response", "miss")
+            return None
+
+        self.hits += 1
+        metrics.cache_lookup("response", "hit")
+        self.saved_cost += entry["usage"].get("bedrock.estimated_cost", 0.0)
+        logger.info("Response cache hit", extra={
+            **entry["usage"],
+            "bedrock.model_id": self.model_id,
+            "bedrock.call_type": "response_cache_hit",
+            "response_cache.hit_ratio": round(self.hits / (self.hits + self.misses), 4),
+            "response_cache.saved_cost_total": round(self.saved_cost, 6),
+            "response_cache.saved_model_calls": entry["model_calls"],
+        })
+        return entry
+
+    async def put(self, user_input: str, *, text: str, tools_used: List[str],
+                  messages: List[Dict[str, Any]], model_calls: int) -> None:
+        if self.backend is None or not text:
+            return
+        # what producing this answer cost: the request's measured usage when available
+        current = request_usage.get()
+        if current is not None and current.by_model:
+            usage = current.log_fields("response_cache_fill")
+        else:
+            usage = get_bedrock_usage(
+                model_id=self.model_id,
+                input_text=serialization.dumps_str(messages),
+                output_text=text,
+                call_type="response_cache_fill",
+            )
+        entry = {
+            "text": text,
+            "tools_used": tools_used,
+            "model_calls": model_calls,
+            "usage": {k: usage[k] for k in USAGE_FIELDS},
+        }
+        try:
+            await self.backend.set(cache_key(user_input, self.model_id), entry)
+        except Exception:
+            logger.exception("Response cache write failed")
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        backend = create_backend(
+            settings.response_cache_backend,
+            url=settings.response_cache_url,
+            maxsize=settings.response_cache_size,
+            ttl=settings.response_cache_ttl,
+            prefix="swcb:answer:",
+        )
+        _cache = ResponseCache(backend, model_id=settings.bedrock_model_id)
+    return _cache
@@ -0,0 +1,206 @@
+"""
+Conversation sessions for /chat and /stream.
+
+A session is the transcript of earlier turns (questions, tool rounds and answers),
+kept server-side under an opaque session id so a client can continue a
+conversation. Transcripts live in the same pluggable backends as the response
+cache: an in-process LRU with TTL per worker, or Redis shared by all workers.
+
+Before each turn the stored transcript is compacted to SESSION_HISTORY_MAX_TOKENS:
+tool results of older turns are cut to a short prefix first, then the oldest turns
+are dropped. The answers that used those lookups stay in the transcript, so the
+model keeps the context while the payload, and with it per-turn latency and cost,
+stays flat as a conversation grows.
+
+Concurrent turns in one session are not serialized; the last one to finish wins.
+"""
+import logging
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from app.cache import create_backend
+from app.config import settings
+from app.llm.core import build_messages_from_user
+from app.logger.config import update_log_context
+from app.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, Any]
+TRUNCATED_MARKER = " …[truncated]"
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _is_question(message: Message) -> bool:
+    """A user message with text starts a turn; tool_result messages belong to the turn."""
+    if message.get("role") != "user":
+        return False
+    content = message.get("content")
+    return isinstance(content, str) or any(b.get("type") == "text" for b in content or [])
+
+
+def split_turns(messages: List[Message]) -> List[List[Message]]:
+    turns: List[List[Message]] = []
+    for message in messages:
+        if _is_question(message) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def _tokens(messages: List[Message]) -> int:
+    return estimate_tokens(orjson.dumps(messages).decode())
+
+
+def _shrink_tool_result(block: Dict[str, Any], max_chars: int) -> Dict[str, Any]:
+    content = block.get("content")
+    if isinstance(content, list):
+        content = "".join(b.get("text", "") for b in content if b.get("type") == "text")
+    if not isinstance(content, str) or content.endswith(TRUNCATED_MARKER) or len(content) <= max_chars:
+        return block
+    return {**block, "content": content[:max_chars] + TRUNCATED_MARKER}
+
+
+def _shrink_turn(turn: List[Message], max_chars: int) -> List[Message]:
+    shrunk = []
+    for message in turn:
+        content = message.get("content")
+        if message.get("role") == "user" and isinstance(content, list) and not _is_question(message):
+            message = {**message, "content": [
+                _shrink_tool_result(b, max_chars) if b.get("type") == "tool_result" else b for b in content
+            ]}
+        shrunk.append(message)
+    return shrunk
+
+
+def compact(messages: List[Message], max_tokens: int, *, tool_result_chars: int) -> Tuple[List[Message], Dict[str, Any]]:
+    """
+    Fit a transcript of complete turns into `max_tokens` (estimated). Tool results
+    of older turns are cut to `tool_result_chars` first, then those of the newest
+    turn, then the oldest turns are dropped; the newest turn is always kept.
+    tool_use / tool_result pairs stay intact, so the transcript remains valid.
+    Returns (messages, stats); the input list is not modified.
+    """
+    before = _tokens(messages)
+    stats = {"session.history_tokens": before}
+    if before <= max_tokens or not messages:
+        return messages, stats
+
+    turns = split_turns(messages)
+    sizes = [_tokens(turn) for turn in turns]
+
+    def shrink(i: int) -> None:
+        turns[i] = _shrink_turn(turns[i], tool_result_chars)
+        sizes[i] = _tokens(turns[i])
+
+    for i in range(len(turns) - 1):
+        shrink(i)
+    if sum(sizes) > max_tokens:
+        shrink(len(turns) - 1)
+    dropped = 0
+    while len(turns) > 1 and sum(sizes) > max_tokens:
+        turns.pop(0)
+        sizes.pop(0)
+        dropped += 1
+
+    compacted = [message for turn in turns for message in turn]
+    after = sum(sizes)
+    stats.update({
+        "session.history_tokens": after,
+        "session.compacted_tokens": before - after,
+        "session.dropped_turns": dropped,
+    })
+    return compacted, stats
+
+
+class SessionStore:
+    def __init__(self, backend):
+        self.backend = backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def load(self, session_id: str) -> List[Message]:
+        try:
+            transcript = await self.backend.get(session_id)
+        except Exception:
+            logger.exception("Session load failed")
+            transcript = None
+        # copy: the memory backend hands out the stored list itself
+        return list(transcript) if transcript else []
+
+    async def save(self, session_id: str, messages: List[Message]) -> None:
+        try:
+            await self.backend.set(session_id, messages)
+        except Exception:
+            logger.exception("Session save failed")
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    global _store
+    if _store is None:
+        _store = SessionStore(create_backend(
+            settings.session_store_backend,
+            url=settings.session_store_url,
+            maxsize=settings.session_max_sessions,
+            ttl=settings.session_ttl,
+            prefix="swcb:session:",
+        ))
+    return _store
+
+
+@dataclass
+class SessionTurn:
+    """A turn's view of its session: the compacted history and the messages to send."""
+    session_id: Optional[str]
+    history: List[Message] = field(default_factory=list)
+    messages: List[Message] = field(default_factory=list)
+
+
+async def start_turn(session_id: Optional[str], user_input: str) -> SessionTurn:
+    """
+    Load and compact the session's transcript and append the new question. Without
+    a session store, sessions are off: no id is assigned and every turn starts cold.
+    """
+    question = build_messages_from_user(user_input)
+    store = get_session_store()
+    if not store.enabled:
+        return SessionTurn(None, [], question)
+    if session_id is None:
+        session_id = new_session_id()
+        history: List[Message] = []
+    else:
+        history = await store.load(session_id)
+    stats: Dict[str, Any] = {}
+    if history:
+        history, stats = compact(
+            history,
+            settings.session_history_max_tokens,
+            tool_result_chars=settings.session_tool_result_chars,
+        )
+    update_log_context({**stats, "session.previous_turns": len(split_turns(history))})
+    return SessionTurn(session_id, history, [*history, *question])
+
+
+async def finish_turn(turn: SessionTurn, messages: List[Message], answer: Optional[str]) -> None:
+    """
+    Store the transcript with the final answer. `messages` is the turn's transcript
+    (history, question and tool rounds). A turn without an answer is not stored,
+    so the transcript never ends on an unanswered question.
+    """
+    if turn.session_id is None or not answer:
+        return
+    await get_session_store().save(
+        turn.session_id,
+        [*messages, {"role": "assistant", "content": [{"type": "text", "text": answer}]}],
+    )
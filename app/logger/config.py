@@ -1,48 +1,146 @@
+import atexit
+import hashlib
 import logging
+import queue
+import random
 import sys
 from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Optional
+
+import orjson
 from pythonjsonlogger import jsonlogger
 from app.config import settings
 
 log_extra_data: ContextVar[dict] = ContextVar("log_extra_data", default={})
 
+PAYLOAD_MODES = ("off", "sampled", "truncated", "hashed")
+
+_listener: Optional[QueueListener] = None
+
 
 class CustomJsonFormatter(jsonlogger.JsonFormatter):
     def add_fields(self, log_record, record, message_dict):
         super().add_fields(log_record, record, message_dict)
-        
-        # Get data from the ContextVar and add it to the log record
-        context_data = log_extra_data.get()
+
+        # Get data from the ContextVar and add it to the log record. Records that went
+        # through the log queue carry a snapshot taken on the request path instead.
+        context_data = log_record.pop("log_context", None)
+        if context_data is None:
+            context_data = log_extra_data.get()
         if context_data:
             log_record.update(context_data)
-        
+
         # Standardize log level and timestamp fields
         log_record['level'] = log_record['levelname']
         log_record['timestamp'] = log_record.pop('asctime', None) or log_record.pop('created', None)
         log_record.pop('levelname', None) # remove redundant field
 
 
+class ContextQueueHandler(QueueHandler):
+    """
+    Hands records to the background listener without formatting them. The request's
+    log context is copied onto the record here, because the listener thread can't
+    see the request's ContextVars. A full queue drops the record rather than block.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        record.log_context = dict(log_extra_data.get())
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
 def setup_logging():
+    global _listener
+    if settings.log_payloads not in PAYLOAD_MODES:
+        raise ValueError(f"Unknown LOG_PAYLOADS mode: {settings.log_payloads}")
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
 
     handler = logging.StreamHandler(sys.stdout)
-    
+
     formatter = CustomJsonFormatter(
         '%(asctime)s %(name)s %(levelname)s %(message)s'
     )
-    
+
     handler.setFormatter(formatter)
-    
+
     # Clear existing handlers and add the new one
     if logger.hasHandlers():
         logger.handlers.clear()
-    
+    stop_logging()
+
+    if settings.log_queue:
+        # JSON formatting and the stdout write happen on the listener thread
+        _listener = QueueListener(queue.Queue(settings.log_queue_size), handler)
+        _listener.start()
+        handler = ContextQueueHandler(_listener.queue)
+
     logger.addHandler(handler)
 
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
+
+def update_log_context(fields: dict) -> None:
+    """Merge fields into the current request's log context (no-op outside a request)."""
+    context = log_extra_data.get(None)
+    if context is not None:
+        context.update(fields)
+
+def increment_log_context(field: str, by: int = 1) -> None:
+    """Add to a counter in the current request's log context (no-op outside a request)."""
+    context = log_extra_data.get(None)
+    if context is not None:
+        context[field] = context.get(field, 0) + by
+
+def _payload_text(payload: Any) -> str:
+    return payload if isinstance(payload, str) else orjson.dumps(payload).decode()
+
+def log_payload(call_type: str, prompt: Any, completion: Any) -> None:
+    """
+    Log a model call's prompt and completion according to LOG_PAYLOADS:
+    "off" logs nothing, "sampled" logs both in full for LOG_PAYLOAD_SAMPLE_RATE of
+    calls, "truncated" logs the first LOG_PAYLOAD_MAX_CHARS characters of each,
+    "hashed" logs their sha256 and length only. Payloads are passed as objects and
+    only serialized when they are going to be logged.
+    """
+    mode = settings.log_payloads
+    if mode == "off" or (mode == "sampled" and random.random() >= settings.log_payload_sample_rate):
+        return
+
+    fields = {"bedrock.call_type": call_type, "payload.mode": mode}
+    for name, payload in (("input", prompt), ("output", completion)):
+        text = _payload_text(payload)
+        fields[f"bedrock.{name}_chars"] = len(text)
+        if mode == "hashed":
+            fields[f"bedrock.{name}_sha256"] = hashlib.sha256(text.encode()).hexdigest()
+        elif mode == "truncated":
+            fields[f"bedrock.{name}_text"] = text[:settings.log_payload_max_chars]
+        else:
+            fields[f"bedrock.{name}_text"] = text
+    logging.getLogger(__name__).info("Bedrock payload", extra=fields)
+
 def get_common_attributes():
     return {
         "settings.bedrock.aws_profile": settings.bedrock_aws_profile,
         "settings.bedrock.aws_region": settings.bedrock_aws_region,
         "settings.bedrock.model_id": settings.bedrock_model_id
-    }
\ No newline at end of file
+    }
@@ -0,0 +1,116 @@
+"""
+Prometheus metrics.
+
+Metrics live in the default prometheus_client registry of each worker. With
+several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR (an empty directory,
+cleared before start) so every worker writes its values to shared mmap files
+and /metrics on any worker reports the sum over all of them.
+"""
+import os
+from typing import Dict, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# model calls and SSE streams run for seconds, well past the default buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TOOL_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time until the response body was fully sent",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+http_time_to_first_byte = Histogram(
+    "http_time_to_first_byte_seconds", "Time until the first response body chunk",
+    ["method", "route"], buckets=LATENCY_BUCKETS,
+)
+sse_streams_in_flight = Gauge(
+    "sse_streams_in_flight", "SSE responses currently streaming", multiprocess_mode="livesum",
+)
+bedrock_in_flight = Gauge(
+    "bedrock_calls_in_flight", "Bedrock calls holding a concurrency slot", multiprocess_mode="livesum",
+)
+bedrock_call_duration = Histogram(
+    "bedrock_call_duration_seconds", "Latency of one Bedrock call (a stream until it is closed)",
+    ["operation", "outcome"], buckets=LATENCY_BUCKETS,
+)
+bedrock_attempts = Counter(
+    "bedrock_attempts", "Bedrock call attempts per endpoint, including retries, failovers and hedges",
+    ["region", "model_id", "outcome"],
+)
+bedrock_hedges = Counter(
+    "bedrock_hedges", "Hedged stream requests; result is won or lost for the hedge", ["result"],
+)
+bedrock_calls = Counter(
+    "bedrock_calls", "Bedrock calls by the request type that made them", ["call_type", "model_id"],
+)
+bedrock_tokens = Counter(
+    "bedrock_tokens", "Tokens billed by Bedrock", ["call_type", "kind"],
+)
+bedrock_cost = Counter(
+    "bedrock_estimated_cost_usd", "Estimated Bedrock cost", ["call_type"],
+)
+tool_calls = Counter(
+    "tool_calls", "Tool invocations", ["tool", "outcome"],
+)
+tool_duration = Histogram(
+    "tool_duration_seconds", "Latency of one tool invocation", ["tool"], buckets=TOOL_BUCKETS,
+)
+turn_stops = Counter(
+    "turn_stops", "Conversation turns that ended without a normal answer; cancelled = client went away",
+    ["reason"],
+)
+turn_cancelled_work = Counter(
+    "turn_cancelled_work", "Model calls and tool fetches cancelled or skipped because a turn stopped early",
+    ["kind", "reason"],
+)
+admission_rejections = Counter(
+    "admission_rejections", "Requests turned away before reaching the model", ["reason"],
+)
+cache_lookups = Counter(
+    "cache_lookups", "Cache lookups; hit ratio = hit / (hit + miss)", ["cache", "result"],
+)
+
+# labels() takes a lock per call; fixed label sets are resolved once
+_children: Dict[Tuple[str, ...], object] = {}
+
+
+def cache_lookup(cache: str, result: str) -> None:
+    child = _children.get(("cache", cache, result))
+    if child is None:
+        child = _children[("cache", cache, result)] = cache_lookups.labels(cache, result)
+    child.inc()
+
+
+def record_request_usage(call_type: str, fields: Dict[str, float], calls_by_model: Dict[str, int]) -> None:
+    """
+    Count a request's aggregated Bedrock usage (see app.usage.RequestUsage.log_fields).
+    Calls are counted per model, since a request that failed over used several.
+    """
+    for model_id, calls in calls_by_model.items():
+        bedrock_calls.labels(call_type, model_id).inc(calls)
+    for kind, key in (("input", "bedrock.tokens_input"), ("output", "bedrock.tokens_output"),
+                      ("cache_read", "bedrock.cache_read_tokens"), ("cache_write", "bedrock.cache_write_tokens")):
+        if fields[key]:
+            bedrock_tokens.labels(call_type, kind).inc(fields[key])
+    bedrock_cost.labels(call_type).inc(fields["bedrock.estimated_cost"])
+
+
+def render() -> Tuple[bytes, str]:
+    """Exposition text for this worker, or for all workers in multiprocess mode."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead() -> None:
+    """Drop this worker's live gauges from the shared files on shutdown."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(os.getpid())
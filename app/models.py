@@ -1,7 +1,11 @@
-from pydantic import BaseModel
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
 
 class UserQuery(BaseModel):
     user_input: str
+    # continue a conversation; omitted, a new session is started and its id returned
+    session_id: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_-]{8,128}$")
 
 class UserPreferences(BaseModel):
     people: str = ""
@@ -9,4 +13,8 @@ class UserPreferences(BaseModel):
     films: str = ""
     species: str = ""
     vehicles: str = ""
-    starships: str = ""
\ No newline at end of file
+    starships: str = ""
+
+
+class SuggestionsBatch(BaseModel):
+    preferences: List[UserPreferences] = Field(min_length=1, max_length=100)
@@ -0,0 +1,178 @@
+"""
+Startup warmup and readiness.
+
+The lifespan starts `warmup()` in the background: it loads the local SWAPI index
+and the precomputed suggestions, builds the shared Bedrock client and opens its
+connection, and warms the SWAPI connection pool and the cache backends. /ready
+reports ready once warmup has finished, the Bedrock and cache checks have passed
+once, and neither Bedrock nor the SWAPI pool is saturated.
+
+The checks are re-run periodically, but after that first pass their failures are
+only reported. Bedrock, Redis and SWAPI are shared by every pod: a blip there
+would take all pods out of rotation at once and leave the load balancer with
+nowhere to send traffic, while the app already copes (failover, caches that fail
+open, tools that report the outage to the model). SWAPI never gates readiness.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app import admission, suggestions_warm
+from app.clients import bedrock
+from app.config import settings
+from app.llm.response_cache import get_response_cache
+from app.routes.suggestions import get_suggestions_cache
+from app.tools import swapi, swapi_store
+from app.usage import INFERENCE_PROFILE_PREFIXES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Readiness:
+    started_at: float = field(default_factory=time.perf_counter)
+    warmed_up: bool = False
+    # the gating checks have all passed once; later failures are only reported
+    dependencies_verified: bool = False
+    startup_ms: Optional[float] = None
+    # check name -> {"ok": bool, "ms": float, "error": str}
+    checks: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+state = Readiness()
+
+
+def _base_model_id(model_id: str) -> str:
+    for prefix in INFERENCE_PROFILE_PREFIXES:
+        if model_id.startswith(prefix):
+            return model_id[len(prefix):]
+    return model_id
+
+
+async def check_bedrock() -> str:
+    """
+    The shared client exists and (unless disabled) the configured model is
+    reachable in the region with the current credentials.
+    """
+    await bedrock.open_async_bedrock()
+    if not settings.readiness_bedrock_check:
+        return "client"
+    control = await asyncio.to_thread(bedrock.get_bedrock_control_client)
+    await asyncio.to_thread(control.get_foundation_model, modelIdentifier=_base_model_id(settings.bedrock_model_id))
+    return "ok"
+
+
+async def check_swapi() -> str:
+    """Lookups are served from the snapshot, or live SWAPI answers (warming the pool)."""
+    store = swapi_store.get_store()
+    if store is not None:
+        return "snapshot"
+    r = await swapi.get_client().get(settings.sw_api_base)
+    r.raise_for_status()
+    return "live"
+
+
+async def check_caches() -> str:
+    """Cache backends answer (opens the Redis connection when one is configured)."""
+    for backend in (get_response_cache().backend, get_suggestions_cache()):
+        if backend is not None:
+            await backend.get("readiness")
+    return settings.response_cache_backend
+
+
+CHECKS: Dict[str, Callable[[], Awaitable[str]]] = {
+    "bedrock": check_bedrock,
+    "swapi": check_swapi,
+    "caches": check_caches,
+}
+# reported by /ready but never part of the verdict
+INFORMATIONAL_CHECKS = ("swapi",)
+
+
+async def _run_check(name: str, check: Callable[[], Awaitable[str]]) -> None:
+    start = time.perf_counter()
+    try:
+        detail = await asyncio.wait_for(check(), timeout=settings.readiness_check_timeout)
+        result: Dict[str, Any] = {"ok": True, "detail": detail}
+    except Exception as e:
+        result = {"ok": False, "error": str(e) or type(e).__name__}
+    result["ms"] = round((time.perf_counter() - start) * 1000, 2)
+    if state.checks.get(name, {}).get("ok", True) and not result["ok"]:
+        logger.warning("Readiness check failed", extra={"readiness.check": name, "error": result["error"]})
+    state.checks[name] = result
+
+
+async def run_checks() -> None:
+    await asyncio.gather(*(_run_check(name, check) for name, check in CHECKS.items()))
+    if not state.dependencies_verified and all(
+            r["ok"] for name, r in state.checks.items() if name not in INFORMATIONAL_CHECKS):
+        state.dependencies_verified = True
+
+
+async def warmup() -> None:
+    # building the n-gram index of a snapshot takes a moment; keep it off the event loop
+    try:
+        await asyncio.to_thread(swapi_store.load_snapshot)
+    except Exception:
+        logger.exception("SWAPI snapshot could not be loaded, using live SWAPI")
+    try:
+        await suggestions_warm.load_warm_suggestions()
+    except Exception:
+        logger.exception("Precomputed suggestions could not be loaded")
+    await run_checks()
+    # open the bedrock-runtime connection once; later calls reuse it
+    client = bedrock._async_client
+    if client is not None:
+        try:
+            await asyncio.wait_for(client.warm(), timeout=settings.readiness_check_timeout)
+        except Exception as e:
+            logger.warning("Bedrock connection warmup failed", extra={"error": str(e) or type(e).__name__})
+    state.warmed_up = True
+    state.startup_ms = round((time.perf_counter() - state.started_at) * 1000, 2)
+    logger.info("Startup warmup completed", extra={
+        "startup.ms": state.startup_ms,
+        **{f"startup.check.{name}.ms": r["ms"] for name, r in state.checks.items()},
+        "startup.failed_checks": [name for name, r in state.checks.items() if not r["ok"]],
+    })
+
+
+async def recheck_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        await run_checks()
+
+
+def saturation() -> Dict[str, Any]:
+    client = bedrock._async_client
+    return {
+        "bedrock_in_flight": client.in_flight if client else 0,
+        "bedrock_waiting": client.waiting if client else 0,
+        # informational: failover keeps serving while some endpoints are open
+        "bedrock_open_circuits": client.open_circuits() if client else [],
+        "swapi_queued": swapi.pool_stats()["queued"],
+        "admission_active": admission.controller.active,
+        "admission_waiting": admission.controller.waiting,
+    }
+
+
+def status() -> Tuple[bool, Dict[str, Any]]:
+    """(ready, body) for the /ready probe."""
+    load = saturation()
+    if not state.warmed_up:
+        reason = "warming_up"
+    elif not state.dependencies_verified:
+        reason = "dependency_unavailable"
+    elif (load["bedrock_waiting"] > settings.readiness_max_bedrock_waiting
+          or load["swapi_queued"] > settings.readiness_max_swapi_queued
+          or load["admission_waiting"] >= settings.admission_max_queue):
+        reason = "saturated"
+    else:
+        reason = None
+    return reason is None, {
+        "status": "ready" if reason is None else reason,
+        "startup_ms": state.startup_ms,
+        "checks": state.checks,
+        "load": load,
+    }
@@ -1,43 +1,68 @@
 from __future__ import annotations
 from typing import Dict, Any
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 
-from app.llm.core import (
-    build_messages_from_user,
-    build_payload,
-    bedrock_invoke,
-    resolve_tools_sync,
-)
+from app.admission import overloaded
+from app.disconnect import ClientDisconnected, cancel_on_disconnect
+from app.llm.core import NO_ANSWER, TurnDeadlineExceeded, complete_turn
+from app.llm.response_cache import get_response_cache
+from app.llm.sessions import finish_turn, start_turn
 from app.models import UserQuery
 
 router = APIRouter()
 
 @router.post("/chat")
-def chat_with_ai(user_query: UserQuery) -> Dict[str, Any]:
+async def chat_with_ai(user_query: UserQuery, request: Request) -> Dict[str, Any]:
     try:
-        # 1) start transcript
-        messages = build_messages_from_user(user_query.user_input)
+        # 0) continue the session's conversation, or start a new one
+        session = await start_turn(user_query.session_id, user_query.user_input)
 
-        # 2) resolve tools (sync loop that internally uses asyncio for HTTP tools)
-        messages, tools_used, last_result = resolve_tools_sync(messages)
-
-        # 3) final non-stream answer
-        #    You might already have assistant text in last_result if stop_reason != "tool_use".
-        #    To be explicit, do one more non-stream call with the full transcript (optional).
-        final_payload = build_payload(messages)
-        final_result = bedrock_invoke(final_payload)
+        # 1) repeated questions are answered from the response cache; within a
+        #    conversation the answer depends on its history, so only first questions are
+        cache = get_response_cache() if not session.history else None
+        cached = await cache.get(user_query.user_input) if cache is not None else None
+        if cached is not None:
+            await finish_turn(session, session.messages, cached["text"])
+            return {
+                "response": cached["text"] or NO_ANSWER,
+                "tool": {
+                    "used_tool": int(bool(cached["tools_used"])),
+                    "names": cached["tools_used"],
+                },
+                "model_calls": 0,
+                "cached": True,
+                "session_id": session.session_id,
+            }
 
-        text = next(
-            (c.get("text") for c in final_result.get("content", []) if c.get("type") == "text"),
-            "Unable to give an answer"
-        )
+        # 2) run the turn: tool rounds until the model answers without tool_use;
+        #    that last response already holds the final answer; a client that
+        #    disconnects meanwhile cancels the turn instead of waiting for it
+        turn = await cancel_on_disconnect(request, complete_turn(session.messages))
+        # answers cut off by the round limit or built on failed tool calls are not reused
+        if cache is not None and turn.cacheable:
+            await cache.put(
+                user_query.user_input,
+                text=turn.text,
+                tools_used=turn.tools_used,
+                messages=turn.messages,
+                model_calls=turn.model_calls,
+            )
+        await finish_turn(session, turn.messages, turn.text)
 
         return {
-            "response": text,
+            "response": turn.text or NO_ANSWER,
             "tool": {
-                "used_tool": int(bool(tools_used)),
-                "names": tools_used,
-            }
+                "used_tool": int(bool(turn.tools_used)),
+                "names": turn.tools_used,
+            },
+            "model_calls": turn.model_calls,
+            "cached": False,
+            "session_id": session.session_id,
         }
+    except TurnDeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnected:
+        # nobody reads this; the status marks the request in logs and metrics
+        raise HTTPException(status_code=499, detail="Client closed request")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise overloaded(e) or HTTPException(status_code=500, detail=str(e))
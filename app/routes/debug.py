@@ -1,22 +1,16 @@
+import asyncio
+
 from fastapi import APIRouter
-from boto3.session import Session
 
 from app.config import settings
-from app.clients.bedrock import get_bedrock_client
+from app.clients.bedrock import get_bedrock_control_client
+from app.tools import swapi
 
 router = APIRouter()
-session = Session()
-
-# Initialize the session with the AWS profile if in development environment
-# This allows for local testing with a specific AWS profile
-if settings.env == "development":
-    session = Session(profile_name=settings.bedrock_aws_profile)
-
-bedrock = session.client("bedrock", region_name=settings.bedrock_aws_region)
 
 @router.get("/debug/bedrock/models")
 async def list_models():
-    response = bedrock.list_foundation_models()
+    response = await asyncio.to_thread(lambda: get_bedrock_control_client().list_foundation_models())
 
     models = [
         {
@@ -36,4 +30,8 @@ async def list_models():
         "bedrock_aws_profile": settings.bedrock_aws_profile,
         "bedrock_aws_region": settings.bedrock_aws_region,
         "bedrock_model_id": settings.bedrock_model_id
-    }}
\ No newline at end of file
+    }}
+
+@router.get("/debug/swapi/pool")
+async def swapi_pool():
+    return swapi.pool_stats()
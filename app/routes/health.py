@@ -1,4 +1,7 @@
 from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+
+from app import readiness
 
 router = APIRouter()
 
@@ -7,5 +10,8 @@ async def liveness():
     return {"status": "ok"}
 
 @router.get("/ready")
-async def readiness():
-    return {"status": "ready"}
+async def readiness_probe():
+    # 503 while warming up, when a dependency is down or when saturated, so load
+    # balancers route traffic elsewhere
+    ready, body = readiness.status()
+    return ORJSONResponse(body, status_code=200 if ready else 503)
@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Response
+
+from app import metrics
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
@@ -1,82 +1,91 @@
-import json
 import logging
-from typing import Dict, Any
+from contextlib import aclosing
+from typing import Optional
 
-from fastapi import APIRouter, Response
+from fastapi import APIRouter, Header
 from fastapi.responses import StreamingResponse
 
-from app.clients.bedrock import get_bedrock_client
-from app.config import settings
-from app.llm.core import (
-    build_messages_from_user,
-    build_payload,
-    bedrock_invoke,
-    resolve_tools_sync,
-)
+from app.admission import overload_retry_after
+from app.llm.core import NO_ANSWER, TurnDeadlineExceeded, run_turn
+from app.llm.response_cache import get_response_cache, replay_chunks
+from app.llm.sessions import finish_turn, start_turn
 from app.models import UserQuery
+from app.sse import encode_stream, new_stream_id, resume_stream
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-bedrock = get_bedrock_client()
-MODEL_ID = settings.bedrock_model_id
 
-def bedrock_stream(payload: Dict[str, Any]):
-    resp = bedrock.invoke_model_with_response_stream(
-        modelId=MODEL_ID,
-        body=json.dumps(payload),
-        accept="application/json",
-        contentType="application/json",
-    )
-    stream = resp.get("body")
-    for event in stream:
-        if "chunk" not in event:
-            continue
-        data = json.loads(event["chunk"]["bytes"].decode("utf-8"))
-        if data.get("type") == "content_block_delta":
-            delta = data.get("delta", {})
-            if delta.get("type") == "text_delta":
-                yield delta.get("text", "")
-        elif data.get("type") == "message_stop":
-            break
+SSE_HEADERS = {"Cache-Control": "no-cache", "Connection": "keep-alive"}
 
 @router.post("/stream")
-async def stream_with_claude(user_query: UserQuery):
-    def sse_gen():
-        try:
-            messages = build_messages_from_user(user_query.user_input)
-
-            # FIRST non-stream call to get quick text
-            first_result = bedrock_invoke(build_payload(messages))
+async def stream_with_claude(user_query: UserQuery, last_event_id: Optional[str] = Header(default=None)):
+    if last_event_id:
+        # a reconnect: replay what the client missed from the resume log, no model call
+        return StreamingResponse(resume_stream(last_event_id), media_type="text/event-stream", headers=SSE_HEADERS)
 
-            # quick text BEFORE any tool_use
-            first_content = first_result.get("content", [])
-            for block in first_content:
-                if block.get("type") == "text":
-                    yield f"data: {json.dumps({'delta': block.get('text', '')})}\n\n"
-                else:
-                    break  # stop when first non-text (tool_use) appears
+    async def sse_gen():
+        try:
+            session = await start_turn(user_query.session_id, user_query.user_input)
 
-            # resolve tools synchronously (shared helper)
-            messages, tools_used, last_result = resolve_tools_sync(messages)
+            # repeated first questions replay the cached answer without calling Bedrock;
+            # within a conversation the answer depends on its history
+            cache = get_response_cache() if not session.history else None
+            cached = await cache.get(user_query.user_input) if cache is not None else None
+            if cached is not None:
+                await finish_turn(session, session.messages, cached["text"])
+                tools_used = cached["tools_used"]
+                yield {"tool_event": {"used": bool(tools_used), "names": tools_used}}
+                for chunk in replay_chunks(cached["text"] or NO_ANSWER):
+                    yield {"delta": chunk}
+                yield {"done": True, "model_calls": 0, "cached": True, "session_id": session.session_id}
+                return
 
-            # tell client about tools
-            if tools_used:
-                yield f"data: {json.dumps({'tool_event': {'used': True, 'names': tools_used}})}\n\n"
-            else:
-                yield f"data: {json.dumps({'tool_event': {'used': False}})}\n\n"
+            # every round is streamed, so text (including any "let me check" preamble
+            # before a tool_use) reaches the client as it is generated
+            tools_used, model_calls = [], 0
+            # aclosing: a disconnect while an event is being sent still cancels the turn's
+            # in-flight work right away instead of whenever the generator is collected
+            async with aclosing(run_turn(session.messages, stream=True)) as events:
+                async for event in events:
+                    if event["type"] == "text":
+                        yield {"delta": event["text"]}
+                    elif event["type"] == "tool_use":
+                        # tell client about tools
+                        tools_used = event["names"]
+                        yield {"tool_event": {"used": True, "names": tools_used}}
+                    elif event["type"] == "done":
+                        turn = event["turn"]
+                        model_calls = turn.model_calls
+                        # answers cut off by the round limit or built on failed tool calls are not reused
+                        if cache is not None and turn.cacheable:
+                            await cache.put(
+                                user_query.user_input,
+                                text=turn.text,
+                                tools_used=turn.tools_used,
+                                messages=turn.messages,
+                                model_calls=turn.model_calls,
+                            )
+                        await finish_turn(session, turn.messages, turn.text)
 
-            # FINAL streaming call (no "stream": true in body)
-            stream_payload = build_payload(messages)
-            for token in bedrock_stream(stream_payload):
-                yield f"data: {json.dumps({'delta': token})}\n\n"
+            if not tools_used:
+                yield {"tool_event": {"used": False}}
 
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            yield {"done": True, "model_calls": model_calls, "cached": False, "session_id": session.session_id}
+        except TurnDeadlineExceeded as e:
+            logger.warning("SSE stream stopped at the turn deadline")
+            yield {"error": str(e)}
         except Exception as e:
+            retry_after = overload_retry_after(e)
+            if retry_after is not None:
+                logger.warning("SSE stream rejected, model busy", extra={"error": str(e)})
+                yield {"error": "The model is busy, try again shortly", "retry_after": retry_after}
+                return
             logger.exception("SSE stream failed")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield {"error": str(e)}
 
+    # events are framed, coalesced and flushed by app.sse
     return StreamingResponse(
-        sse_gen(),
+        encode_stream(sse_gen(), new_stream_id()),
         media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
-    )
\ No newline at end of file
+        headers=SSE_HEADERS,
+    )
@@ -1,23 +1,129 @@
-import json, httpx, logging
-from fastapi import APIRouter
+import asyncio, hashlib, json, logging, time
+from typing import Dict, Optional, Union
+from fastapi import APIRouter, Request
 
-from app.clients.bedrock import get_bedrock_client
-from app.models import UserPreferences
-from app.utils import truncate_json, get_bedrock_usage
+from app import metrics
+from app.admission import overload_retry_after, overloaded, rate_limited
+from app.cache import create_backend
+from app.clients.bedrock import get_async_bedrock
+from app.models import SuggestionsBatch, UserPreferences
+from app.usage import log_request_usage
+from app.utils import truncate_json
 from app.config import settings
-from app.llm.suggestions import SYSTEM_PROMPT
+from app.llm.core import system_prompt
+from app.llm.suggestions import SYSTEM_PROMPT, PROMPT_VERSION
+from app.logger.config import log_payload, update_log_context
+from app.tools import swapi
+from app.tracing import span
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-bedrock = get_bedrock_client()
+
+# order of the categories in the prompt context
+CATEGORIES = ("people", "films", "planets", "species", "vehicles", "starships")
+
+# suggestions tolerate a smaller model, with its own failover chain
+SUGGESTIONS_MODEL_ID = settings.suggestions_model_id or settings.bedrock_model_id
+SUGGESTIONS_FAILOVER_MODEL_IDS = settings.suggestions_failover_model_ids or settings.bedrock_failover_model_ids
+
+_suggestions_cache = None
+
+def get_suggestions_cache():
+    global _suggestions_cache
+    if _suggestions_cache is None:
+        _suggestions_cache = create_backend(
+            settings.response_cache_backend,
+            url=settings.response_cache_url,
+            maxsize=settings.response_cache_size,
+            ttl=settings.suggestions_cache_ttl,
+            prefix="swcb:suggestions:",
+        )
+    return _suggestions_cache
+
+def preferences_key(user_preferences: UserPreferences) -> str:
+    normalized = {k: " ".join(v.lower().split()) for k, v in sorted(user_preferences.model_dump().items())}
+    raw = f"{SUGGESTIONS_MODEL_ID}|{PROMPT_VERSION}|{json.dumps(normalized)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
 
 @router.post("/suggestions")
 async def suggestions_from_ai(user_preferences: UserPreferences):
-    context = await fetch_sw_context(user_preferences)
+    try:
+        text_response = await generate_suggestions(user_preferences)
+    except Exception as e:
+        exc = overloaded(e)
+        if exc is None:
+            raise
+        raise exc from e
+    log_request_usage("suggestions")
+
+    if not text_response:
+        return {
+            "error": "No suggestions generated by the AI."
+        }
+
+    return {
+        "response": text_response,
+    }
+
+@router.post("/suggestions/batch")
+async def batch_suggestions_from_ai(batch: SuggestionsBatch, request: Request):
+    """
+    Suggestions for many preference sets, in request order. Identical sets (after
+    normalization) are generated once, and at most SUGGESTIONS_BATCH_CONCURRENCY
+    of them at a time; an item that fails gets an error instead of failing the batch.
+    Each unique set costs a rate limit token, like a /suggestions request.
+    """
+    unique: Dict[str, UserPreferences] = {}
+    for user_preferences in batch.preferences:
+        unique.setdefault(preferences_key(user_preferences), user_preferences)
+
+    # admission took one token for the request
+    rejected = rate_limited(request.scope, len(unique) - 1)
+    if rejected is not None:
+        return rejected
+
+    results = await generate_many(unique)
+    log_request_usage("suggestions")
+    update_log_context({
+        "suggestions.batch_size": len(batch.preferences),
+        "suggestions.batch_unique": len(unique),
+        "suggestions.batch_errors": sum(isinstance(r, BaseException) for r in results.values()),
+    })
+
+    def item(result):
+        if isinstance(result, BaseException):
+            retry_after = overload_retry_after(result)
+            if retry_after is not None:
+                return {"error": "The model is busy, try again shortly", "retry_after": retry_after}
+            return {"error": str(result) or type(result).__name__}
+        if not result:
+            return {"error": "No suggestions generated by the AI."}
+        return {"response": result}
+
+    return {
+        "results": [item(results[preferences_key(p)]) for p in batch.preferences],
+    }
+
+async def generate_suggestions(user_preferences: UserPreferences) -> Optional[str]:
+    """
+    Suggestions text for one preference set, from the cache or from the model
+    (None when the model gave none). Bedrock errors are raised to the caller.
+    """
+    # preferences rarely change between sessions, so identical ones reuse earlier suggestions
+    cache = get_suggestions_cache()
+    key = preferences_key(user_preferences)
+    cached = await cache.get(key) if cache is not None else None
+    update_log_context({"suggestions.cache_hit": cached is not None})
+    if cache is not None:
+        metrics.cache_lookup("suggestions", "hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached
+
+    context, failed_categories = await fetch_sw_context(user_preferences)
 
     initial_payload = {
         "anthropic_version": "bedrock-2023-05-31",
-        "system": SYSTEM_PROMPT,
+        "system": system_prompt(SYSTEM_PROMPT),
         "messages": [
             {
                 "role": "user",
@@ -26,7 +132,7 @@ async def suggestions_from_ai(user_preferences: UserPreferences):
                         "type": "text",
                         "text": (
                             f"Here’s what I know about the user preferences:\n\n"
-                            f"{json.dumps(context)}\n\n"
+                            f"{context}\n\n"
                             f"Now, give me suggestions of questions."
                         )
                     }
@@ -36,58 +142,71 @@ async def suggestions_from_ai(user_preferences: UserPreferences):
         "max_tokens": settings.max_tokens
     }
 
-    response = bedrock.invoke_model(
-        modelId=settings.bedrock_model_id,
-        contentType="application/json",
-        accept="application/json",
-        body=json.dumps(initial_payload)
-    )
+    with span("bedrock.invoke", model_id=SUGGESTIONS_MODEL_ID):
+        result = await get_async_bedrock().invoke(
+            initial_payload, model_id=SUGGESTIONS_MODEL_ID, fallback_model_ids=SUGGESTIONS_FAILOVER_MODEL_IDS)
 
-    raw_body = response["body"].read()
-    result = json.loads(raw_body)
+    log_payload("suggestions", initial_payload["messages"], result.get("content", []))
 
-    bedrock_usage = get_bedrock_usage(
-        model_id=settings.bedrock_model_id,
-        input_text=json.dumps(initial_payload["messages"]),
-        output_text=json.dumps(result),
-        call_type="initial"
-    )
-    logger.info("Bedrock usage", extra=bedrock_usage)
-    
     text_response = next(
         (c["text"] for c in result.get("content", []) if c.get("type") == "text"),
         None
     )
 
-    if not text_response:
-        return {
-            "error": "No suggestions generated by the AI."
-        }
+    # suggestions built from partial context are served but not memoized
+    if text_response and cache is not None and not failed_categories:
+        await cache.set(key, text_response)
 
-    return {
-        "response": text_response,
-    }
+    return text_response
+
+async def generate_many(preferences: Dict[str, UserPreferences]) -> Dict[str, Union[Optional[str], BaseException]]:
+    """
+    generate_suggestions for each of `preferences` (keyed by preferences_key), at
+    most SUGGESTIONS_BATCH_CONCURRENCY at a time. Maps each key to its text or
+    to the exception it raised.
+    """
+    semaphore = asyncio.Semaphore(settings.suggestions_batch_concurrency)
+
+    async def generate(user_preferences):
+        async with semaphore:
+            return await generate_suggestions(user_preferences)
+
+    results = await asyncio.gather(*(generate(p) for p in preferences.values()), return_exceptions=True)
+    return dict(zip(preferences, results))
 
 async def fetch_sw_context(user_preferences):
-    async with httpx.AsyncClient() as client:
-        async def fetch_category(category, value):
-            if value != "":
-                resp = await client.get(f"{settings.sw_api_base}/{category}?search={value}")
-                return resp.json()
+    """
+    Look up every non-empty preference concurrently. Each category has its own
+    timeout; a slow or failing category is left empty instead of failing the
+    whole request. Per-category latency goes into the request log.
+    Returns (truncated JSON context, names of categories that failed).
+    """
+    client = swapi.get_client()
+    timings = {}
+    failed = []
+
+    async def fetch_category(category, value):
+        if value == "":
             return {}
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(
+                swapi.search(category, value, base_url=settings.sw_api_base, client=client),
+                timeout=settings.suggestions_category_timeout,
+            )
+        except (asyncio.TimeoutError, swapi.ToolError) as e:
+            failed.append(category)
+            logger.warning("Suggestions context fetch failed", extra={
+                "suggestions.category": category,
+                "error": str(e) or type(e).__name__,
+            })
+            return {}
+        finally:
+            timings[f"suggestions.fetch_ms.{category}"] = round((time.perf_counter() - start) * 1000, 2)
+
+    results = await asyncio.gather(*(
+        fetch_category(category, getattr(user_preferences, category)) for category in CATEGORIES
+    ))
+    update_log_context({**timings, "suggestions.failed_categories": failed})
 
-        people = await fetch_category("people", user_preferences.people)
-        planets = await fetch_category("planets", user_preferences.planets)
-        films = await fetch_category("films", user_preferences.films)
-        species = await fetch_category("species", user_preferences.species)
-        vehicles = await fetch_category("vehicles", user_preferences.vehicles)
-        starships = await fetch_category("starships", user_preferences.starships)
-
-    return truncate_json({
-        "people": people,
-        "films": films,
-        "planets": planets,
-        "species": species,
-        "vehicles": vehicles,
-        "starships": starships
-    }, limit=10000)
\ No newline at end of file
+    return truncate_json(dict(zip(CATEGORIES, results)), limit=10000), failed
@@ -0,0 +1,29 @@
+"""
+JSON encoding on the request path.
+
+Everything the app serializes per request goes through orjson: model payloads
+are handed to boto3 as bytes, Bedrock responses and stream chunks are decoded
+straight from bytes, routes default to ORJSONResponse, and SSE frames are built
+from pre-encoded prefixes and suffixes around the orjson output. Output is
+compact UTF-8 JSON (no spaces, non-ASCII characters as-is), which every JSON
+parser reads like the stdlib's output.
+"""
+from typing import Any, Dict
+
+import orjson
+
+dumps = orjson.dumps  # -> bytes
+loads = orjson.loads  # from bytes or str
+
+SSE_PREFIX = b"data: "
+SSE_SUFFIX = b"\n\n"
+
+
+def dumps_str(obj: Any) -> str:
+    return orjson.dumps(obj).decode()
+
+
+def sse_event(data: Dict[str, Any]) -> bytes:
+    """One SSE `data:` frame holding `data` as JSON."""
+    return SSE_PREFIX + orjson.dumps(data) + SSE_SUFFIX
+
@@ -0,0 +1,209 @@
+"""
+Server-sent event pipeline for /stream.
+
+The route produces plain events ({"delta": text}, {"tool_event": ...},
+{"done": ...}); `encode_stream` turns them into the response body:
+
+- Producer and writer are decoupled by a bounded queue. The route's events are
+  read by a producer task, and the writer only takes the next event once the
+  previous write went out. A slow client fills the queue, the producer blocks,
+  and no further Bedrock events are read until the client catches up.
+- Text deltas are coalesced. The first one is sent at once (time to first
+  token), later ones are merged into one frame until SSE_COALESCE_BYTES are
+  buffered or the oldest has waited SSE_COALESCE_WINDOW seconds. Any other
+  event flushes the buffer first, so the order is kept.
+- A ": ping" comment goes out after SSE_HEARTBEAT_INTERVAL seconds without a
+  write, so proxies keep the connection open through long tool rounds.
+- Every data frame has an id "<stream id>:<seq>". When the stream ends, its
+  frames are kept in the resume log (SSE_RESUME_BACKEND) for SSE_RESUME_TTL
+  seconds, and a reconnect with Last-Event-ID replays the frames after that id
+  without calling the model. A disconnect cancels the turn (see app.disconnect),
+  so a stream that was cut short is replayed up to where it stopped, followed
+  by an error event.
+"""
+import asyncio
+import logging
+import math
+import uuid
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from app import serialization
+from app.cache import create_backend
+from app.config import settings
+from app.logger.config import update_log_context
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT = b": ping\n\n"
+_END = object()
+
+_log = None
+# fire-and-forget saves of finished streams; referenced until done
+_pending_saves: Set[asyncio.Task] = set()
+
+
+def get_resume_log():
+    global _log
+    if _log is None:
+        _log = create_backend(
+            settings.sse_resume_backend,
+            url=settings.sse_resume_url,
+            maxsize=settings.sse_resume_max_streams,
+            ttl=settings.sse_resume_ttl,
+            prefix="swcb:sse:",
+        )
+    return _log
+
+
+def new_stream_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _frame(id_prefix: bytes, seq: int, encoded: bytes) -> bytes:
+    return id_prefix + str(seq).encode() + b"\n" + serialization.SSE_PREFIX + encoded + serialization.SSE_SUFFIX
+
+
+class _Frames:
+    """Data frames of one stream: ids, and the JSON of each frame for the resume log."""
+
+    def __init__(self, stream_id: str):
+        self.id_prefix = b"id: " + stream_id.encode() + b":"
+        self.logged: List[str] = []
+
+    def frame(self, encoded: bytes) -> bytes:
+        self.logged.append(encoded.decode())
+        return _frame(self.id_prefix, len(self.logged), encoded)
+
+
+def _save(stream_id: str, frames: List[str], complete: bool) -> None:
+    log = get_resume_log()
+    if log is None:
+        return
+
+    async def save():
+        try:
+            await log.set(stream_id, {"frames": frames, "complete": complete})
+        except Exception:
+            logger.exception("SSE resume log save failed")
+
+    # runs outside the response: a cancelled stream must still be saved
+    task = asyncio.get_running_loop().create_task(save())
+    _pending_saves.add(task)
+    task.add_done_callback(_pending_saves.discard)
+
+
+async def _produce(events: AsyncIterator[Dict[str, Any]], queue: asyncio.Queue) -> None:
+    # aclosing: when the producer is cancelled (client gone, possibly while blocked
+    # on a full queue) the turn and its Bedrock stream are closed now, not at GC
+    try:
+        async with aclosing(events) as it:
+            async for event in it:
+                await queue.put(event)
+    except Exception as e:
+        await queue.put(e)
+    await queue.put(_END)
+
+
+async def encode_stream(events: AsyncIterator[Dict[str, Any]], stream_id: str) -> AsyncIterator[bytes]:
+    """The SSE response body for `events`; see the module docstring."""
+    frames = _Frames(stream_id)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(settings.sse_buffer_events, 1))
+    producer = asyncio.create_task(_produce(events, queue))
+    loop = asyncio.get_running_loop()
+    window, max_bytes, heartbeat = settings.sse_coalesce_window, settings.sse_coalesce_bytes, settings.sse_heartbeat_interval
+
+    pending: List[str] = []
+    pending_bytes = 0
+    flush_at: Optional[float] = None  # when the oldest buffered delta has waited `window`
+    first_delta = True
+    last_write = loop.time()
+    deltas = heartbeats = 0
+    complete = False
+
+    def flush() -> bytes:
+        nonlocal pending, pending_bytes, flush_at
+        frame = frames.frame(serialization.dumps({"delta": "".join(pending)}))
+        pending, pending_bytes, flush_at = [], 0, None
+        return frame
+
+    try:
+        while True:
+            if not queue.empty():
+                # events are flowing: take the next one without arming a timer
+                event = queue.get_nowait()
+            else:
+                wake_at = flush_at
+                if heartbeat > 0:
+                    wake_at = min(wake_at or math.inf, last_write + heartbeat)
+                try:
+                    async with asyncio.timeout_at(wake_at):
+                        event = await queue.get()
+                except TimeoutError:
+                    now = loop.time()
+                    if flush_at is not None and now >= flush_at:
+                        yield flush()
+                        last_write = now
+                    elif heartbeat > 0 and now >= last_write + heartbeat:
+                        heartbeats += 1
+                        yield HEARTBEAT
+                        last_write = now
+                    continue
+
+            if event is _END:
+                break
+            if isinstance(event, Exception):
+                raise event
+            text = event.get("delta") if len(event) == 1 else None
+            if text is not None:
+                deltas += 1
+                pending.append(text)
+                pending_bytes += len(text.encode())
+                if first_delta or pending_bytes >= max_bytes or window <= 0:
+                    first_delta = False
+                    yield flush()
+                    last_write = loop.time()
+                elif flush_at is None:
+                    flush_at = loop.time() + window
+                elif loop.time() >= flush_at:
+                    # no timer runs while the queue has events
+                    yield flush()
+                    last_write = loop.time()
+                continue
+            if pending:
+                yield flush()
+            yield frames.frame(serialization.dumps(event))
+            last_write = loop.time()
+        if pending:
+            yield flush()
+        complete = True
+    finally:
+        # the producer cleans up after itself (closing the Bedrock stream, cancelling tool fetches)
+        producer.cancel()
+        _save(stream_id, frames.logged, complete)
+        update_log_context({
+            "sse.stream_id": stream_id,
+            "sse.deltas": deltas,
+            "sse.frames": len(frames.logged),
+            "sse.heartbeats": heartbeats,
+        })
+
+
+async def resume_stream(last_event_id: str) -> AsyncIterator[bytes]:
+    """
+    Replay the frames after `last_event_id` ("<stream id>:<seq>") from the resume
+    log. A stream that did not finish ends with an error event.
+    """
+    stream_id, _, seq = last_event_id.rpartition(":")
+    log = get_resume_log()
+    record = await log.get(stream_id) if log is not None and stream_id else None
+    update_log_context({"sse.stream_id": stream_id, "sse.resumed": record is not None})
+    if record is None:
+        yield serialization.sse_event({"error": "Unknown or expired stream, ask again"})
+        return
+    start = int(seq) if seq.isdigit() else 0
+    id_prefix = b"id: " + stream_id.encode() + b":"
+    for i, encoded in enumerate(record["frames"][start:], start=start + 1):
+        yield _frame(id_prefix, i, encoded.encode())
+    if not record["complete"]:
+        yield serialization.sse_event({"error": "The stream was interrupted before it finished, ask again"})
@@ -0,0 +1,160 @@
+"""
+Precomputed suggestions for the most common preference sets.
+
+Most home-screen loads repeat a small number of preference combinations. This
+job generates their suggestions ahead of time, so those loads are answered from
+the suggestions cache without a model call:
+
+    python -m app.suggestions_warm --input preferences.jsonl --top 500
+
+`--input` has one UserPreferences JSON object per line (e.g. an export of
+home-screen loads); an optional "count" field weights a line. Identical sets,
+after the same normalization as the cache key, are counted together, and the
+`--top` most frequent are generated, SUGGESTIONS_BATCH_CONCURRENCY at a time.
+`--top` is capped at RESPONSE_CACHE_SIZE, the most entries the cache keeps.
+Only suggestions that the cache would keep (built from complete SWAPI context)
+are written to SUGGESTIONS_WARM_PATH, which every worker loads into the
+suggestions cache at startup. With RESPONSE_CACHE_BACKEND=redis the job also
+fills the shared cache directly, so running workers are warm without a restart.
+Loaded entries expire SUGGESTIONS_CACHE_TTL seconds after they are put in the
+cache (at worker startup, or when the job fills redis), so run the job again
+within that time.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from app.clients.bedrock import close_async_bedrock, open_async_bedrock
+from app.config import settings
+from app.llm.suggestions import PROMPT_VERSION
+from app.models import UserPreferences
+from app.routes.suggestions import SUGGESTIONS_MODEL_ID, generate_many, get_suggestions_cache, preferences_key
+from app.tools import swapi, swapi_store
+
+logger = logging.getLogger(__name__)
+
+
+def read_preferences(path: str) -> Iterable[tuple]:
+    """(UserPreferences, count) per line of a JSON lines file."""
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            count = int(data.pop("count", 1))
+            yield UserPreferences(**data), count
+
+
+def most_common(lines: Iterable[tuple], top: int) -> Dict[str, UserPreferences]:
+    """The `top` most frequent preference sets, keyed by preferences_key."""
+    counts: Counter = Counter()
+    first: Dict[str, UserPreferences] = {}
+    for user_preferences, count in lines:
+        key = preferences_key(user_preferences)
+        counts[key] += count
+        first.setdefault(key, user_preferences)
+    return {key: first[key] for key, _ in counts.most_common(top)}
+
+
+async def precompute(preferences: Dict[str, UserPreferences]) -> Dict[str, str]:
+    """
+    Generate suggestions for `preferences` and return those the cache kept,
+    keyed by preferences_key. Sets already in a shared cache are not regenerated.
+    """
+    cache = get_suggestions_cache()
+    if cache is None:
+        raise RuntimeError("RESPONSE_CACHE_BACKEND is none; precomputed suggestions need a cache")
+    results = await generate_many(preferences)
+    for key, result in results.items():
+        if isinstance(result, BaseException):
+            logger.warning("Suggestions precompute failed", extra={"suggestions.key": key, "error": str(result)})
+    suggestions = {}
+    for key in preferences:
+        text = await cache.get(key)
+        if text is not None:
+            suggestions[key] = text
+    return suggestions
+
+
+def save(path: str, suggestions: Dict[str, str]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({
+            "model_id": SUGGESTIONS_MODEL_ID,
+            "prompt_version": PROMPT_VERSION,
+            "created_at": time.time(),
+            "suggestions": suggestions,
+        }, f)
+    os.replace(tmp, path)
+
+
+async def load_warm_suggestions(path: Optional[str] = None) -> int:
+    """
+    Put the precomputed suggestions file into the suggestions cache. A file made
+    for another model or prompt version is skipped. Returns the entries loaded.
+    """
+    path = path or settings.suggestions_warm_path
+    cache = get_suggestions_cache()
+    if cache is None or not os.path.exists(path):
+        return 0
+
+    def read():
+        with open(path) as f:
+            return json.load(f)
+
+    data = await asyncio.to_thread(read)
+    if data.get("model_id") != SUGGESTIONS_MODEL_ID or data.get("prompt_version") != PROMPT_VERSION:
+        logger.warning("Precomputed suggestions are stale, skipped", extra={
+            "suggestions.warm_path": path,
+            "suggestions.warm_prompt_version": data.get("prompt_version"),
+        })
+        return 0
+    suggestions = data.get("suggestions", {})
+    for key, text in suggestions.items():
+        await cache.set(key, text)
+    logger.info("Precomputed suggestions loaded", extra={
+        "suggestions.warm_path": path,
+        "suggestions.warm_entries": len(suggestions),
+    })
+    return len(suggestions)
+
+
+async def _main(args) -> None:
+    top = args.top
+    if top > settings.response_cache_size:
+        logger.warning("--top is larger than RESPONSE_CACHE_SIZE, capped", extra={
+            "suggestions.warm_top": top,
+            "suggestions.cache_size": settings.response_cache_size,
+        })
+        top = settings.response_cache_size
+    preferences = most_common(read_preferences(args.input), top)
+    swapi_store.load_snapshot()
+    await swapi.open_client()
+    await open_async_bedrock()
+    try:
+        suggestions = await precompute(preferences)
+    finally:
+        await swapi.close_client()
+        close_async_bedrock()
+    save(args.out, suggestions)
+    print(f"Saved suggestions for {len(suggestions)} of {len(preferences)} preference sets to {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Precompute suggestions for the most common preference sets",
+        epilog=f"Precomputed suggestions stay in the cache for SUGGESTIONS_CACHE_TTL "
+               f"({settings.suggestions_cache_ttl:g}s) after they are loaded; re-run the job within that time.",
+    )
+    parser.add_argument("--input", required=True, help="JSON lines of UserPreferences, with an optional count")
+    parser.add_argument("--top", type=int, default=500,
+                        help="preference sets to precompute, at most RESPONSE_CACHE_SIZE "
+                             f"({settings.response_cache_size})")
+    parser.add_argument("--out", default=settings.suggestions_warm_path)
+    asyncio.run(_main(parser.parse_args()))
@@ -1,65 +1,333 @@
+import asyncio
 import logging
-from typing import Dict, Any
+import random
+import time
+from typing import Awaitable, Callable, Dict, Any, List, Optional, Tuple
 
 import httpx
+import orjson
+
+from app import metrics
+from app.cache import AsyncTTLCache
+from app.config import settings
+from app.logger.config import update_log_context
+from app.tools import swapi_store
+from app.tracing import span
+from app.utils import CHARS_PER_TOKEN, RESOURCE_FIELDS, UNWANTED_KEYS, truncate_json
 
 logger = logging.getLogger(__name__)
 
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
 class ToolError(Exception):
     pass
 
-async def _get_json(client: httpx.AsyncClient, url: str) -> Dict[str, Any]:
-    try:
-        r = await client.get(url)
-        r.raise_for_status()
-        return r.json()
-    except httpx.HTTPStatusError as e:
-        raise ToolError(f"HTTP {e.response.status_code} from {url}") from e
-    except httpx.HTTPError as e:
-        raise ToolError(f"Network error calling {url}") from e
-    except ValueError as e:
-        raise ToolError(f"Invalid JSON from {url}") from e
-
-async def get_people_tool(args: Dict[str, Any], *, base_url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
-    q = (args.get("people") or "").strip()
-    if not q:
-        return {"error": "Missing required input: 'people'"}
-    # Ensure single slash and proper query
-    url = f"{base_url.rstrip('/')}/people/?search={q}"
-    data = await _get_json(client, url)
+ToolHandler = Callable[..., Awaitable[Dict[str, Any]]]
+
+# ---------- Shared connection pool ----------
+_client: Optional[httpx.AsyncClient] = None
+_stats = {"requests": 0, "retries": 0, "errors": 0, "in_flight": 0}
+search_cache = AsyncTTLCache("swapi.cache", maxsize=settings.swapi_cache_size, ttl=settings.swapi_cache_ttl)
+
+def create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=settings.swapi_http2,
+        timeout=httpx.Timeout(settings.swapi_timeout, connect=settings.swapi_connect_timeout),
+        limits=httpx.Limits(
+            max_connections=settings.swapi_max_connections,
+            max_keepalive_connections=settings.swapi_max_keepalive_connections,
+            keepalive_expiry=settings.swapi_keepalive_expiry,
+        ),
+        follow_redirects=True,
+    )
+
+async def open_client() -> httpx.AsyncClient:
+    """Create the application-scoped client. Called from the FastAPI lifespan."""
+    return get_client()
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_client() -> httpx.AsyncClient:
+    """Shared client for all SWAPI traffic; created lazily outside the app lifespan (scripts, benchmarks)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+def pool_stats() -> Dict[str, Any]:
+    """
+    Pool utilisation plus request/retry counters for the shared client. Counted
+    around our own requests rather than read from httpx internals; `queued` is
+    the requests beyond max_connections, which wait for a connection over HTTP/1.1.
+    """
     return {
-        "count": data.get("count", 0),
-        "results": data.get("results", []),
-        "next": data.get("next"),
-        "previous": data.get("previous"),
-        "query": q,
-        "resource": "people",
+        **_stats,
+        "max_connections": settings.swapi_max_connections,
+        "queued": max(0, _stats["in_flight"] - settings.swapi_max_connections),
     }
 
-async def get_starships_tool(args: Dict[str, Any], *, base_url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
-    q = (args.get("starships") or "").strip()
-    if not q:
-        return {"error": "Missing required input: 'starships'"}
-    url = f"{base_url.rstrip('/')}/starships/?search={q}"
-    data = await _get_json(client, url)
-    return {
-        "count": data.get("count", 0),
-        "results": data.get("results", []),
-        "next": data.get("next"),
-        "previous": data.get("previous"),
-        "query": q,
-        "resource": "starships",
+# ---------- HTTP helpers ----------
+async def _get_json(client: httpx.AsyncClient, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """GET with retry on transport errors and 429/5xx, using exponential backoff with jitter."""
+    attempts = settings.swapi_retries + 1
+    for attempt in range(attempts):
+        _stats["requests"] += 1
+        last = attempt == attempts - 1
+        try:
+            _stats["in_flight"] += 1
+            try:
+                r = await client.get(url, params=params)
+            finally:
+                _stats["in_flight"] -= 1
+            if r.status_code in RETRYABLE_STATUS and not last:
+                raise httpx.HTTPStatusError("retryable status", request=r.request, response=r)
+            r.raise_for_status()
+            return r.json()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in RETRYABLE_STATUS or last:
+                _stats["errors"] += 1
+                raise ToolError(f"HTTP {e.response.status_code} from {url}") from e
+        except httpx.TransportError as e:
+            if last:
+                _stats["errors"] += 1
+                raise ToolError(f"Network error calling {url}") from e
+        except httpx.HTTPError as e:
+            _stats["errors"] += 1
+            raise ToolError(f"Network error calling {url}") from e
+        except ValueError as e:
+            _stats["errors"] += 1
+            raise ToolError(f"Invalid JSON from {url}") from e
+
+        _stats["retries"] += 1
+        backoff = settings.swapi_retry_backoff * (2 ** attempt)
+        await asyncio.sleep(backoff + random.uniform(0, backoff))
+    raise ToolError(f"Retries exhausted calling {url}")
+
+async def search(resource: str, query: str, *, base_url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+    """
+    SWAPI `?search=` response for one resource. Served from the local snapshot when
+    one is loaded, so the lookup never leaves the process; otherwise live responses
+    are cached per normalized (resource, query) and concurrent misses share one request.
+    """
+    store = swapi_store.get_store()
+    if store is not None and store.has(resource):
+        with span("swapi.search", resource=resource, source="snapshot"):
+            return store.search_response(resource, query)
+
+    key = (resource, " ".join(query.lower().split()))
+    try:
+        with span("swapi.search", resource=resource, source="swapi"):
+            return await search_cache.get_or_load(
+                key,
+                lambda: _get_json(client, f"{base_url.rstrip('/')}/{resource}/", params={"search": query}),
+            )
+    finally:
+        update_log_context(search_cache.stats())
+
+# ---------- Tool result compaction ----------
+# values that carry no information for the model
+EMPTY_VALUES = ("", "n/a", None)
+REFERENCE_SKIP_FIELDS = ("opening_crawl",)
+
+def _is_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith("http") and "/api/" in value
+
+def _ref_name(url: str, store: Optional["swapi_store.SwapiStore"]) -> str:
+    """
+    The referenced record's name, from the snapshot or a record already in the
+    SWAPI cache; else its short id ("planets/1"), so the reference isn't lost.
+    """
+    item = store.get(url) if store is not None else None
+    if item is None:
+        item = search_cache.get(("record", url))
+    name = (item.get("name") or item.get("title")) if isinstance(item, dict) else None
+    return name or url.split("/api/", 1)[-1].strip("/")
+
+def compact_record(record: Dict[str, Any], resource: Optional[str], *, skip: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """
+    Keep the resource's relevant fields, replace SWAPI URL references with the
+    referenced names when known (local snapshot, SWAPI cache) or short ids, and
+    drop empty values and bookkeeping fields.
+    """
+    store = swapi_store.get_store()
+    out: Dict[str, Any] = {}
+    for field in RESOURCE_FIELDS.get(resource, tuple(record)):
+        value = record.get(field)
+        if field in UNWANTED_KEYS or field in skip or value in EMPTY_VALUES or value == []:
+            continue
+        if _is_ref(value):
+            value = _ref_name(value, store)
+        elif isinstance(value, list) and all(_is_ref(v) for v in value):
+            value = [_ref_name(v, store) for v in value]
+        if value not in EMPTY_VALUES and value != []:
+            out[field] = value
+    return out
+
+def compact_tool_result(res_obj: Any) -> str:
+    """
+    Encode a tool result for the model: at most TOOL_RESULT_MAX_RESULTS compacted
+    records, no pagination links, bounded by TOOL_RESULT_TOKEN_BUDGET. The whole
+    transcript is re-sent on every tool round, so every byte saved here is saved
+    once per remaining round.
+    """
+    if isinstance(res_obj, str):
+        return res_obj
+    if not isinstance(res_obj, dict) or not isinstance(res_obj.get("results"), list):
+        return orjson.dumps(res_obj).decode()
+    resource = res_obj.get("resource")
+    results = res_obj["results"]
+    compact = {
+        "resource": resource,
+        "query": res_obj.get("query"),
+        "count": res_obj.get("count", len(results)),
+        "results": [compact_record(r, resource) for r in results[:settings.tool_result_max_results]],
     }
+    if res_obj.get("references"):
+        # referenced records are context for the main one: long texts are left out
+        compact["references"] = {
+            ref_resource: [compact_record(r, ref_resource, skip=REFERENCE_SKIP_FIELDS) for r in records]
+            for ref_resource, records in res_obj["references"].items()
+        }
+    if res_obj.get("unresolved_references"):
+        compact["unresolved_references"] = res_obj["unresolved_references"]
+    budget = settings.tool_resolve_token_budget if "references" in compact else settings.tool_result_token_budget
+    return truncate_json(compact, limit=budget * CHARS_PER_TOKEN)
 
-async def run_tool(name: str, args: Dict[str, Any], *, base_url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+# ---------- Tools ----------
+# search tools: tool name -> SWAPI resource; each takes the resource name as its input key
+SEARCH_TOOLS = {
+    "getPeople": "people",
+    "getPlanets": "planets",
+    "getFilms": "films",
+    "getSpecies": "species",
+    "getVehicles": "vehicles",
+    "getStarships": "starships",
+}
+# records reference each other by their swapi.dev URL, whatever SW_API_BASE points to
+CANONICAL_BASES = ("https://swapi.dev/api/", "http://swapi.dev/api/")
+
+def search_tool(resource: str) -> ToolHandler:
+    async def tool(args: Dict[str, Any], *, base_url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+        q = (args.get(resource) or "").strip()
+        if not q:
+            return {"error": f"Missing required input: '{resource}'"}
+        data = await search(resource, q, base_url=base_url, client=client)
+        return {
+            "count": data.get("count", 0),
+            "results": data.get("results", []),
+            "next": data.get("next"),
+            "previous": data.get("previous"),
+            "query": q,
+            "resource": resource,
+        }
+    return tool
+
+def resource_of(url: str) -> Optional[str]:
+    """SWAPI resource of a record URL (".../api/people/1/" -> "people")."""
+    parts = url.split("/api/", 1)[-1].strip("/").split("/")
+    return parts[0] if parts and parts[0] in swapi_store.RESOURCES else None
+
+def _local_url(url: str, base_url: str) -> Optional[str]:
+    """The record URL on the configured SWAPI base; None for anything that isn't a SWAPI URL."""
+    for prefix in (*CANONICAL_BASES, base_url):
+        if url.startswith(prefix):
+            return base_url.rstrip("/") + "/" + url[len(prefix):].lstrip("/")
+    return None
+
+async def fetch_record(url: str, *, base_url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+    """One record by URL: from the snapshot when loaded, else fetched and cached like searches."""
+    store = swapi_store.get_store()
+    item = store.get(url) if store is not None else None
+    if item is not None:
+        return item
+    local = _local_url(url, base_url)
+    if local is None:
+        raise ToolError(f"Not a SWAPI URL: {url}")
     try:
-        if name == "getPeople":
-            return await get_people_tool(args, base_url=base_url, client=client)
-        if name == "getStarships":
-            return await get_starships_tool(args, base_url=base_url, client=client)
+        with span("swapi.get", resource=resource_of(url)):
+            return await search_cache.get_or_load(("record", url), lambda: _get_json(client, local))
+    finally:
+        update_log_context(search_cache.stats())
+
+async def resolve_references_tool(args: Dict[str, Any], *, base_url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+    """
+    Look up one record and expand the records it references (a person's homeworld,
+    films, starships, ...) in the same call. References are deduplicated and
+    fetched concurrently, at most TOOL_RESOLVE_MAX_REFS per call.
+    """
+    resource = (args.get("resource") or "").strip()
+    name = (args.get("name") or "").strip()
+    if resource not in swapi_store.RESOURCES:
+        return {"error": f"Unknown resource: '{resource}'"}
+    if not name:
+        return {"error": "Missing required input: 'name'"}
+    data = await search(resource, name, base_url=base_url, client=client)
+    results = data.get("results") or []
+    if not results:
+        return {"count": 0, "results": [], "query": name, "resource": resource}
+    record = results[0]
+
+    fields = args.get("fields")
+    urls: List[str] = []
+    for field in fields if isinstance(fields, list) and fields else RESOURCE_FIELDS.get(resource, ()):
+        value = record.get(field)
+        if _is_ref(value):
+            urls.append(value)
+        elif isinstance(value, list) and all(_is_ref(v) for v in value):
+            urls.extend(value)
+    urls = list(dict.fromkeys(urls))
+    skipped = urls[settings.tool_resolve_max_refs:]
+    urls = urls[:settings.tool_resolve_max_refs]
+
+    with span("swapi.resolve", resource=resource, refs=len(urls)):
+        fetched = await asyncio.gather(
+            *(fetch_record(url, base_url=base_url, client=client) for url in urls), return_exceptions=True,
+        )
+    by_url = {url: item for url, item in zip(urls, fetched) if isinstance(item, dict)}
+    references: Dict[str, List[Dict[str, Any]]] = {}
+    for url in urls:
+        if url in by_url:
+            references.setdefault(resource_of(url) or "other", []).append(by_url[url])
+    result = {
+        "count": 1,
+        "results": [record],
+        "query": name,
+        "resource": resource,
+        # keyed by resource, like a search result, so each group is projected to its fields
+        "references": references,
+    }
+    unresolved = len(urls) - len(by_url) + len(skipped)
+    if unresolved:
+        result["unresolved_references"] = unresolved
+    return result
+
+TOOL_HANDLERS: Dict[str, ToolHandler] = {
+    **{name: search_tool(resource) for name, resource in SEARCH_TOOLS.items()},
+    "resolveReferences": resolve_references_tool,
+}
+TOOL_NAMES = tuple(TOOL_HANDLERS)
+
+async def run_tool(name: str, args: Dict[str, Any], *, base_url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+    start = time.perf_counter()
+    result = await _run_tool(name, args, base_url=base_url, client=client)
+    # names come from the model; unknown ones share one label
+    label = name if name in TOOL_HANDLERS else "unsupported"
+    metrics.tool_calls.labels(label, "error" if "error" in result else "ok").inc()
+    metrics.tool_duration.labels(label).observe(time.perf_counter() - start)
+    return result
+
+async def _run_tool(name: str, args: Dict[str, Any], *, base_url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+    handler = TOOL_HANDLERS.get(name)
+    if handler is None:
         return {"error": f"Unsupported tool: {name}"}
+    try:
+        return await handler(args, base_url=base_url, client=client)
     except ToolError as e:
         return {"error": str(e)}
     except Exception as e:
         logger.exception("Tool failed")
-        return {"error": f"Tool '{name}' failed: {e}"}
\ No newline at end of file
+        return {"error": f"Tool '{name}' failed: {e}"}
@@ -0,0 +1,209 @@
+"""
+In-memory mirror of the SWAPI dataset.
+
+SWAPI is small and static (a few hundred records across six resources), so the
+whole thing is loaded once from a snapshot file and searched locally. Lookups
+follow SWAPI `?search=` semantics (case-insensitive substring match on the
+resource's search fields) but are answered from an inverted n-gram index
+instead of a network round-trip.
+
+Build or refresh a snapshot with:
+
+    python -m app.tools.swapi_store --out data/swapi_snapshot.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+RESOURCES = ("people", "planets", "films", "species", "vehicles", "starships")
+SEARCH_FIELDS = {
+    "people": ("name",),
+    "planets": ("name",),
+    "films": ("title",),
+    "species": ("name",),
+    "vehicles": ("name", "model"),
+    "starships": ("name", "model"),
+}
+GRAM = 3
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _grams(token: str) -> Set[str]:
+    """Every n-gram of length <= GRAM, so any substring of a token can be looked up."""
+    return {token[i:i + n] for n in range(1, GRAM + 1) for i in range(len(token) - n + 1)}
+
+
+def _query_grams(token: str) -> Iterable[str]:
+    if len(token) <= GRAM:
+        return (token,)
+    return (token[i:i + GRAM] for i in range(len(token) - GRAM + 1))
+
+
+class SwapiStore:
+    def __init__(self, records: Dict[str, List[Dict[str, Any]]], fetched_at: Optional[float] = None):
+        self.records = {r: list(records.get(r, [])) for r in RESOURCES if r in records}
+        self.fetched_at = fetched_at
+        self._by_url: Dict[str, Dict[str, Any]] = {}
+        self._haystacks: Dict[str, List[str]] = {}
+        self._index: Dict[str, Dict[str, Set[int]]] = {}
+        for resource, items in self.records.items():
+            fields = SEARCH_FIELDS[resource]
+            haystacks = []
+            index: Dict[str, Set[int]] = {}
+            for i, item in enumerate(items):
+                if item.get("url"):
+                    self._by_url[item["url"]] = item
+                text = " ".join(str(item.get(f) or "") for f in fields).lower()
+                haystacks.append(text)
+                for token in _tokens(text):
+                    for gram in _grams(token):
+                        index.setdefault(gram, set()).add(i)
+            self._haystacks[resource] = haystacks
+            self._index[resource] = index
+
+    def has(self, resource: str) -> bool:
+        return resource in self.records
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        return self._by_url.get(url)
+
+    def search(self, resource: str, query: str) -> List[Dict[str, Any]]:
+        items = self.records.get(resource, [])
+        needle = query.strip().lower()
+        if not needle:
+            return list(items)
+        haystacks = self._haystacks[resource]
+        candidates = self._candidates(resource, _tokens(needle))
+        if candidates is None:
+            # punctuation-only query: nothing to look up, scan (the dataset is tiny)
+            candidates = set(range(len(items)))
+        # the index narrows candidates; the substring check keeps SWAPI's exact semantics
+        return [items[i] for i in sorted(candidates) if needle in haystacks[i]]
+
+    def _candidates(self, resource: str, tokens: List[str]) -> Optional[Set[int]]:
+        if not tokens:
+            return None
+        index = self._index[resource]
+        result: Optional[Set[int]] = None
+        for token in tokens:
+            for gram in _query_grams(token):
+                ids = index.get(gram)
+                if not ids:
+                    return set()
+                result = set(ids) if result is None else result & ids
+        return result
+
+    def search_response(self, resource: str, query: str) -> Dict[str, Any]:
+        """Same shape as a SWAPI `?search=` response, with every match on one page."""
+        results = self.search(resource, query)
+        return {"count": len(results), "next": None, "previous": None, "results": results}
+
+    # ---------- Snapshot I/O ----------
+    @classmethod
+    def load(cls, path: str) -> "SwapiStore":
+        with open(path, "rb") as f:
+            data = json.load(f)
+        return cls(data["resources"], fetched_at=data.get("fetched_at"))
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"fetched_at": self.fetched_at, "resources": self.records}, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    async def fetch(cls, client: httpx.AsyncClient, base_url: str) -> "SwapiStore":
+        """Download every page of every resource."""
+        async def fetch_resource(resource: str) -> List[Dict[str, Any]]:
+            items: List[Dict[str, Any]] = []
+            url: Optional[str] = f"{base_url.rstrip('/')}/{resource}/"
+            while url:
+                r = await client.get(url)
+                r.raise_for_status()
+                page = r.json()
+                items.extend(page.get("results", []))
+                url = page.get("next")
+            return items
+
+        lists = await asyncio.gather(*(fetch_resource(r) for r in RESOURCES))
+        return cls(dict(zip(RESOURCES, lists)), fetched_at=time.time())
+
+
+# ---------- Process-wide store ----------
+_store: Optional[SwapiStore] = None
+
+
+def get_store() -> Optional[SwapiStore]:
+    return _store
+
+
+def set_store(store: Optional[SwapiStore]) -> None:
+    global _store
+    _store = store
+
+
+def load_snapshot(path: Optional[str] = None) -> Optional[SwapiStore]:
+    """Load the snapshot from disk if present; the app falls back to live SWAPI otherwise."""
+    path = path or settings.swapi_snapshot_path
+    if not os.path.exists(path):
+        logger.info("SWAPI snapshot not found, using live SWAPI", extra={"swapi.snapshot_path": path})
+        return None
+    store = SwapiStore.load(path)
+    set_store(store)
+    logger.info("SWAPI snapshot loaded", extra={
+        "swapi.snapshot_path": path,
+        "swapi.snapshot_records": sum(len(v) for v in store.records.values()),
+        "swapi.snapshot_fetched_at": store.fetched_at,
+    })
+    return store
+
+
+async def refresh_periodically(client: httpx.AsyncClient, interval: float, path: Optional[str] = None) -> None:
+    """Background task: re-download the dataset every `interval` seconds and swap it in."""
+    path = path or settings.swapi_snapshot_path
+    # fetch right away only when there is no snapshot to serve from yet
+    delay = interval if get_store() is not None else 0
+    while True:
+        await asyncio.sleep(delay)
+        delay = interval
+        try:
+            store = await SwapiStore.fetch(client, settings.sw_api_base)
+            set_store(store)
+            await asyncio.to_thread(store.save, path)
+            logger.info("SWAPI snapshot refreshed", extra={
+                "swapi.snapshot_records": sum(len(v) for v in store.records.values()),
+            })
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("SWAPI snapshot refresh failed")
+
+
+async def _main(out: str) -> None:
+    async with httpx.AsyncClient(timeout=30.0, follow_redirects=True) as client:
+        store = await SwapiStore.fetch(client, settings.sw_api_base)
+    store.save(out)
+    print(f"Saved {sum(len(v) for v in store.records.values())} records to {out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download the SWAPI dataset into a local snapshot file")
+    parser.add_argument("--out", default=settings.swapi_snapshot_path)
+    asyncio.run(_main(parser.parse_args().out))
@@ -0,0 +1,231 @@
+"""
+Request-scoped latency spans.
+
+The HTTP middleware opens a Trace per request; `span(name)` times a block of
+work inside it (Bedrock calls, tool rounds, SWAPI fetches). Per-name totals
+are merged into the request log context as `span.<name>.count/ms/max_ms`, and
+finished traces can be exported as OTLP/JSON to a file or a local collector.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+import orjson
+
+from app.config import settings
+from app.logger.config import update_log_context
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "star-wars-chatbot-api"
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    parent_id: Optional[str] = None
+    span_id: str = field(default_factory=lambda: _new_id(8))
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+
+@dataclass
+class Trace:
+    """Spans of one request; `root` covers the request until its body is fully sent."""
+    root: Span
+    spans: List[Span] = field(default_factory=list)
+    # per span name: [count, total ms, max ms]
+    totals: Dict[str, List[float]] = field(default_factory=dict)
+
+    @classmethod
+    def start(cls, name: str, **attributes: Any) -> "Trace":
+        return cls(root=Span(name, trace_id=_new_id(16), attributes=attributes))
+
+    def add(self, s: Span) -> None:
+        self.spans.append(s)
+        count, total, peak = self.totals.get(s.name, (0, 0.0, 0.0))
+        ms = s.duration_ms
+        self.totals[s.name] = [count + 1, total + ms, max(peak, ms)]
+        update_log_context({
+            f"span.{s.name}.count": count + 1,
+            f"span.{s.name}.ms": round(total + ms, 2),
+            f"span.{s.name}.max_ms": round(max(peak, ms), 2),
+        })
+
+    def finish(self, **attributes: Any) -> None:
+        self.root.attributes.update(attributes)
+        self.root.end_ns = time.time_ns()
+        export(self)
+
+
+request_trace: ContextVar[Optional[Trace]] = ContextVar("request_trace", default=None)
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Time the enclosed block as a child of the current span. Yields the Span so
+    callers can add attributes (None outside a request, where nothing is recorded).
+    """
+    trace = request_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = current_span.get() or trace.root
+    s = Span(name, trace_id=trace.root.trace_id, parent_id=parent.span_id, attributes=attributes)
+    current_span.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.end_ns = time.time_ns()
+        # set, not reset: async generators may be closed from another context
+        current_span.set(parent)
+        trace.add(s)
+
+
+# ---------- OTLP/JSON export ----------
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _otlp_span(s: Span) -> Dict[str, Any]:
+    out = {
+        "traceId": s.trace_id,
+        "spanId": s.span_id,
+        "name": s.name,
+        "kind": 2 if s.parent_id is None else 1,  # SERVER for the request, INTERNAL otherwise
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns or s.start_ns),
+        "attributes": [_attribute(k, v) for k, v in s.attributes.items()],
+        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+    }
+    if s.parent_id is not None:
+        out["parentSpanId"] = s.parent_id
+    return out
+
+
+def to_otlp(traces: List[Trace]) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest for a batch of finished traces."""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", SERVICE_NAME),
+                                    _attribute("deployment.environment", settings.env)]},
+        "scopeSpans": [{
+            "scope": {"name": "app.tracing"},
+            "spans": [_otlp_span(s) for t in traces for s in (t.root, *t.spans)],
+        }],
+    }]}
+
+
+class TraceExporter:
+    """
+    Ships finished traces from a background thread, in batches, so exporting never
+    runs on the request path. `target` is "file" (one OTLP/JSON request per line
+    appended to TRACE_EXPORT_PATH) or "otlp" (POST to an OTLP/HTTP collector).
+    A full queue drops traces.
+    """
+
+    def __init__(self, target: str, *, path: str, endpoint: str, maxsize: int = 1000, batch_size: int = 64):
+        self.target = target
+        self.path = path
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces"
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Trace]]" = queue.Queue(maxsize)
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, trace: Trace) -> None:
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        with httpx.Client(timeout=5.0) as http:
+            while True:
+                first = self._queue.get()
+                batch = [first] if first is not None else []
+                while first is not None and len(batch) < self.batch_size:
+                    try:
+                        nxt = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is None:
+                        first = None
+                        break
+                    batch.append(nxt)
+                if batch:
+                    try:
+                        self._write(http, orjson.dumps(to_otlp(batch)))
+                    except Exception:
+                        logger.warning("Trace export failed", exc_info=True)
+                if first is None:
+                    return
+
+    def _write(self, http: httpx.Client, body: bytes) -> None:
+        if self.target == "file":
+            with open(self.path, "ab") as f:
+                f.write(body + b"\n")
+        else:
+            http.post(self.endpoint, content=body, headers={"Content-Type": "application/json"}).raise_for_status()
+
+
+_exporter: Optional[TraceExporter] = None
+
+
+def start_exporter() -> Optional[TraceExporter]:
+    """Start the exporter configured by TRACE_EXPORT (none | file | otlp)."""
+    global _exporter
+    if settings.trace_export == "none":
+        return None
+    if settings.trace_export not in ("file", "otlp"):
+        raise ValueError(f"Unknown TRACE_EXPORT target: {settings.trace_export}")
+    if _exporter is None:
+        _exporter = TraceExporter(settings.trace_export, path=settings.trace_export_path,
+                                  endpoint=settings.trace_otlp_endpoint)
+    return _exporter
+
+
+def stop_exporter() -> None:
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+
+
+def export(trace: Trace) -> None:
+    if _exporter is not None:
+        _exporter.submit(trace)
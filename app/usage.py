@@ -0,0 +1,158 @@
+"""
+Bedrock token and cost accounting.
+
+Counts come from the `usage` blocks Bedrock returns (invoke_model responses,
+and message_start/message_delta events on streams), are priced with a
+per-model table, and are aggregated per request across every model call
+(all tool rounds of a turn, retries, fallbacks).
+"""
+import logging
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from app import metrics
+from app.config import settings
+from app.logger.config import update_log_context
+
+logger = logging.getLogger(__name__)
+
+# USD per 1K tokens. Prompt-cache reads bill at 10% and writes at 125% of input.
+DEFAULT_PRICING: Dict[str, Dict[str, float]] = {
+    "anthropic.claude-3-5-sonnet-20240620-v1:0": {"input": 0.003, "output": 0.015, "cache_read": 0.0003, "cache_write": 0.00375},
+    "anthropic.claude-3-5-sonnet-20241022-v2:0": {"input": 0.003, "output": 0.015, "cache_read": 0.0003, "cache_write": 0.00375},
+    "anthropic.claude-3-7-sonnet-20250219-v1:0": {"input": 0.003, "output": 0.015, "cache_read": 0.0003, "cache_write": 0.00375},
+    "anthropic.claude-3-5-haiku-20241022-v1:0": {"input": 0.0008, "output": 0.004, "cache_read": 0.00008, "cache_write": 0.001},
+    "anthropic.claude-3-haiku-20240307-v1:0": {"input": 0.00025, "output": 0.00125, "cache_read": 0.00003, "cache_write": 0.0003},
+}
+# cross-region inference profiles prefix the model id with a geography
+INFERENCE_PROFILE_PREFIXES = ("us.", "eu.", "apac.")
+
+
+def price_for(model_id: str) -> Dict[str, float]:
+    """Pricing for a model id; BEDROCK_PRICING entries override the defaults."""
+    table = {**DEFAULT_PRICING, **settings.bedrock_pricing}
+    if model_id in table:
+        return table[model_id]
+    for prefix in INFERENCE_PROFILE_PREFIXES:
+        if model_id.startswith(prefix) and model_id[len(prefix):] in table:
+            return table[model_id[len(prefix):]]
+    return table.get(settings.bedrock_model_id, DEFAULT_PRICING["anthropic.claude-3-5-sonnet-20240620-v1:0"])
+
+
+@dataclass
+class Usage:
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    def add(self, usage: Optional[Dict[str, Any]]) -> None:
+        """Add one call's Anthropic `usage` block."""
+        usage = usage or {}
+        self.calls += 1
+        self.input_tokens += usage.get("input_tokens") or 0
+        self.output_tokens += usage.get("output_tokens") or 0
+        self.cache_read_tokens += usage.get("cache_read_input_tokens") or 0
+        self.cache_write_tokens += usage.get("cache_creation_input_tokens") or 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens + self.cache_read_tokens + self.cache_write_tokens
+
+    def costs(self, model_id: str) -> Dict[str, float]:
+        price = price_for(model_id)
+        cost_input = self.input_tokens / 1000 * price["input"]
+        cost_cache = (self.cache_read_tokens / 1000 * price["cache_read"]
+                      + self.cache_write_tokens / 1000 * price["cache_write"])
+        cost_output = self.output_tokens / 1000 * price["output"]
+        return {
+            "input": cost_input,
+            "cache": cost_cache,
+            "output": cost_output,
+            "total": cost_input + cost_cache + cost_output,
+        }
+
+
+@dataclass
+class RequestUsage:
+    """Usage of every Bedrock call made while serving one request, per model id."""
+    by_model: Dict[str, Usage] = field(default_factory=dict)
+
+    def record(self, model_id: str, usage: Optional[Dict[str, Any]]) -> None:
+        self.by_model.setdefault(model_id, Usage()).add(usage)
+
+    def total(self) -> Usage:
+        total = Usage()
+        for u in self.by_model.values():
+            total.calls += u.calls
+            total.input_tokens += u.input_tokens
+            total.output_tokens += u.output_tokens
+            total.cache_read_tokens += u.cache_read_tokens
+            total.cache_write_tokens += u.cache_write_tokens
+        return total
+
+    def calls_by_model(self) -> Dict[str, int]:
+        return {model_id: u.calls for model_id, u in self.by_model.items()}
+
+    def log_fields(self, call_type: str) -> Dict[str, Any]:
+        total = self.total()
+        costs = {"input": 0.0, "cache": 0.0, "output": 0.0, "total": 0.0}
+        for model_id, u in self.by_model.items():
+            for k, v in u.costs(model_id).items():
+                costs[k] += v
+        return {
+            "bedrock.model_id": ",".join(self.by_model) or settings.bedrock_model_id,
+            "bedrock.call_type": call_type,
+            "bedrock.usage_source": "response",
+            "bedrock.calls": total.calls,
+            "bedrock.tokens_input": total.input_tokens,
+            "bedrock.tokens_output": total.output_tokens,
+            "bedrock.cache_read_tokens": total.cache_read_tokens,
+            "bedrock.cache_write_tokens": total.cache_write_tokens,
+            "bedrock.total_tokens": total.total_tokens,
+            "bedrock.estimated_cost": round(costs["total"], 6),
+            "bedrock.estimated_input_cost": round(costs["input"], 6),
+            "bedrock.estimated_cache_cost": round(costs["cache"], 6),
+            "bedrock.estimated_output_cost": round(costs["output"], 6),
+        }
+
+
+request_usage: ContextVar[Optional[RequestUsage]] = ContextVar("request_usage", default=None)
+
+
+def record_usage(model_id: str, usage: Optional[Dict[str, Any]]) -> None:
+    """Called by the Bedrock client after every call; no-op outside a request."""
+    current = request_usage.get()
+    if current is not None:
+        current.record(model_id, usage)
+
+
+def log_request_usage(call_type: str) -> Optional[Dict[str, Any]]:
+    """
+    Log the request's aggregated usage and add its totals to the request log
+    context. Returns the logged fields (None outside a request).
+    """
+    current = request_usage.get()
+    if current is None:
+        return None
+    fields = current.log_fields(call_type)
+    logger.info("Bedrock usage", extra=fields)
+    if current.by_model:
+        metrics.record_request_usage(call_type, fields, current.calls_by_model())
+    update_log_context({k: fields[k] for k in ("bedrock.calls", "bedrock.total_tokens", "bedrock.estimated_cost")})
+    return fields
+
+
+def log_late_usage(model_id: str, usage: Optional[Dict[str, Any]]) -> None:
+    """
+    Log and count one call that finished after its request stopped waiting for
+    it (a cancelled invoke_model runs to the end on its pool thread), under the
+    call type "cancelled". The request's own usage was logged without it.
+    """
+    late = RequestUsage()
+    late.record(model_id, usage)
+    fields = late.log_fields("cancelled")
+    logger.info("Bedrock usage after cancellation", extra=fields)
+    metrics.record_request_usage("cancelled", fields, late.calls_by_model())
@@ -1,56 +1,165 @@
+from functools import lru_cache
+
 import orjson
 from app.config import settings
+from app.usage import Usage
 
 UNWANTED_KEYS = {"created", "edited", "url"}
 
-def truncate_json(obj, limit=3000):
-    cleaned = remove_keys_recursively(obj, UNWANTED_KEYS)
-    raw = orjson.dumps(cleaned)
-    if len(raw) <= limit:
-        return raw.decode()
-    return raw[:limit].decode("utf-8", errors="ignore")
+# Fields kept for each record in a SWAPI `results` list; everything else is dropped.
+RESOURCE_FIELDS = {
+    "people": ("name", "height", "mass", "hair_color", "skin_color", "eye_color", "birth_year", "gender",
+               "homeworld", "films", "species", "vehicles", "starships"),
+    "planets": ("name", "rotation_period", "orbital_period", "diameter", "climate", "gravity", "terrain",
+                "surface_water", "population", "residents", "films"),
+    "films": ("title", "episode_id", "director", "producer", "release_date", "opening_crawl",
+              "characters", "planets", "starships", "vehicles", "species"),
+    "species": ("name", "classification", "designation", "average_height", "skin_colors", "hair_colors",
+                "eye_colors", "average_lifespan", "homeworld", "language", "people", "films"),
+    "vehicles": ("name", "model", "manufacturer", "cost_in_credits", "length", "max_atmosphering_speed",
+                 "crew", "passengers", "cargo_capacity", "consumables", "vehicle_class", "pilots", "films"),
+    "starships": ("name", "model", "manufacturer", "cost_in_credits", "length", "max_atmosphering_speed",
+                  "crew", "passengers", "cargo_capacity", "consumables", "hyperdrive_rating", "MGLT",
+                  "starship_class", "pilots", "films"),
+}
 
-def remove_keys_recursively(obj, keys_to_remove):
+def truncate_json(obj, limit=3000):
     """
-    Recursively remove keys from dictionaries and lists.
+    Serialize obj to at most `limit` bytes of valid JSON.
+
+    Unwanted keys are skipped and records inside a SWAPI `results` list are
+    projected to their resource's RESOURCE_FIELDS while encoding, and output
+    stops at the first value that no longer fits, so oversized payloads are
+    never fully serialized. Containers are closed properly instead of being
+    cut mid-token. A limit below 2 is raised to 2, the size of an empty
+    container, and a bare scalar that doesn't fit becomes `null`.
     """
+    encoded = _encode_budgeted(obj, max(limit, 2), _BudgetState(), resource=None, record=False)
+    return encoded.decode() if encoded is not None else "null"
+
+_CONTAINERS = (dict, list)
+
+@lru_cache(maxsize=1024)
+def _key_bytes(k):
+    return orjson.dumps(k) + b":"
+
+class _BudgetState:
+    __slots__ = ("exhausted",)
+
+    def __init__(self):
+        self.exhausted = False
+
+def _encode_budgeted(obj, budget, state, *, resource, record):
+    """Encode obj in at most `budget` bytes, or return None (and mark the budget exhausted) if it can't fit."""
     if isinstance(obj, dict):
-        return {
-            k: remove_keys_recursively(v, keys_to_remove)
-            for k, v in obj.items()
-            if k not in keys_to_remove
-        }
-    elif isinstance(obj, list):
-        return [remove_keys_recursively(item, keys_to_remove) for item in obj]
-    else:
-        return obj
+        if budget < 2:
+            state.exhausted = True
+            return None
+        if isinstance(obj.get("resource"), str):
+            resource = obj["resource"]
+        fields = RESOURCE_FIELDS.get(resource) if record else None
+        keys = [k for k in (fields if fields is not None else obj) if k in obj and k not in UNWANTED_KEYS]
 
+        # fast path: projected SWAPI record fields are scalars or URL lists, so a record
+        # that fits is encoded in one call
+        if fields is not None:
+            encoded = orjson.dumps({k: obj[k] for k in keys})
+            if len(encoded) <= budget:
+                return encoded
 
+        parts = [b"{"]
+        used = 2
+        for k in keys:
+            key = _key_bytes(k)
+            sep = 1 if len(parts) > 1 else 0
+            room = budget - used - sep - len(key)
+            child_resource = k if k in RESOURCE_FIELDS else resource
+            value = _encode_budgeted(obj[k], room, state, resource=child_resource, record=False) if room > 0 else None
+            if value is None:
+                state.exhausted = True
+                break
+            if sep:
+                parts.append(b",")
+            parts.append(key)
+            parts.append(value)
+            used += sep + len(key) + len(value)
+            if state.exhausted:
+                break
+        parts.append(b"}")
+        return b"".join(parts)
+
+    if isinstance(obj, list):
+        if budget < 2:
+            state.exhausted = True
+            return None
+        # items of a list under a resource are SWAPI records (e.g. the `results` of a search)
+        items_are_records = resource is not None and not record
+        if not any(isinstance(item, _CONTAINERS) for item in obj):
+            encoded = orjson.dumps(obj)
+            if len(encoded) <= budget:
+                return encoded
+
+        parts = [b"["]
+        used = 2
+        for item in obj:
+            sep = 1 if len(parts) > 1 else 0
+            room = budget - used - sep
+            value = _encode_budgeted(item, room, state, resource=resource, record=items_are_records) if room > 0 else None
+            if value is None:
+                state.exhausted = True
+                break
+            if sep:
+                parts.append(b",")
+            parts.append(value)
+            used += sep + len(value)
+            if state.exhausted:
+                break
+        parts.append(b"]")
+        return b"".join(parts)
+
+    value = orjson.dumps(obj)
+    if len(value) > budget:
+        state.exhausted = True
+        return None
+    return value
+
+
+CHARS_PER_TOKEN = 4
 
 def estimate_tokens(text: str) -> int:
     """rough token estimation (1 token ≈ 4 characters)."""
-    return int(len(text) / 4)
+    return int(len(text) / CHARS_PER_TOKEN)
 
 
-def get_bedrock_usage(model_id, input_text, output_text, call_type):
-    tokens_input = estimate_tokens(input_text)
-    tokens_output = estimate_tokens(output_text)
-    total_tokens = tokens_input + tokens_output
-
-    # Claude Sonnet 3.5 pricing
-    cost_input = (tokens_input / 1000) * 0.003
-    cost_output = (tokens_output / 1000) * 0.015
-    total_cost = cost_input + cost_output
+def get_bedrock_usage(model_id, input_text, output_text, call_type, usage=None):
+    """
+    Token counts and cost for one Bedrock call, priced with the per-model table in
+    app.usage. When the response `usage` block is given its counts are used
+    (including prompt-cache reads and writes); otherwise tokens are estimated
+    from the text. Prompts and completions are not part of the result; see
+    app.logger.config.log_payload.
+    """
+    counted = Usage()
+    if usage:
+        counted.add(usage)
+    else:
+        counted.add({
+            "input_tokens": estimate_tokens(input_text),
+            "output_tokens": estimate_tokens(output_text),
+        })
+    costs = counted.costs(model_id)
 
     return {
         "bedrock.model_id": model_id,
         "bedrock.call_type": call_type,
-        "bedrock.tokens_input": tokens_input,
-        "bedrock.tokens_output": tokens_output,
-        "bedrock.total_tokens": total_tokens,
-        "bedrock.estimated_cost": round(total_cost, 6),
-        "bedrock.estimated_input_cost": round(cost_input, 6),
-        "bedrock.estimated_output_cost": round(cost_output, 6),
-        "bedrock.input_text": input_text,
-        "bedrock.output_text": output_text,
-    }
\ No newline at end of file
+        "bedrock.usage_source": "response" if usage else "estimate",
+        "bedrock.tokens_input": counted.input_tokens,
+        "bedrock.tokens_output": counted.output_tokens,
+        "bedrock.cache_read_tokens": counted.cache_read_tokens,
+        "bedrock.cache_write_tokens": counted.cache_write_tokens,
+        "bedrock.total_tokens": counted.total_tokens,
+        "bedrock.estimated_cost": round(costs["total"], 6),
+        "bedrock.estimated_input_cost": round(costs["input"], 6),
+        "bedrock.estimated_cache_cost": round(costs["cache"], 6),
+        "bedrock.estimated_output_cost": round(costs["output"], 6),
+    }
@@ -0,0 +1,92 @@
+"""
+Concurrent request throughput of a single worker, before and after the async
+Bedrock layer.
+
+A fake bedrock-runtime client sleeps for `--latency` seconds per call (like a
+real completion would block on the network). The "blocking" route calls it
+inline, as the routes used to; the "async" route goes through
+AsyncBedrockClient. While each batch runs, /live is probed to show whether the
+event loop is still responsive.
+
+    ENV=bench python -m benchmarks.bedrock_concurrency --requests 64 --latency 0.2
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.clients.bedrock import AsyncBedrockClient
+
+PAYLOAD = {"messages": [{"role": "user", "content": [{"type": "text", "text": "Who is Luke?"}]}]}
+ANSWER = json.dumps({"content": [{"type": "text", "text": "A Jedi."}]}).encode()
+
+
+class FakeBedrockRuntime:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def invoke_model(self, **kwargs):
+        time.sleep(self.latency)
+        return {"body": io.BytesIO(ANSWER)}
+
+
+def build_app(fake: FakeBedrockRuntime, async_client: AsyncBedrockClient) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/blocking")
+    async def blocking():
+        resp = fake.invoke_model(modelId="fake", body=json.dumps(PAYLOAD))
+        return json.loads(resp["body"].read())
+
+    @app.post("/async")
+    async def non_blocking():
+        return await async_client.invoke(PAYLOAD, model_id="fake")
+
+    @app.get("/live")
+    async def live():
+        return {"status": "ok"}
+
+    return app
+
+
+async def run_batch(client: httpx.AsyncClient, route: str, n: int):
+    async def probe_live():
+        # measured from when the probe is due, so time spent waiting for a
+        # blocked event loop counts against /live
+        due = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        await client.get("/live")
+        return time.perf_counter() - due
+
+    start = time.perf_counter()
+    probe = asyncio.create_task(probe_live())
+    await asyncio.gather(*(client.post(route) for _ in range(n)))
+    elapsed = time.perf_counter() - start
+    return elapsed, await probe
+
+
+async def main(args):
+    fake = FakeBedrockRuntime(args.latency)
+    async_client = AsyncBedrockClient(fake, max_concurrency=args.concurrency, queue_timeout=60)
+    app = build_app(fake, async_client)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{args.requests} concurrent requests, {args.latency * 1000:.0f} ms per model call, "
+              f"{args.concurrency} Bedrock slots")
+        print(f"{'route':<10} {'total_s':>8} {'req/s':>8} {'/live_ms':>9}")
+        for route in ("/blocking", "/async"):
+            elapsed, live = await run_batch(client, route, args.requests)
+            print(f"{route:<10} {elapsed:>8.2f} {args.requests / elapsed:>8.1f} {live * 1000:>9.1f}")
+    async_client.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
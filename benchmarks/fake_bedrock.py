@@ -0,0 +1,257 @@
+"""
+Local stand-in for the bedrock-runtime API, for load tests without Bedrock spend.
+
+Serves InvokeModel and InvokeModelWithResponseStream over HTTP, with streams in
+the AWS event stream encoding, so the app's boto3 client talks to it unchanged:
+
+    ENV=bench python -m benchmarks.fake_bedrock --port 8101 --latency 0.3 --token-delay 0.02
+    BEDROCK_ENDPOINT_URL=http://127.0.0.1:8101 AWS_ACCESS_KEY_ID=fake AWS_SECRET_ACCESS_KEY=fake ...
+
+Responses follow a fixed script. A request that offers tools and has no tool
+result yet gets a tool_use block for the tool matching its question; every
+other request gets a text answer of `--output-tokens` words. Which questions
+use a tool is decided by `--tool-rate` from a hash of the question, so runs
+are reproducible. `--latency` delays the response (time to first token),
+`--token-delay` paces the streamed words and `--throttle-rate` answers that
+share of requests with a ThrottlingException. GET /_stats reports call counts.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import random
+import re
+import struct
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+ANSWER = ("Luke Skywalker is a Jedi Knight from Tatooine who flew an X-wing at the Battle of Yavin "
+          "and later trained with Yoda on Dagobah").split()
+
+
+@dataclass
+class FakeBedrockConfig:
+    latency: float = 0.2
+    token_delay: float = 0.0
+    output_tokens: int = 40
+    tool_rate: float = 0.7
+    throttle_rate: float = 0.0
+    seed: int = 0
+
+
+@dataclass
+class FakeBedrockStats:
+    invocations: int = 0
+    streams: int = 0
+    throttled: int = 0
+    tool_uses: int = 0
+    models: Dict[str, int] = field(default_factory=dict)
+
+
+def encode_event(payload: bytes, headers: Dict[str, str]) -> bytes:
+    """One message in the AWS event stream encoding (string headers only)."""
+    encoded = b""
+    for name, value in headers.items():
+        name_bytes, value_bytes = name.encode(), value.encode()
+        encoded += struct.pack("!B", len(name_bytes)) + name_bytes
+        encoded += struct.pack("!BH", 7, len(value_bytes)) + value_bytes
+    total = 12 + len(encoded) + len(payload) + 4
+    prelude = struct.pack("!II", total, len(encoded))
+    prelude += struct.pack("!I", binascii.crc32(prelude))
+    message = prelude + encoded + payload
+    return message + struct.pack("!I", binascii.crc32(message))
+
+
+def encode_chunk(event: Dict[str, Any]) -> bytes:
+    payload = json.dumps({"bytes": base64.b64encode(json.dumps(event).encode()).decode()}).encode()
+    return encode_event(payload, {
+        ":event-type": "chunk",
+        ":content-type": "application/json",
+        ":message-type": "event",
+    })
+
+
+def _question(messages: List[Dict[str, Any]]) -> str:
+    for message in messages:
+        if message.get("role") != "user":
+            continue
+        content = message.get("content")
+        if isinstance(content, str):
+            return content
+        for block in content or []:
+            if block.get("type") == "text":
+                return block.get("text", "")
+    return ""
+
+
+def _has_tool_result(messages: List[Dict[str, Any]]) -> bool:
+    last = messages[-1].get("content") if messages else None
+    return isinstance(last, list) and any(b.get("type") == "tool_result" for b in last)
+
+
+def _pick_tool(tools: List[Dict[str, Any]], question: str) -> Dict[str, Any]:
+    words = re.findall(r"[a-z]+", question.lower())
+    for tool in tools:
+        # getStarships -> "starship": the tool whose resource the question mentions
+        resource = re.sub(r"^get|s$", "", tool["name"]).lower()
+        if any(word.startswith(resource) for word in words):
+            return tool
+    return tools[0]
+
+
+def _tool_input(tool: Dict[str, Any], question: str) -> Dict[str, str]:
+    properties = list(tool.get("input_schema", {}).get("properties", {}))
+    names = re.findall(r"\b[A-Z][a-z]+\b", question)
+    return {properties[0]: names[-1] if names else "Luke"} if properties else {}
+
+
+class FakeBedrock:
+    def __init__(self, config: FakeBedrockConfig):
+        self.config = config
+        self.stats = FakeBedrockStats()
+        self._random = random.Random(config.seed)
+
+    def respond(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """The scripted Anthropic message for a request payload."""
+        messages = payload.get("messages") or []
+        question = _question(messages)
+        tools = payload.get("tools") or []
+        input_tokens = len(json.dumps(payload)) // 4
+        use_tool = (tools and not _has_tool_result(messages)
+                    and zlib.crc32(question.encode()) % 1000 < self.config.tool_rate * 1000)
+        if use_tool:
+            self.stats.tool_uses += 1
+            tool = _pick_tool(tools, question)
+            content = [
+                {"type": "text", "text": "Let me look that up."},
+                {"type": "tool_use", "id": f"toolu_{self.stats.invocations}", "name": tool["name"],
+                 "input": _tool_input(tool, question)},
+            ]
+            return _message(content, "tool_use", input_tokens, 20)
+        words = [ANSWER[i % len(ANSWER)] for i in range(self.config.output_tokens)]
+        return _message([{"type": "text", "text": " ".join(words)}], "end_turn", input_tokens, len(words))
+
+    def _error(self, code: str, status: int, message: str) -> Response:
+        return JSONResponse({"message": message}, status_code=status, headers={"x-amzn-ErrorType": code})
+
+    async def _admit(self, request: Request, stream: bool):
+        """Parse the body and apply throttling; returns (payload, None) or (None, error response)."""
+        self.stats.invocations += 1
+        if stream:
+            self.stats.streams += 1
+        model_id = request.path_params["model_id"]
+        self.stats.models[model_id] = self.stats.models.get(model_id, 0) + 1
+        try:
+            payload = json.loads(await request.body())
+        except ValueError:
+            return None, self._error("ValidationException", 400, "Malformed input request")
+        if not payload.get("messages"):
+            # what the app's connection warmup sends
+            return None, self._error("ValidationException", 400, "messages: field required")
+        if self._random.random() < self.config.throttle_rate:
+            self.stats.throttled += 1
+            return None, self._error("ThrottlingException", 429, "Too many requests, please wait before trying again.")
+        return payload, None
+
+    async def invoke(self, request: Request) -> Response:
+        payload, error = await self._admit(request, stream=False)
+        if error is not None:
+            return error
+        message = self.respond(payload)
+        await asyncio.sleep(self.config.latency + self.config.token_delay * message["usage"]["output_tokens"])
+        return JSONResponse(message)
+
+    async def invoke_stream(self, request: Request) -> Response:
+        payload, error = await self._admit(request, stream=True)
+        if error is not None:
+            return error
+        message = self.respond(payload)
+
+        async def events():
+            await asyncio.sleep(self.config.latency)
+            for event in _stream_events(message):
+                if event["type"] == "content_block_delta" and self.config.token_delay:
+                    await asyncio.sleep(self.config.token_delay)
+                yield encode_chunk(event)
+
+        return StreamingResponse(events(), media_type="application/vnd.amazon.eventstream")
+
+    async def stats_route(self, request: Request) -> Response:
+        return JSONResponse(self.stats.__dict__)
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/model/{model_id:path}/invoke", self.invoke, methods=["POST"]),
+            Route("/model/{model_id:path}/invoke-with-response-stream", self.invoke_stream, methods=["POST"]),
+            Route("/_stats", self.stats_route, methods=["GET"]),
+        ])
+
+
+def _message(content: List[Dict[str, Any]], stop_reason: str, input_tokens: int, output_tokens: int) -> Dict[str, Any]:
+    return {
+        "id": "msg_fake", "type": "message", "role": "assistant", "model": "fake",
+        "content": content, "stop_reason": stop_reason, "stop_sequence": None,
+        "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+    }
+
+
+def _stream_events(message: Dict[str, Any]):
+    usage = message["usage"]
+    yield {"type": "message_start", "message": {
+        **message, "content": [], "stop_reason": None,
+        "usage": {"input_tokens": usage["input_tokens"], "output_tokens": 1},
+    }}
+    for index, block in enumerate(message["content"]):
+        if block["type"] == "text":
+            yield {"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}}
+            words = block["text"].split(" ")
+            for i, word in enumerate(words):
+                text = word if i == len(words) - 1 else word + " "
+                yield {"type": "content_block_delta", "index": index, "delta": {"type": "text_delta", "text": text}}
+        else:
+            yield {"type": "content_block_start", "index": index,
+                   "content_block": {"type": "tool_use", "id": block["id"], "name": block["name"], "input": {}}}
+            yield {"type": "content_block_delta", "index": index,
+                   "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}}
+        yield {"type": "content_block_stop", "index": index}
+    yield {"type": "message_delta", "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+           "usage": {"output_tokens": usage["output_tokens"]}}
+    yield {"type": "message_stop"}
+
+
+def add_arguments(parser: argparse.ArgumentParser, prefix: str = "") -> None:
+    parser.add_argument(f"--{prefix}latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument(f"--{prefix}token-delay", type=float, default=0.0, help="seconds between streamed words")
+    parser.add_argument(f"--{prefix}output-tokens", type=int, default=40)
+    parser.add_argument(f"--{prefix}tool-rate", type=float, default=0.7, help="share of questions answered with a tool")
+    parser.add_argument(f"--{prefix}throttle-rate", type=float, default=0.0, help="share of calls throttled")
+    parser.add_argument(f"--{prefix}seed", type=int, default=0)
+
+
+def config_from_args(args: argparse.Namespace, prefix: str = "") -> FakeBedrockConfig:
+    attr = prefix.replace("-", "_")
+    return FakeBedrockConfig(
+        latency=getattr(args, f"{attr}latency"),
+        token_delay=getattr(args, f"{attr}token_delay"),
+        output_tokens=getattr(args, f"{attr}output_tokens"),
+        tool_rate=getattr(args, f"{attr}tool_rate"),
+        throttle_rate=getattr(args, f"{attr}throttle_rate"),
+        seed=getattr(args, f"{attr}seed"),
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8101)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(FakeBedrock(config_from_args(args)).app(), host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,85 @@
+"""
+Local stand-in for SWAPI (https://swapi.dev/api/), for load tests.
+
+`/api/` lists the resources; every `/{resource}/?search=...` answers `--results` records built from the
+benchmark fixtures after `--latency` seconds; `/{resource}/{id}/` answers one.
+
+    ENV=bench python -m benchmarks.fake_swapi --port 8102 --latency 0.05
+    SW_API_BASE=http://127.0.0.1:8102/api/ SWAPI_SNAPSHOT_PATH=/nonexistent ...
+"""
+import argparse
+import asyncio
+import copy
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from benchmarks.fixtures import A_NEW_HOPE, LUKE, X_WING, search_response
+
+RECORDS = {
+    "people": LUKE,
+    "starships": X_WING,
+    "films": A_NEW_HOPE,
+    "planets": {"name": "Tatooine", "climate": "arid", "terrain": "desert", "population": "200000",
+                "residents": ["https://swapi.dev/api/people/1/"], "films": ["https://swapi.dev/api/films/1/"],
+                "url": "https://swapi.dev/api/planets/1/"},
+    "species": {"name": "Human", "classification": "mammal", "language": "Galactic Basic",
+                "people": ["https://swapi.dev/api/people/1/"], "url": "https://swapi.dev/api/species/1/"},
+    "vehicles": {"name": "Snowspeeder", "model": "t-47 airspeeder", "vehicle_class": "airspeeder",
+                 "pilots": ["https://swapi.dev/api/people/1/"], "url": "https://swapi.dev/api/vehicles/14/"},
+}
+
+
+class FakeSwapi:
+    def __init__(self, *, latency: float = 0.05, results: int = 3):
+        self.latency = latency
+        self.results = results
+        self.requests = 0
+
+    async def root(self, request: Request) -> Response:
+        return JSONResponse({resource: f"{request.base_url}api/{resource}/" for resource in RECORDS})
+
+    async def search(self, request: Request) -> Response:
+        self.requests += 1
+        resource = request.path_params["resource"]
+        if resource not in RECORDS:
+            return JSONResponse({"detail": "Not found"}, status_code=404)
+        await asyncio.sleep(self.latency)
+        data = search_response(RECORDS[resource], self.results, resource)
+        data["query"] = request.query_params.get("search", "")
+        return JSONResponse(data)
+
+    async def detail(self, request: Request) -> Response:
+        self.requests += 1
+        resource = request.path_params["resource"]
+        if resource not in RECORDS:
+            return JSONResponse({"detail": "Not found"}, status_code=404)
+        await asyncio.sleep(self.latency)
+        item = copy.deepcopy(RECORDS[resource])
+        item["url"] = f"https://swapi.dev/api/{resource}/{request.path_params['id']}/"
+        return JSONResponse(item)
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/api/", self.root),
+            Route("/api/{resource}/", self.search),
+            Route("/api/{resource}/{id:int}/", self.detail),
+        ])
+
+
+def add_arguments(parser: argparse.ArgumentParser, prefix: str = "") -> None:
+    parser.add_argument(f"--{prefix}latency", type=float, default=0.05)
+    parser.add_argument(f"--{prefix}results", type=int, default=3)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8102)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(FakeSwapi(latency=args.latency, results=args.results).app(),
+                host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,72 @@
+"""Realistic SWAPI records and search responses shared by the benchmarks."""
+import copy
+
+LUKE = {
+    "name": "Luke Skywalker", "height": "172", "mass": "77", "hair_color": "blond", "skin_color": "fair",
+    "eye_color": "blue", "birth_year": "19BBY", "gender": "male",
+    "homeworld": "https://swapi.dev/api/planets/1/",
+    "films": ["https://swapi.dev/api/films/1/", "https://swapi.dev/api/films/2/",
+              "https://swapi.dev/api/films/3/", "https://swapi.dev/api/films/6/"],
+    "species": [],
+    "vehicles": ["https://swapi.dev/api/vehicles/14/", "https://swapi.dev/api/vehicles/30/"],
+    "starships": ["https://swapi.dev/api/starships/12/", "https://swapi.dev/api/starships/22/"],
+    "created": "2014-12-09T13:50:51.644000Z", "edited": "2014-12-20T21:17:56.891000Z",
+    "url": "https://swapi.dev/api/people/1/",
+}
+
+X_WING = {
+    "name": "X-wing", "model": "T-65 X-wing", "manufacturer": "Incom Corporation",
+    "cost_in_credits": "149999", "length": "12.5", "max_atmosphering_speed": "1050", "crew": "1",
+    "passengers": "0", "cargo_capacity": "110", "consumables": "1 week", "hyperdrive_rating": "1.0",
+    "MGLT": "100", "starship_class": "Starfighter",
+    "pilots": ["https://swapi.dev/api/people/1/", "https://swapi.dev/api/people/9/",
+               "https://swapi.dev/api/people/18/", "https://swapi.dev/api/people/19/"],
+    "films": ["https://swapi.dev/api/films/1/", "https://swapi.dev/api/films/2/", "https://swapi.dev/api/films/3/"],
+    "created": "2014-12-12T11:19:05.340000Z", "edited": "2014-12-20T21:23:49.886000Z",
+    "url": "https://swapi.dev/api/starships/12/",
+}
+
+A_NEW_HOPE = {
+    "title": "A New Hope", "episode_id": 4,
+    "opening_crawl": (
+        "It is a period of civil war.\r\nRebel spaceships, striking\r\nfrom a hidden base, have won\r\n"
+        "their first victory against\r\nthe evil Galactic Empire.\r\n\r\nDuring the battle, Rebel\r\n"
+        "spies managed to steal secret\r\nplans to the Empire's\r\nultimate weapon, the DEATH\r\n"
+        "STAR, an armored space\r\nstation with enough power\r\nto destroy an entire planet.\r\n\r\n"
+        "Pursued by the Empire's\r\nsinister agents, Princess\r\nLeia races home aboard her\r\n"
+        "starship, custodian of the\r\nstolen plans that can save her\r\npeople and restore\r\n"
+        "freedom to the galaxy...."
+    ),
+    "director": "George Lucas", "producer": "Gary Kurtz, Rick McCallum", "release_date": "1977-05-25",
+    "characters": [f"https://swapi.dev/api/people/{i}/" for i in range(1, 19)],
+    "planets": ["https://swapi.dev/api/planets/1/", "https://swapi.dev/api/planets/2/", "https://swapi.dev/api/planets/3/"],
+    "starships": [f"https://swapi.dev/api/starships/{i}/" for i in (2, 3, 5, 9, 10, 11, 12, 13)],
+    "vehicles": [f"https://swapi.dev/api/vehicles/{i}/" for i in (4, 6, 7, 8)],
+    "species": [f"https://swapi.dev/api/species/{i}/" for i in range(1, 6)],
+    "created": "2014-12-10T14:23:31.880000Z", "edited": "2014-12-20T19:49:45.256000Z",
+    "url": "https://swapi.dev/api/films/1/",
+}
+
+
+def search_response(record, n, resource):
+    results = []
+    for i in range(n):
+        item = copy.deepcopy(record)
+        key = "title" if "title" in item else "name"
+        item[key] = f"{item[key]} {i}"
+        results.append(item)
+    return {
+        "count": n, "next": None, "previous": None, "results": results,
+        "query": "sky", "resource": resource,
+    }
+
+
+def suggestions_context():
+    return {
+        "people": search_response(LUKE, 10, "people"),
+        "films": search_response(A_NEW_HOPE, 6, "films"),
+        "planets": {},
+        "species": {},
+        "vehicles": {},
+        "starships": search_response(X_WING, 4, "starships"),
+    }
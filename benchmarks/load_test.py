@@ -0,0 +1,313 @@
+"""
+Load test for /chat, /stream and /suggestions against local fakes.
+
+Starts the fake Bedrock and SWAPI servers, runs the API under uvicorn pointed
+at them, and drives each route with a closed loop of `--concurrency` clients
+(one pass per level). Reports latency percentiles, time to first token for
+SSE, throughput and Bedrock calls per request:
+
+    ENV=bench python -m benchmarks.load_test --concurrency 1,8,32 --requests 200 --json results.json
+    ENV=bench python -m benchmarks.load_test --baseline results.json   # exit 1 on regression
+
+The API process inherits the environment, so settings such as
+ADMISSION_MAX_CONCURRENT or BEDROCK_MAX_CONCURRENCY can be varied per run.
+`--target` drives an already running API instead; Bedrock calls per request
+are then read from the responses (not available for /suggestions).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+
+from benchmarks import fake_bedrock, fake_swapi
+
+ROUTES = ("chat", "stream", "suggestions")
+NAMES = ["Luke", "Leia", "Han", "Chewbacca", "Yoda", "Vader", "Obi-Wan", "Lando", "Padme", "Anakin"]
+SHIPS = ["X-wing", "Millennium Falcon", "Slave 1", "Star Destroyer", "Naboo fighter"]
+
+
+def question(i: int) -> str:
+    if i % 3 == 2:
+        return f"Which starship is the {SHIPS[i % len(SHIPS)]} and who flew it? ({i})"
+    return f"Who is {NAMES[i % len(NAMES)]}? ({i})"
+
+
+def preferences(i: int) -> Dict[str, str]:
+    return {"people": NAMES[i % len(NAMES)], "starships": SHIPS[i % len(SHIPS)], "films": "Hope"}
+
+
+@dataclass
+class Sample:
+    ok: bool
+    latency: float
+    ttft: Optional[float] = None
+    model_calls: Optional[int] = None
+
+
+@dataclass
+class Result:
+    route: str
+    concurrency: int
+    requests: int
+    errors: int
+    throughput: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    ttft_p50_ms: Optional[float] = None
+    ttft_p95_ms: Optional[float] = None
+    model_calls_per_request: Optional[float] = None
+    error_statuses: Dict[str, int] = field(default_factory=dict)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(p / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+async def call_chat(client: httpx.AsyncClient, i: int) -> Tuple[Sample, Optional[str]]:
+    start = time.perf_counter()
+    r = await client.post("/chat", json={"user_input": question(i)})
+    latency = time.perf_counter() - start
+    if r.status_code != 200:
+        return Sample(False, latency), str(r.status_code)
+    return Sample(True, latency, model_calls=r.json().get("model_calls")), None
+
+
+async def call_stream(client: httpx.AsyncClient, i: int) -> Tuple[Sample, Optional[str]]:
+    start = time.perf_counter()
+    ttft = None
+    done = None
+    async with client.stream("POST", "/stream", json={"user_input": question(i)}) as r:
+        if r.status_code != 200:
+            await r.aread()
+            return Sample(False, time.perf_counter() - start), str(r.status_code)
+        async for line in r.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if "delta" in event and ttft is None:
+                ttft = time.perf_counter() - start
+            elif "error" in event:
+                return Sample(False, time.perf_counter() - start), "stream_error"
+            elif event.get("done"):
+                done = event
+    latency = time.perf_counter() - start
+    if done is None:
+        return Sample(False, latency), "incomplete"
+    return Sample(True, latency, ttft=ttft, model_calls=done.get("model_calls")), None
+
+
+async def call_suggestions(client: httpx.AsyncClient, i: int) -> Tuple[Sample, Optional[str]]:
+    start = time.perf_counter()
+    r = await client.post("/suggestions", json=preferences(i))
+    latency = time.perf_counter() - start
+    if r.status_code != 200 or "error" in r.json():
+        return Sample(False, latency), str(r.status_code)
+    return Sample(True, latency), None
+
+
+CALLS = {"chat": call_chat, "stream": call_stream, "suggestions": call_suggestions}
+
+
+async def run_level(client: httpx.AsyncClient, route: str, concurrency: int, requests: int,
+                    offset: int) -> Tuple[float, List[Sample], Dict[str, int]]:
+    call = CALLS[route]
+    samples: List[Sample] = []
+    statuses: Dict[str, int] = {}
+    next_index = iter(range(offset, offset + requests))
+
+    async def worker():
+        for i in next_index:
+            try:
+                sample, status = await call(client, i)
+            except httpx.HTTPError as e:
+                sample, status = Sample(False, 0.0), type(e).__name__
+            samples.append(sample)
+            if status is not None:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start, samples, statuses
+
+
+def summarize(route: str, concurrency: int, elapsed: float, samples: List[Sample], statuses: Dict[str, int],
+              model_calls: Optional[int]) -> Result:
+    ok = [s for s in samples if s.ok]
+    latencies = [s.latency * 1000 for s in ok]
+    ttfts = [s.ttft * 1000 for s in ok if s.ttft is not None]
+    if model_calls is None:
+        reported = [s.model_calls for s in ok if s.model_calls is not None]
+        calls_per_request = sum(reported) / len(reported) if reported else None
+    else:
+        calls_per_request = model_calls / len(samples) if samples else None
+    return Result(
+        route=route,
+        concurrency=concurrency,
+        requests=len(samples),
+        errors=len(samples) - len(ok),
+        throughput=round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        p50_ms=round(percentile(latencies, 50), 1),
+        p95_ms=round(percentile(latencies, 95), 1),
+        p99_ms=round(percentile(latencies, 99), 1),
+        ttft_p50_ms=round(percentile(ttfts, 50), 1) if ttfts else None,
+        ttft_p95_ms=round(percentile(ttfts, 95), 1) if ttfts else None,
+        model_calls_per_request=round(calls_per_request, 2) if calls_per_request is not None else None,
+        error_statuses=statuses,
+    )
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_in_thread(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    return server
+
+
+def start_api(args, bedrock_port: int, swapi_port: int) -> Tuple[subprocess.Popen, str]:
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "BEDROCK_ENDPOINT_URL": f"http://127.0.0.1:{bedrock_port}",
+        "SW_API_BASE": f"http://127.0.0.1:{swapi_port}/api/",
+    })
+    # defaults that keep every request on the model path; the caller's environment wins
+    for name, value in {
+        "ENV": "bench",
+        "AWS_ACCESS_KEY_ID": "fake",
+        "AWS_SECRET_ACCESS_KEY": "fake",
+        "SWAPI_SNAPSHOT_PATH": "/nonexistent/swapi_snapshot.json",
+        "RESPONSE_CACHE_BACKEND": "none",
+        "READINESS_BEDROCK_CHECK": "false",
+        "RATE_LIMIT_PER_MINUTE": "0",
+    }.items():
+        env.setdefault(name, value)
+    log = open(args.app_log, "w") if args.app_log else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("API did not become ready")
+
+
+def print_results(results: List[Result], baseline: Dict[Tuple[str, int], Dict], tolerance: float) -> List[str]:
+    regressions = []
+    print(f"{'route':<12} {'conc':>5} {'reqs':>5} {'err':>4} {'req/s':>8} {'p50_ms':>8} {'p95_ms':>8} "
+          f"{'p99_ms':>8} {'ttft50':>7} {'ttft95':>7} {'calls':>6}  vs baseline")
+    for r in results:
+        def fmt(value, width):
+            return f"{value:>{width}}" if value is not None else f"{'-':>{width}}"
+
+        line = (f"{r.route:<12} {r.concurrency:>5} {r.requests:>5} {r.errors:>4} {r.throughput:>8.1f} "
+                f"{r.p50_ms:>8.1f} {r.p95_ms:>8.1f} {r.p99_ms:>8.1f} {fmt(r.ttft_p50_ms, 7)} "
+                f"{fmt(r.ttft_p95_ms, 7)} {fmt(r.model_calls_per_request, 6)}")
+        base = baseline.get((r.route, r.concurrency))
+        if base:
+            p95 = (r.p95_ms - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0.0
+            rps = (r.throughput - base["throughput"]) / base["throughput"] * 100 if base["throughput"] else 0.0
+            line += f"  p95 {p95:+.1f}%  req/s {rps:+.1f}%"
+            if p95 > tolerance or -rps > tolerance:
+                regressions.append(f"{r.route} @ {r.concurrency}")
+                line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+async def main(args) -> int:
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    bedrock = process = None
+    servers = []
+    target = args.target
+    if target is None:
+        bedrock = fake_bedrock.FakeBedrock(fake_bedrock.config_from_args(args, "bedrock-"))
+        swapi = fake_swapi.FakeSwapi(latency=args.swapi_latency, results=args.swapi_results)
+        bedrock_port, swapi_port = free_port(), free_port()
+        servers = [serve_in_thread(bedrock.app(), bedrock_port), serve_in_thread(swapi.app(), swapi_port)]
+        process, target = start_api(args, bedrock_port, swapi_port)
+
+    results: List[Result] = []
+    try:
+        limits = httpx.Limits(max_connections=max(levels) + 10, max_keepalive_connections=max(levels) + 10)
+        async with httpx.AsyncClient(base_url=target, timeout=args.timeout, limits=limits) as client:
+            await wait_ready(client)
+            offset = 0
+            for route in routes:
+                await run_level(client, route, min(4, max(levels)), args.warmup, offset)
+                offset += args.warmup
+                for concurrency in levels:
+                    calls_before = bedrock.stats.invocations if bedrock else None
+                    elapsed, samples, statuses = await run_level(client, route, concurrency, args.requests, offset)
+                    offset += args.requests
+                    model_calls = bedrock.stats.invocations - calls_before if bedrock else None
+                    results.append(summarize(route, concurrency, elapsed, samples, statuses, model_calls))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        for server in servers:
+            server.should_exit = True
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {(r["route"], r["concurrency"]): r for r in json.load(f)["results"]}
+    regressions = print_results(results, baseline, args.tolerance)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": [asdict(r) for r in results]}, f, indent=2)
+    if regressions:
+        print(f"Regressions over {args.tolerance}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per route and level")
+    parser.add_argument("--warmup", type=int, default=8, help="unmeasured requests per route")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the API")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--target", help="base URL of a running API; skips the fakes")
+    parser.add_argument("--app-log", help="write the API's logs to this file")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed p95/throughput change in percent")
+    fake_bedrock.add_arguments(parser, "bedrock-")
+    fake_swapi.add_arguments(parser, "swapi-")
+    sys.exit(asyncio.run(main(parser.parse_args())))
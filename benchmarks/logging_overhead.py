@@ -0,0 +1,113 @@
+"""
+Per-request logging overhead on the request path: the time a request spends
+inside logging calls for its usage record, payload record and access log line.
+
+"legacy" is the previous setup: prompt and completion inside every usage record,
+formatted and written to stdout synchronously. The other rows combine a
+LOG_PAYLOADS mode with the synchronous handler ("sync") or the queue-backed one
+("queue"). `--write-latency` makes every write to the sink block for that long,
+like a slow or back-pressured stdout pipe.
+
+    ENV=bench python -m benchmarks.logging_overhead --requests 2000 --write-latency 0.0002
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+import uuid
+
+from app.config import settings
+from app.logger import config as log_config
+from app.usage import RequestUsage
+from benchmarks.fixtures import suggestions_context
+
+MODEL_ID = "anthropic.claude-3-5-sonnet-20240620-v1:0"
+PROMPT = [{"role": "user", "content": [{"type": "text", "text": json.dumps(suggestions_context())}]}]
+COMPLETION = [{"type": "text", "text": "1. Who trained Luke Skywalker?\n" * 20}]
+USAGE = {"input_tokens": 4200, "output_tokens": 160}
+
+CASES = [
+    ("legacy", "off", False),
+    ("off", "off", False),
+    ("off", "off", True),
+    ("sampled 1%", "sampled", True),
+    ("truncated", "truncated", True),
+    ("hashed", "hashed", True),
+]
+
+
+class Sink:
+    """stdout stand-in: discards output, optionally blocking on every write."""
+
+    def __init__(self, write_latency: float):
+        self.write_latency = write_latency
+        self.bytes = 0
+
+    def write(self, data):
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        self.bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def one_request(logger, legacy: bool):
+    token = log_config.log_extra_data.set({
+        "request_id": str(uuid.uuid4()), "method": "POST", "path": "/suggestions", "client_ip": "127.0.0.1",
+        **log_config.get_common_attributes(),
+    })
+    try:
+        request_usage = RequestUsage()
+        request_usage.record(MODEL_ID, USAGE)
+        usage = request_usage.log_fields("suggestions")
+        if legacy:
+            usage.update({"bedrock.input_text": json.dumps(PROMPT), "bedrock.output_text": json.dumps(COMPLETION)})
+        logger.info("Bedrock usage", extra=usage)
+        if not legacy:
+            log_config.log_payload("suggestions", PROMPT, COMPLETION)
+        logger.info("Request completed successfully", extra={"status_code": 200, "duration_ms": 12.5})
+    finally:
+        log_config.log_extra_data.reset(token)
+
+
+def run(mode: str, queued: bool, legacy: bool, requests: int, write_latency: float):
+    settings.log_payloads = mode
+    settings.log_queue = queued
+    sink = Sink(write_latency)
+    stdout, sys.stdout = sys.stdout, sink
+    try:
+        log_config.setup_logging()
+        logger = logging.getLogger("bench")
+        start = time.perf_counter()
+        for _ in range(requests):
+            one_request(logger, legacy)
+        elapsed = time.perf_counter() - start
+        log_config.stop_logging()
+    finally:
+        sys.stdout = stdout
+    return elapsed / requests * 1e6, sink.bytes / requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--write-latency", type=float, default=0.0, help="seconds each stdout write blocks")
+    args = parser.parse_args()
+
+    settings.log_payload_sample_rate = 0.01
+    rows = []
+    for name, mode, queued in CASES:
+        us, out_bytes = run(mode, queued, name == "legacy", args.requests, args.write_latency)
+        rows.append((name, "queue" if queued else "sync", us, out_bytes))
+    logging.getLogger().handlers.clear()
+
+    print(f"{'payloads':<12} {'handler':<7} {'us/request':>11} {'log_B/request':>14}")
+    for name, handler, us, out_bytes in rows:
+        print(f"{name:<12} {handler:<7} {us:>11.1f} {out_bytes:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark for the per-token cost of /stream's JSON and framing work,
+against the previous stdlib implementation.
+
+Each streamed token is a Bedrock chunk that is decoded, then re-encoded as an
+SSE `data: {"delta": ...}` frame and turned into bytes for the socket. "legacy"
+is json.loads plus an f-string around json.dumps (encoded by Starlette), one
+frame per token. "current" is app.serialization for decoding and the real
+app.sse.encode_stream pipeline (queue, coalescing, frame ids), once with a
+frame per token (SSE_COALESCE_WINDOW=0) and once with the default coalescing.
+Tokens arrive back to back here, so coalescing merges them into a few frames.
+The payload row encodes one model request (the question, one tool round and its
+compacted result), once per model call.
+
+    ENV=bench python -m benchmarks.sse_overhead
+"""
+import asyncio
+import json
+import time
+import timeit
+
+from app import serialization, sse
+from app.config import settings
+from app.llm.core import assistant_blocks, build_payload, user_text, user_tool_results
+from app.tools import swapi
+from benchmarks.fixtures import LUKE, search_response
+
+TOKENS = ["Luke ", "Skywalker ", "was ", "raised ", "on ", "Tatooine", ", ", "like ", "Padmé ", "\"Ani\"", ".\n"]
+# tokens per simulated answer
+STREAM_TOKENS = 200
+
+
+def chunk(text):
+    return json.dumps({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}}).encode()
+
+
+def legacy_token(raw):
+    data = json.loads(raw)
+    return f"data: {json.dumps({'delta': data['delta']['text']})}\n\n".encode("utf-8")
+
+
+async def deltas(chunks):
+    for raw in chunks:
+        yield {"delta": serialization.loads(raw)["delta"]["text"]}
+
+
+async def encode(chunks):
+    return [frame async for frame in sse.encode_stream(deltas(chunks), sse.new_stream_id())]
+
+
+def streamed_text(frames):
+    texts = []
+    for frame in frames:
+        for line in frame.decode().splitlines():
+            if line.startswith("data: "):
+                texts.append(json.loads(line[6:])["delta"])
+    return "".join(texts)
+
+
+async def time_pipeline(chunks, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        await encode(chunks)
+    return (time.perf_counter() - start) / n / len(chunks) * 1e9
+
+
+def transcript_payload():
+    tool_use = {"type": "tool_use", "id": "toolu_1", "name": "getPeople", "input": {"people": "Luke"}}
+    result = swapi.compact_tool_result(search_response(LUKE, 5, "people"))
+    return build_payload([
+        user_text("Which starships did Luke Skywalker fly?"),
+        assistant_blocks([{"type": "text", "text": "Let me look that up."}, tool_use]),
+        user_tool_results([{"type": "tool_result", "tool_use_id": "toolu_1", "content": result}]),
+    ])
+
+
+def main():
+    # frames are not kept for Last-Event-ID resume; that happens once per stream, off the write path
+    settings.sse_resume_backend = "none"
+    chunks = [chunk(TOKENS[i % len(TOKENS)]) for i in range(STREAM_TOKENS)]
+    legacy_text = streamed_text([legacy_token(raw) for raw in chunks])
+
+    print(f"{'case':<30} {'legacy_ns':>10} {'current_ns':>10} {'speedup':>8} {'frames':>7}")
+    n = 200
+    legacy_ns = timeit.timeit(lambda: [json.loads(c) for c in chunks], number=n) / n / len(chunks) * 1e9
+    new_ns = timeit.timeit(lambda: [serialization.loads(c) for c in chunks], number=n) / n / len(chunks) * 1e9
+    print(f"{'token: decode chunk':<30} {legacy_ns:>10.0f} {new_ns:>10.0f} {legacy_ns / new_ns:>7.1f}x")
+
+    legacy_ns = timeit.timeit(lambda: [legacy_token(c) for c in chunks], number=n) / n / len(chunks) * 1e9
+    for name, window in (("token: encode_stream, no merge", 0.0), ("token: encode_stream, merged", settings.sse_coalesce_window)):
+        settings.sse_coalesce_window = window
+        frames = asyncio.run(encode(chunks))
+        assert streamed_text(frames) == legacy_text
+        new_ns = asyncio.run(time_pipeline(chunks, n))
+        print(f"{name:<30} {legacy_ns:>10.0f} {new_ns:>10.0f} {legacy_ns / new_ns:>7.1f}x {len(frames):>7}")
+
+    payload = transcript_payload()
+    m = 2000
+    legacy_ns = timeit.timeit(lambda: json.dumps(payload).encode(), number=m) / m * 1e9
+    new_ns = timeit.timeit(lambda: serialization.dumps(payload), number=m) / m * 1e9
+    size = len(serialization.dumps(payload))
+    print(f"{f'payload: encode ({size} B)':<30} {legacy_ns:>10.0f} {new_ns:>10.0f} {legacy_ns / new_ns:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
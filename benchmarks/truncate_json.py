@@ -0,0 +1,59 @@
+"""
+Micro-benchmark for app.utils.truncate_json on realistic SWAPI search responses,
+against the previous implementation (clean everything, serialize everything,
+byte-slice the result).
+
+    ENV=bench python -m benchmarks.truncate_json
+"""
+import timeit
+
+import orjson
+
+from app.utils import UNWANTED_KEYS, truncate_json
+from benchmarks.fixtures import A_NEW_HOPE, LUKE, X_WING, search_response, suggestions_context
+
+
+def legacy_truncate_json(obj, limit=3000):
+    def remove_keys_recursively(o, keys):
+        if isinstance(o, dict):
+            return {k: remove_keys_recursively(v, keys) for k, v in o.items() if k not in keys}
+        if isinstance(o, list):
+            return [remove_keys_recursively(item, keys) for item in o]
+        return o
+
+    raw = orjson.dumps(remove_keys_recursively(obj, UNWANTED_KEYS))
+    if len(raw) <= limit:
+        return raw.decode()
+    return raw[:limit].decode("utf-8", errors="ignore")
+
+
+def is_valid(text):
+    try:
+        orjson.loads(text)
+        return True
+    except orjson.JSONDecodeError:
+        return False
+
+
+CASES = [
+    ("people x1, 3 KB", search_response(LUKE, 1, "people"), 3000),
+    ("people x10, 3 KB", search_response(LUKE, 10, "people"), 3000),
+    ("films x6, 3 KB", search_response(A_NEW_HOPE, 6, "films"), 3000),
+    ("starships x10, 1 KB", search_response(X_WING, 10, "starships"), 1000),
+    ("suggestions ctx, 10 KB", suggestions_context(), 10000),
+]
+
+
+def main():
+    print(f"{'case':<24} {'legacy_us':>10} {'new_us':>8} {'legacy_B':>9} {'new_B':>6} {'legacy_valid':>13} {'new_valid':>10}")
+    for name, obj, limit in CASES:
+        n = 2000
+        legacy_us = timeit.timeit(lambda: legacy_truncate_json(obj, limit), number=n) / n * 1e6
+        new_us = timeit.timeit(lambda: truncate_json(obj, limit), number=n) / n * 1e6
+        legacy_out, new_out = legacy_truncate_json(obj, limit), truncate_json(obj, limit)
+        print(f"{name:<24} {legacy_us:>10.1f} {new_us:>8.1f} {len(legacy_out):>9} {len(new_out):>6} "
+              f"{str(is_valid(legacy_out)):>13} {str(is_valid(new_out)):>10}")
+
+
+if __name__ == "__main__":
+    main()
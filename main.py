@@ -1,18 +1,53 @@
-import logging, time, uuid
+import asyncio, logging, time, uuid
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 
 from app.routes.chat import router as chat_router
 from app.routes.stream import router as stream_router
 from app.routes.suggestions import router as suggestions_router
 from app.routes.debug import router as listmodels_router
 from app.routes.health import router as health_router
+from app.routes.metrics import router as metrics_router
+from app import metrics, readiness
+from app.admission import AdmissionMiddleware
+from app.clients.bedrock import close_async_bedrock
+from app.config import settings
 from app.logger.config import setup_logging, log_extra_data, get_common_attributes
+from app.tools import swapi, swapi_store
+from app.tracing import Trace, request_trace, start_exporter, stop_exporter
+from app.usage import RequestUsage, request_usage
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+async def run_background(client):
+    await readiness.warmup()
+    tasks = [readiness.recheck_periodically(settings.readiness_check_interval)]
+    if settings.swapi_snapshot_refresh_seconds > 0:
+        tasks.append(swapi_store.refresh_periodically(client, settings.swapi_snapshot_refresh_seconds))
+    await asyncio.gather(*tasks)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_exporter()
+    client = await swapi.open_client()
+    # warmup runs in the background: /live answers at once, /ready once warm
+    background = asyncio.create_task(run_background(client))
+    try:
+        yield
+    finally:
+        background.cancel()
+        await swapi.close_client()
+        close_async_bedrock()
+        stop_exporter()
+        metrics.mark_worker_dead()
+
+# route return values are encoded with orjson (see app/serialization.py)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# added before the logging middleware so it runs inside it: rejections are logged too
+app.add_middleware(AdmissionMiddleware)
 
 @app.middleware("http")
 async def json_logger_middleware(request: Request, call_next):
@@ -26,27 +61,65 @@ async def json_logger_middleware(request: Request, call_next):
         "client_ip": request.client.host if request.client else "unknown",
     }
     base_log_attributes.update(get_common_attributes())
+    request.state.client_ip = base_log_attributes["client_ip"]
 
     token = log_extra_data.set(base_log_attributes)
+    usage_token = request_usage.set(RequestUsage())
+    trace = Trace.start("http.request", **{"http.method": request.method, "http.target": request.url.path})
+    trace_token = request_trace.set(trace)
+    base_log_attributes["trace_id"] = trace.root.trace_id
 
     try:
         response = await call_next(request)
-        process_time = (time.time() - start_time) * 1000  # in milliseconds
+    finally:
+        request_trace.reset(trace_token)
+        request_usage.reset(usage_token)
+        log_extra_data.reset(token)
 
-        current_log_data = log_extra_data.get()
-        current_log_data["status_code"] = response.status_code
-        current_log_data["duration_ms"] = round(process_time, 2)
-        log_extra_data.set(current_log_data)
-        
-        logger.info("Request completed successfully")
-        
-        return response
+    # call_next returns as soon as the headers are ready; a streamed body (SSE) is
+    # produced afterwards, so the request is only logged once its body has been sent
+    base_log_attributes["status_code"] = response.status_code
+    base_log_attributes["headers_ms"] = round((time.time() - start_time) * 1000, 2)
+    is_sse = response.headers.get("content-type", "").startswith("text/event-stream")
+    # route template, not the raw path, keeps metric label cardinality bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    response.body_iterator = log_when_sent(response.body_iterator, start_time, base_log_attributes, trace, is_sse, route)
+    return response
 
+async def log_when_sent(body, start_time, log_data, trace, is_sse, route):
+    first_byte_at = None
+    chunks = 0
+    completed = False
+    if is_sse:
+        metrics.sse_streams_in_flight.inc()
+    try:
+        async for chunk in body:
+            if first_byte_at is None:
+                first_byte_at = time.time()
+            chunks += 1
+            yield chunk
+        completed = True
     finally:
-        log_extra_data.reset(token)
+        end_time = time.time()
+        log_data["duration_ms"] = round((end_time - start_time) * 1000, 2)  # in milliseconds
+        log_data["ttfb_ms"] = round(((first_byte_at or end_time) - start_time) * 1000, 2)
+        log_data["response.chunks"] = chunks
+        log_data["response.completed"] = completed
+        if is_sse:
+            metrics.sse_streams_in_flight.dec()
+            log_data["stream.duration_ms"] = round((end_time - (first_byte_at or end_time)) * 1000, 2)
+        metrics.http_request_duration.labels(log_data["method"], route, log_data["status_code"]).observe(
+            end_time - start_time)
+        metrics.http_time_to_first_byte.labels(log_data["method"], route).observe(
+            (first_byte_at or end_time) - start_time)
+        trace.finish(**{"http.status_code": log_data["status_code"], "ttfb_ms": log_data["ttfb_ms"],
+                        "response.completed": completed})
+
+        logger.info("Request completed successfully", extra=log_data)
 
 app.include_router(chat_router, tags=["chat"])
 app.include_router(stream_router, tags=["stream"])
 app.include_router(suggestions_router, tags=["suggestions"])
 app.include_router(listmodels_router, tags=["list"])
 app.include_router(health_router, tags=["health"])
+app.include_router(metrics_router, tags=["metrics"])
@@ -0,0 +1,4 @@
+import os
+
+# app.config.Settings requires ENV
+os.environ.setdefault("ENV", "test")
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+
+from app import admission
+from app.admission import AdmissionController, AdmissionRejected, RateLimiter, client_keys, rate_limited
+from app.config import settings
+
+
+def scope(ip="10.0.0.1", api_key=None):
+    headers = [(b"x-api-key", api_key.encode())] if api_key else []
+    return {"type": "http", "client": (ip, 1234), "headers": headers}
+
+
+# ---------- AdmissionController ----------
+
+def test_released_slots_go_to_waiters_in_arrival_order():
+    async def run():
+        controller = AdmissionController(max_active=1, max_queue=10, queue_timeout=5)
+        await controller.acquire()
+        order = []
+
+        async def waiter(name):
+            await controller.acquire()
+            order.append(name)
+
+        tasks = []
+        for name in ("a", "b", "c"):
+            tasks.append(asyncio.create_task(waiter(name)))
+            await asyncio.sleep(0)
+        assert controller.waiting == 3
+        for _ in range(3):
+            controller.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "c"]
+        assert controller.active == 1
+
+    asyncio.run(run())
+
+
+def test_full_queue_is_rejected():
+    async def run():
+        controller = AdmissionController(max_active=1, max_queue=1, queue_timeout=5)
+        await controller.acquire()
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as e:
+            await controller.acquire()
+        assert e.value.reason == "queue_full"
+        assert e.value.retry_after == settings.admission_retry_after
+        controller.release()
+        await queued
+
+    asyncio.run(run())
+
+
+def test_queue_timeout_is_rejected_and_leaves_the_queue():
+    async def run():
+        controller = AdmissionController(max_active=1, max_queue=5, queue_timeout=0.01)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected) as e:
+            await controller.acquire()
+        assert e.value.reason == "queue_timeout"
+        assert controller.waiting == 0
+        controller.release()
+        assert controller.active == 0
+
+    asyncio.run(run())
+
+
+def test_over_limit_request_gets_503_with_retry_after(monkeypatch):
+    async def run():
+        controller = AdmissionController(max_active=1, max_queue=0, queue_timeout=1)
+        monkeypatch.setattr(admission, "controller", controller)
+        monkeypatch.setattr(admission, "limiter", None)
+        await controller.acquire()
+        sent = []
+
+        async def app(scope, receive, send):
+            raise AssertionError("over-limit request reached the app")
+
+        async def send(message):
+            sent.append(message)
+
+        middleware = admission.AdmissionMiddleware(app)
+        await middleware({**scope(), "path": "/chat", "method": "POST"}, None, send)
+        start = sent[0]
+        assert start["status"] == 503
+        assert (b"retry-after", b"1") in start["headers"]
+
+    asyncio.run(run())
+
+
+# ---------- RateLimiter ----------
+
+def test_key_header_is_limited_together_with_the_ip(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_key_header", "X-API-Key")
+    assert client_keys(scope()) == ["ip:10.0.0.1"]
+    keys = client_keys(scope(api_key="k1"))
+    assert keys[0] == "ip:10.0.0.1" and keys[1].startswith("key:")
+
+    limiter = RateLimiter(rate=1 / 60, burst=2)
+    # rotating keys doesn't get around the IP's bucket
+    assert limiter.take(client_keys(scope(api_key="k1"))) == 0
+    assert limiter.take(client_keys(scope(api_key="k2"))) == 0
+    assert limiter.take(client_keys(scope(api_key="k3"))) > 0
+    # and one key is limited across IPs
+    assert limiter.take(client_keys(scope(ip="10.0.0.2", api_key="k1"))) == 0
+    assert limiter.take(client_keys(scope(ip="10.0.0.3", api_key="k1"))) > 0
+
+
+def test_rejected_request_takes_no_token_from_any_bucket():
+    limiter = RateLimiter(rate=1 / 60, burst=1)
+    assert limiter.take(["ip:a"]) == 0
+    # ip:a is empty, so key:b keeps its token
+    assert limiter.take(["ip:a", "key:b"]) > 0
+    assert limiter.take(["key:b"]) == 0
+
+
+def test_batch_cost_leaves_the_buckets_in_debt():
+    limiter = RateLimiter(rate=1.0, burst=5)
+    # one token is enough to let a batch in
+    assert limiter.take(["ip:a"], cost=10) == 0
+    # 5 - 10 = -5 tokens: the next request waits for 6 more at 1/s
+    assert limiter.take(["ip:a"]) == pytest.approx(6, abs=0.05)
+
+
+def test_batch_surcharge_gets_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_key_header", "")
+    monkeypatch.setattr(admission, "limiter", RateLimiter(rate=0.5, burst=2))
+    assert rate_limited(scope(), 0) is None
+    assert rate_limited(scope(), 3) is None  # 2 - 3 = -1 tokens
+    response = rate_limited(scope(), 1)
+    assert response.status_code == 429
+    # (1 - -1) tokens at 0.5/s
+    assert response.headers["Retry-After"] == "4"
+
+
+def test_least_recently_seen_keys_are_evicted():
+    limiter = RateLimiter(rate=1 / 60, burst=1, max_keys=2)
+    limiter.take(["ip:a"])
+    limiter.take(["ip:b"])
+    limiter.take(["ip:c"])
+    # ip:a was evicted and starts over with a full bucket
+    assert limiter.take(["ip:a"]) == 0
+    assert limiter.take(["ip:c"]) > 0
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import time
+
+from app.clients.bedrock import AsyncBedrockClient
+from app.config import settings
+
+
+class SlowStreamBody:
+    def __init__(self):
+        self.closed = False
+
+    def __iter__(self):
+        chunk = {"type": "message_stop"}
+        yield {"chunk": {"bytes": json.dumps(chunk).encode()}}
+
+    def close(self):
+        self.closed = True
+
+
+class SlowStreamClient:
+    """bedrock-runtime stand-in whose streams take longer to open than the hedge delay."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = []
+
+    def invoke_model_with_response_stream(self, *, modelId, **kwargs):
+        self.calls.append(modelId)
+        time.sleep(self.delay)
+        return {"body": SlowStreamBody()}
+
+
+def test_denied_hedge_releases_half_open_trial(monkeypatch):
+    monkeypatch.setattr(settings, "bedrock_hedge_after", 0.02)
+
+    async def run():
+        fake = SlowStreamClient(delay=0.1)
+        client = AsyncBedrockClient(fake, max_concurrency=4, queue_timeout=1.0)
+        try:
+            primary, fallback = client.endpoints("primary-model", ["fallback-model"])
+            # the fallback's circuit has waited out its reset: the next allow() takes the trial
+            fallback.breaker.opened_at = time.monotonic() - fallback.breaker.reset_timeout - 1
+            assert fallback.breaker.state == "half_open"
+            # no budget left for a hedge
+            client.budget.min_per_second = 0
+            client.budget._tokens = 0
+
+            events = [e async for e in client.stream({}, model_id="primary-model",
+                                                     fallback_model_ids=["fallback-model"])]
+        finally:
+            client.shutdown()
+        assert events == [{"type": "message_stop"}]
+        assert fake.calls == ["primary-model"]
+        assert client.in_flight == 0
+        # the trial slot is free for the next call
+        assert fallback.breaker.allow()
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+from app.llm.sessions import TRUNCATED_MARKER, _tokens, compact, split_turns
+
+
+def turn(n, result_chars=2000):
+    """One question with a tool round and its answer."""
+    return [
+        {"role": "user", "content": [{"type": "text", "text": f"Question {n}?"}]},
+        {"role": "assistant", "content": [
+            {"type": "text", "text": "Let me check."},
+            {"type": "tool_use", "id": f"toolu_{n}", "name": "getPeople", "input": {"people": "Luke"}},
+        ]},
+        {"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": f"toolu_{n}", "content": "x" * result_chars},
+        ]},
+        {"role": "assistant", "content": [{"type": "text", "text": f"Answer {n}."}]},
+    ]
+
+
+def answers(messages):
+    return [b["text"] for m in messages if m["role"] == "assistant" for b in m["content"]
+            if b.get("type") == "text" and b["text"].startswith("Answer")]
+
+
+def tool_results(messages):
+    return [b["content"] for m in messages for b in m["content"] if b.get("type") == "tool_result"]
+
+
+def test_transcript_within_budget_is_unchanged():
+    messages = turn(1) + turn(2)
+    compacted, stats = compact(messages, 10_000, tool_result_chars=100)
+    assert compacted is messages
+    assert "session.dropped_turns" not in stats
+
+
+def test_tool_results_shrink_before_turns_are_dropped():
+    messages = turn(1) + turn(2) + turn(3)
+    budget = _tokens(messages) - 200
+    compacted, stats = compact(messages, budget, tool_result_chars=100)
+    assert stats["session.dropped_turns"] == 0
+    assert len(split_turns(compacted)) == 3
+    # older turns' results are cut, the newest turn's is not needed to fit
+    results = tool_results(compacted)
+    assert results[0] == "x" * 100 + TRUNCATED_MARKER
+    assert results[1] == "x" * 100 + TRUNCATED_MARKER
+    assert results[2] == "x" * 2000
+    assert answers(compacted) == ["Answer 1.", "Answer 2.", "Answer 3."]
+    assert _tokens(compacted) <= budget
+    # the caller's transcript is not modified
+    assert tool_results(messages) == ["x" * 2000] * 3
+
+
+def test_oldest_turns_are_dropped_once_shrinking_is_not_enough():
+    messages = turn(1) + turn(2) + turn(3)
+    shrunk_turn, _ = compact(turn(1), 1, tool_result_chars=100)
+    # room for two shrunk turns, not three
+    compacted, stats = compact(messages, 2 * _tokens(shrunk_turn) + 5, tool_result_chars=100)
+    assert stats["session.dropped_turns"] == 1
+    # whole turns go: the transcript starts with a question and every tool_use keeps its result
+    assert compacted[0]["content"][0]["text"].startswith("Question")
+    uses = [b["id"] for m in compacted for b in m["content"] if b.get("type") == "tool_use"]
+    results = [b["tool_use_id"] for m in compacted for b in m["content"] if b.get("type") == "tool_result"]
+    assert uses == results
+    assert answers(compacted) == ["Answer 2.", "Answer 3."]
+
+
+def test_newest_turn_is_always_kept():
+    messages = turn(1) + turn(2)
+    compacted, stats = compact(messages, 1, tool_result_chars=10)
+    assert split_turns(compacted) == [compacted]
+    assert answers(compacted) == ["Answer 2."]
+    assert tool_results(compacted) == ["x" * 10 + TRUNCATED_MARKER]
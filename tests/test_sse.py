@@ -0,0 +1,158 @@
+import asyncio
+import json
+
+import pytest
+
+from app import sse
+from app.cache import create_backend
+from app.config import settings
+
+
+@pytest.fixture(autouse=True)
+def sse_settings(monkeypatch):
+    monkeypatch.setattr(settings, "sse_coalesce_window", 10.0)
+    monkeypatch.setattr(settings, "sse_coalesce_bytes", 1024)
+    monkeypatch.setattr(settings, "sse_heartbeat_interval", 0)
+    monkeypatch.setattr(sse, "_log", create_backend("memory", url="", maxsize=10, ttl=60, prefix=""))
+
+
+async def events(*items, pause=0.0):
+    for item in items:
+        if pause:
+            await asyncio.sleep(pause)
+        yield item
+
+
+def parse(frame: bytes):
+    """(id, data) of a frame; data is None for a comment."""
+    event_id = data = None
+    for line in frame.decode().splitlines():
+        if line.startswith("id: "):
+            event_id = line[4:]
+        elif line.startswith("data: "):
+            data = json.loads(line[6:])
+    return event_id, data
+
+
+async def collect(source, stream_id="s1"):
+    frames = [frame async for frame in sse.encode_stream(source, stream_id)]
+    await asyncio.gather(*sse._pending_saves)
+    return frames
+
+
+def test_first_delta_is_sent_alone_and_later_ones_are_merged():
+    async def run():
+        source = events({"delta": "Luke "}, {"delta": "Sky"}, {"delta": "walker"},
+                        {"tool_event": {"used": False}}, {"delta": "."}, {"done": True})
+        return [parse(f) for f in await collect(source)]
+
+    frames = asyncio.run(run())
+    assert frames == [
+        ("s1:1", {"delta": "Luke "}),
+        # any other event flushes the buffered deltas first, so the order is kept
+        ("s1:2", {"delta": "Skywalker"}),
+        ("s1:3", {"tool_event": {"used": False}}),
+        ("s1:4", {"delta": "."}),
+        ("s1:5", {"done": True}),
+    ]
+
+
+def test_merged_deltas_are_flushed_at_the_byte_limit(monkeypatch):
+    # counted in UTF-8 bytes: "é" is two
+    monkeypatch.setattr(settings, "sse_coalesce_bytes", 4)
+
+    async def run():
+        source = events({"delta": "a"}, {"delta": "é"}, {"delta": "é"}, {"delta": "b"}, {"delta": "c"})
+        return [parse(f)[1] for f in await collect(source)]
+
+    assert asyncio.run(run()) == [{"delta": "a"}, {"delta": "éé"}, {"delta": "bc"}]
+
+
+def test_merged_deltas_are_flushed_when_the_window_expires(monkeypatch):
+    monkeypatch.setattr(settings, "sse_coalesce_window", 0.01)
+
+    async def run():
+        source = events({"delta": "a"}, {"delta": "b"}, {"delta": "c"}, pause=0.05)
+        return [parse(f)[1] for f in await collect(source)]
+
+    assert asyncio.run(run()) == [{"delta": "a"}, {"delta": "b"}, {"delta": "c"}]
+
+
+def test_zero_window_sends_every_delta(monkeypatch):
+    monkeypatch.setattr(settings, "sse_coalesce_window", 0)
+
+    async def run():
+        return [parse(f)[1] for f in await collect(events({"delta": "a"}, {"delta": "b"}))]
+
+    assert asyncio.run(run()) == [{"delta": "a"}, {"delta": "b"}]
+
+
+def test_heartbeat_is_sent_while_no_event_arrives(monkeypatch):
+    monkeypatch.setattr(settings, "sse_heartbeat_interval", 0.02)
+
+    async def run():
+        async def slow():
+            yield {"tool_event": {"used": True}}
+            await asyncio.sleep(0.09)
+            yield {"done": True}
+
+        return await collect(slow())
+
+    frames = asyncio.run(run())
+    assert frames[0].startswith(b"id: s1:1\n")
+    assert frames[-1].startswith(b"id: s1:2\n")
+    pings = frames[1:-1]
+    assert 2 <= len(pings) <= 4
+    assert all(f == sse.HEARTBEAT for f in pings)
+
+
+def test_source_error_ends_the_stream_and_closes_the_source():
+    closed = []
+
+    async def run():
+        async def failing():
+            try:
+                yield {"delta": "a"}
+                raise RuntimeError("boom")
+            finally:
+                closed.append(True)
+
+        with pytest.raises(RuntimeError):
+            await collect(failing())
+
+    asyncio.run(run())
+    assert closed == [True]
+
+
+def test_resume_replays_the_frames_after_last_event_id():
+    async def run():
+        source = events({"delta": "a"}, {"tool_event": {"used": False}}, {"delta": "b"}, {"done": True})
+        original = await collect(source, "abc")
+        replay = [f async for f in sse.resume_stream("abc:2")]
+        return original, replay
+
+    original, replay = asyncio.run(run())
+    # the same bytes, ids included
+    assert replay == original[2:]
+    assert parse(replay[0])[0] == "abc:3"
+
+
+def test_resume_of_an_interrupted_stream_ends_with_an_error():
+    async def run():
+        gen = sse.encode_stream(events({"delta": "a"}, {"delta": "b"}, {"done": True}), "cut")
+        first = await anext(gen)
+        await gen.aclose()
+        await asyncio.gather(*sse._pending_saves)
+        replay = [f async for f in sse.resume_stream("cut:0")]
+        return first, replay
+
+    first, replay = asyncio.run(run())
+    assert replay[0] == first
+    assert parse(replay[-1]) == (None, {"error": "The stream was interrupted before it finished, ask again"})
+
+
+def test_resume_of_an_unknown_stream_is_an_error():
+    async def run():
+        return [parse(f) async for f in sse.resume_stream("nope:3")]
+
+    assert asyncio.run(run()) == [(None, {"error": "Unknown or expired stream, ask again"})]
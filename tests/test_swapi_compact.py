@@ -0,0 +1,53 @@
+from app.tools import swapi, swapi_store
+from app.tools.swapi_store import SwapiStore
+
+LUKE = {
+    "name": "Luke Skywalker",
+    "height": "172",
+    "hair_color": "blond",
+    "homeworld": "https://swapi.dev/api/planets/1/",
+    "films": ["https://swapi.dev/api/films/1/", "https://swapi.dev/api/films/2/"],
+    "species": [],
+    "vehicles": [],
+    "starships": ["https://swapi.dev/api/starships/12/"],
+    "created": "2014-12-09T13:50:51.644000Z",
+    "url": "https://swapi.dev/api/people/1/",
+}
+
+
+def test_references_become_short_ids_without_a_snapshot(monkeypatch):
+    monkeypatch.setattr(swapi_store, "_store", None)
+    swapi.search_cache.clear()
+    record = swapi.compact_record(LUKE, "people")
+    assert record["homeworld"] == "planets/1"
+    assert record["films"] == ["films/1", "films/2"]
+    assert record["starships"] == ["starships/12"]
+    assert "species" not in record and "created" not in record
+
+
+def test_references_are_named_from_the_swapi_cache(monkeypatch):
+    monkeypatch.setattr(swapi_store, "_store", None)
+    swapi.search_cache.clear()
+    swapi.search_cache.set(("record", "https://swapi.dev/api/planets/1/"), {"name": "Tatooine"})
+    try:
+        record = swapi.compact_record(LUKE, "people")
+    finally:
+        swapi.search_cache.clear()
+    assert record["homeworld"] == "Tatooine"
+    assert record["films"] == ["films/1", "films/2"]
+
+
+def test_references_are_named_from_the_snapshot(monkeypatch):
+    store = SwapiStore({
+        "planets": [{"name": "Tatooine", "url": "https://swapi.dev/api/planets/1/"}],
+        "films": [
+            {"title": "A New Hope", "url": "https://swapi.dev/api/films/1/"},
+            {"title": "The Empire Strikes Back", "url": "https://swapi.dev/api/films/2/"},
+        ],
+    })
+    monkeypatch.setattr(swapi_store, "_store", store)
+    record = swapi.compact_record(LUKE, "people")
+    assert record["homeworld"] == "Tatooine"
+    assert record["films"] == ["A New Hope", "The Empire Strikes Back"]
+    # not in the snapshot: kept as an id
+    assert record["starships"] == ["starships/12"]
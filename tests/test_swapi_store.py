@@ -0,0 +1,67 @@
+import pytest
+
+from app.tools.swapi_store import SEARCH_FIELDS, SwapiStore
+
+RECORDS = {
+    "people": [
+        {"name": "Luke Skywalker", "url": "https://swapi.dev/api/people/1/"},
+        {"name": "C-3PO", "url": "https://swapi.dev/api/people/2/"},
+        {"name": "R2-D2", "url": "https://swapi.dev/api/people/3/"},
+        {"name": "Darth Vader", "url": "https://swapi.dev/api/people/4/"},
+        {"name": "Anakin Skywalker", "url": "https://swapi.dev/api/people/11/"},
+        {"name": "Shmi Skywalker", "url": "https://swapi.dev/api/people/43/"},
+        {"name": "Padmé Amidala", "url": "https://swapi.dev/api/people/35/"},
+    ],
+    "starships": [
+        {"name": "X-wing", "model": "T-65 X-wing", "url": "https://swapi.dev/api/starships/12/"},
+        {"name": "Millennium Falcon", "model": "YT-1300 light freighter", "url": "https://swapi.dev/api/starships/10/"},
+        {"name": "Death Star", "model": "DS-1 Orbital Battle Station", "url": "https://swapi.dev/api/starships/9/"},
+    ],
+    "films": [
+        {"title": "A New Hope", "url": "https://swapi.dev/api/films/1/"},
+        {"title": "The Empire Strikes Back", "url": "https://swapi.dev/api/films/2/"},
+    ],
+}
+
+QUERIES = [
+    "luke", "LUKE", "  Luke  ", "sky", "walker", "kywa", "e s", "luke sky", "skywalker luke",
+    "c-3", "-", "3po", "r2", "2-d", "d2", "x-wing", "wing", "t-65", "65 x", "yt-1300",
+    "falcon", "light freighter", "battle station", "star", "ds-1", "padm", "padmé", "é",
+    "a", "the", "new hope", "empire strikes", "yoda", "zz", "lukes", "!",
+]
+
+
+def swapi_search(resource, query):
+    """SWAPI ?search=: case-insensitive substring of the resource's search fields."""
+    needle = query.strip().lower()
+    return [item for item in RECORDS[resource]
+            if needle in " ".join(str(item.get(f) or "") for f in SEARCH_FIELDS[resource]).lower()]
+
+
+@pytest.fixture(scope="module")
+def store():
+    return SwapiStore(RECORDS)
+
+
+@pytest.mark.parametrize("resource", sorted(RECORDS))
+@pytest.mark.parametrize("query", QUERIES)
+def test_search_matches_swapi_substring_semantics(store, resource, query):
+    assert store.search(resource, query) == swapi_search(resource, query)
+
+
+def test_empty_query_lists_every_record(store):
+    assert store.search("people", "") == RECORDS["people"]
+    assert store.search("people", "   ") == RECORDS["people"]
+
+
+def test_search_response_has_the_swapi_shape(store):
+    response = store.search_response("people", "skywalker")
+    assert response["count"] == 3
+    assert response["next"] is None and response["previous"] is None
+    assert [p["name"] for p in response["results"]] == ["Luke Skywalker", "Anakin Skywalker", "Shmi Skywalker"]
+
+
+def test_records_are_found_by_url(store):
+    assert store.get("https://swapi.dev/api/starships/10/")["name"] == "Millennium Falcon"
+    assert store.get("https://swapi.dev/api/starships/99/") is None
+    assert not store.has("planets")
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from app.utils import truncate_json
+
+LUKE = {
+    "name": "Luke Skywalker",
+    "height": "172",
+    "mass": "77",
+    "homeworld": "https://swapi.dev/api/planets/1/",
+    "films": [f"https://swapi.dev/api/films/{i}/" for i in range(1, 5)],
+    "starships": ["https://swapi.dev/api/starships/12/", "https://swapi.dev/api/starships/22/"],
+    "created": "2014-12-09T13:50:51.644000Z",
+    "edited": "2014-12-20T21:17:56.891000Z",
+    "url": "https://swapi.dev/api/people/1/",
+}
+
+SEARCH = {
+    "count": 3,
+    "resource": "people",
+    "results": [dict(LUKE, name=f"Luke {i}", skin_color="fair" * i, extra="dropped") for i in range(3)],
+}
+
+PAYLOADS = [
+    SEARCH,
+    {"people": SEARCH, "planets": {"count": 0, "results": []}, "note": "naïve \"quoted\" text ✓"},
+    [LUKE, [1, 2.5, None, True], {"nested": {"deeper": ["x" * 40]}}],
+    {},
+    [],
+]
+
+
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_output_is_valid_json_within_the_limit(payload):
+    full = len(truncate_json(payload, limit=10**6).encode())
+    for limit in range(0, full + 10):
+        out = truncate_json(payload, limit=limit)
+        json.loads(out)
+        assert len(out.encode()) <= max(limit, 2)
+
+
+def test_unwanted_keys_and_unlisted_fields_are_dropped():
+    out = json.loads(truncate_json(SEARCH, limit=10**6))
+    record = out["results"][0]
+    assert "created" not in record and "url" not in record
+    assert "extra" not in record and record["skin_color"] == ""
+    assert out["count"] == 3
+
+
+def test_tiny_limits_give_empty_containers():
+    assert truncate_json(SEARCH, limit=0) == "{}"
+    assert truncate_json([1, 2], limit=1) == "[]"
+    assert truncate_json("a long string", limit=4) == "null"